@@ -1,7 +1,7 @@
 # app/backup_manager.py
 import os
-import shutil
 import logging
+import sqlite3
 from datetime import datetime
 from app import config
 
@@ -25,7 +25,17 @@ def create_backup():
     backup_path = os.path.join(BACKUP_DIR, backup_name)
 
     try:
-        shutil.copy2(DB_FILE, backup_path)
+        # Backup API invece della copia del file: in modalità WAL le ultime
+        # transazioni possono trovarsi ancora nel file -wal.
+        source = sqlite3.connect(DB_FILE)
+        try:
+            dest = sqlite3.connect(backup_path)
+            try:
+                source.backup(dest)
+            finally:
+                dest.close()
+        finally:
+            source.close()
         logging.info(f"Backup creato: {backup_path}")
         _rotate_old_backups()
     except Exception:
@@ -51,8 +61,13 @@ def _rotate_old_backups():
 
 def restore_from_backup(backup_path):
     """Ripristina il database da un file di backup, sovrascrivendo quello corrente."""
+    import database
     try:
-        shutil.copy2(backup_path, DB_FILE)
+        # Le connessioni persistenti devono rilasciare il file prima della sovrascrittura;
+        # la copia avviene con la backup API per restare coerente con il journal WAL.
+        database.close_all_connections()
+        database.copy_database_file(backup_path, DB_FILE)
+        database.invalidate_profiles_cache()
         logging.warning(f"Database ripristinato con successo dal file: {backup_path}")
         return True
     except Exception:
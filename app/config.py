@@ -74,6 +74,68 @@ def load_update_url():
 UPDATE_URL = load_update_url()
 # --- FINE AGGIUNTA PER UPDATER ---
 
+def load_sync_settings():
+    """Legge da config.ini i parametri della sincronizzazione automatica in background."""
+    settings = {
+        'auto_sync': True,
+        'interval_minutes': 10,
+        'debounce_seconds': 20,
+        'max_backoff_minutes': 60,
+    }
+    parser = configparser.ConfigParser()
+    if os.path.exists(CONFIG_INI_PATH):
+        parser.read(CONFIG_INI_PATH)
+        settings['auto_sync'] = parser.getboolean('sync', 'auto_sync', fallback=settings['auto_sync'])
+        for key in ('interval_minutes', 'debounce_seconds', 'max_backoff_minutes'):
+            settings[key] = parser.getint('sync', key, fallback=settings[key])
+    return settings
+
+SYNC_SETTINGS = load_sync_settings()
+
+def load_database_settings():
+    """Legge da config.ini il profilo di archiviazione SQLite (journal, cache, mmap)."""
+    settings = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size_mb': 32,
+        'mmap_size_mb': 128,
+        'busy_timeout_ms': 5000,
+        # Strumentazione delle query (app/query_profiler.py), disattivata di norma
+        'profile_queries': False,
+        'slow_query_ms': 100,
+    }
+    parser = configparser.ConfigParser()
+    if os.path.exists(CONFIG_INI_PATH):
+        parser.read(CONFIG_INI_PATH)
+        for key in ('journal_mode', 'synchronous'):
+            settings[key] = parser.get('database', key, fallback=settings[key]).strip().upper()
+        for key in ('cache_size_mb', 'mmap_size_mb', 'busy_timeout_ms', 'slow_query_ms'):
+            settings[key] = parser.getint('database', key, fallback=settings[key])
+        settings['profile_queries'] = parser.getboolean('database', 'profile_queries',
+                                                        fallback=settings['profile_queries'])
+    return settings
+
+DATABASE_SETTINGS = load_database_settings()
+
+def load_maintenance_settings():
+    """Legge da config.ini i parametri della manutenzione automatica del database locale."""
+    settings = {
+        'enabled': True,
+        'idle_minutes': 5,
+        'interval_hours': 24,
+        'tombstone_retention_days': 30,
+        'vacuum_max_pages': 0,
+    }
+    parser = configparser.ConfigParser()
+    if os.path.exists(CONFIG_INI_PATH):
+        parser.read(CONFIG_INI_PATH)
+        settings['enabled'] = parser.getboolean('maintenance', 'enabled', fallback=settings['enabled'])
+        for key in ('idle_minutes', 'interval_hours', 'tombstone_retention_days', 'vacuum_max_pages'):
+            settings[key] = parser.getint('maintenance', key, fallback=settings[key])
+    return settings
+
+MAINTENANCE_SETTINGS = load_maintenance_settings()
+
 MODERN_STYLESHEET = """
     QDialog, QMainWindow {
         background-color: #f8fafc;
@@ -0,0 +1,115 @@
+# app/maintenance_manager.py
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import database
+from app import config, sync_manager
+
+# Passi della manutenzione, nell'ordine di esecuzione: prima si eliminano i
+# record, poi si aggiornano le statistiche e infine si recupera lo spazio liberato.
+MAINTENANCE_TASKS = ("purge", "optimize", "vacuum")
+
+
+def _next_due_time(settings, tasks):
+    """Momento in cui il primo dei passi torna dovuto (None se uno non è mai riuscito)."""
+    interval = timedelta(hours=max(0, settings['interval_hours']))
+    next_due = None
+    for task in tasks:
+        last_run = database.get_last_maintenance_time(task)
+        try:
+            last_run_dt = datetime.fromisoformat(last_run) if last_run else None
+        except ValueError:
+            last_run_dt = None
+        if last_run_dt is None:
+            return None
+        if last_run_dt.tzinfo is None:
+            last_run_dt = last_run_dt.replace(tzinfo=timezone.utc)
+        if next_due is None or last_run_dt + interval < next_due:
+            next_due = last_run_dt + interval
+    return next_due
+
+
+def is_maintenance_due(settings=None, tasks=MAINTENANCE_TASKS) -> bool:
+    """
+    True se almeno un passo non è riuscito nelle ultime 'interval_hours' ore
+    (es. manutenzione interrotta dalla ripresa dell'attività).
+    """
+    return seconds_until_maintenance_due(settings, tasks) == 0
+
+
+def seconds_until_maintenance_due(settings=None, tasks=MAINTENANCE_TASKS) -> float:
+    """Secondi mancanti alla prossima manutenzione dovuta (0 se è già dovuta)."""
+    settings = settings or config.MAINTENANCE_SETTINGS
+    next_due = _next_due_time(settings, tasks)
+    if next_due is None:
+        return 0
+    return max(0.0, (next_due - datetime.now(timezone.utc)).total_seconds())
+
+
+def _purge(settings):
+    # La sincronizzazione non deve girare mentre si eliminano i record già inviati
+    if sync_manager.is_sync_locked():
+        raise RuntimeError("Sincronizzazione in corso: eliminazione dei record cancellati rinviata.")
+    sync_manager.lock_sync()
+    try:
+        purged = database.purge_acknowledged_tombstones(settings['tombstone_retention_days'])
+    finally:
+        sync_manager.unlock_sync()
+    return sum(purged.values()), {table: count for table, count in purged.items() if count}
+
+
+def _optimize(settings):
+    return 0, {"operation": database.optimize_database()}
+
+
+def _vacuum(settings):
+    result = database.reclaim_free_pages(settings['vacuum_max_pages'])
+    return 0, {"mode": result["mode"], "freelist_before": result["before"]["freelist_count"],
+               "freelist_after": result["after"]["freelist_count"]}
+
+
+_TASK_FUNCTIONS = {"purge": _purge, "optimize": _optimize, "vacuum": _vacuum}
+
+
+def run_maintenance(tasks=MAINTENANCE_TASKS, settings=None, should_stop=None) -> list:
+    """
+    Esegue i passi di manutenzione indicati e registra ognuno in maintenance_log
+    con durata, righe eliminate e pagine del file prima e dopo.
+    'should_stop' (funzione senza argomenti) viene controllata tra un passo e
+    l'altro: se restituisce True i passi rimanenti vengono rinviati.
+    Un passo fallito viene registrato e non interrompe i successivi.
+    Restituisce l'elenco dei record registrati.
+    """
+    settings = settings or config.MAINTENANCE_SETTINGS
+    run_id = str(uuid.uuid4())
+    records = []
+    for task in tasks:
+        if should_stop is not None and should_stop():
+            logging.info("Manutenzione del database interrotta: l'applicazione non è più inattiva.")
+            break
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        pages_before = database.get_database_page_stats()["page_count"]
+        start = time.perf_counter()
+        record = {"run_id": run_id, "task": task, "started_at": started_at}
+        try:
+            rows_affected, details = _TASK_FUNCTIONS[task](settings)
+            record.update(status="ok", rows_affected=rows_affected, details_json=details)
+        except Exception as e:
+            logging.error(f"Errore nel passo di manutenzione '{task}'.", exc_info=True)
+            record.update(status="error", message=str(e))
+        record["duration_ms"] = int((time.perf_counter() - start) * 1000)
+        record["pages_before"] = pages_before
+        record["pages_after"] = database.get_database_page_stats()["page_count"]
+        record["pages_freed"] = max(0, pages_before - record["pages_after"])
+
+        try:
+            database.add_maintenance_log(record)
+        except Exception:
+            logging.error("Impossibile registrare il passo di manutenzione.", exc_info=True)
+        logging.info(f"Manutenzione '{task}': {record['status']} in {record['duration_ms']} ms, "
+                     f"{record.get('rows_affected', 0)} righe, {record['pages_freed']} pagine liberate.")
+        records.append(record)
+    return records
@@ -0,0 +1,159 @@
+# app/maintenance_scheduler.py
+import logging
+from PySide6.QtCore import QEvent, QObject, QThread, QTimer, Signal
+from PySide6.QtWidgets import QApplication
+
+import database
+from app import config, maintenance_manager, sync_manager
+from app.workers.maintenance_worker import MaintenanceWorker
+
+# Eventi che indicano che l'utente sta usando l'applicazione
+_USER_ACTIVITY_EVENTS = frozenset((QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.Wheel))
+
+
+class MaintenanceScheduler(QObject):
+    """
+    Avvia la manutenzione del database locale (eliminazione dei record
+    cancellati già inviati al server, statistiche, recupero dello spazio)
+    quando l'applicazione è inattiva:
+    - nessun input dell'utente e nessuna scrittura sul database da
+      'idle_minutes' minuti;
+    - nessun test, caricamento o sincronizzazione in corso;
+    - almeno 'interval_hours' ore dall'ultima manutenzione riuscita.
+
+    Alla ripresa dell'attività la manutenzione in corso si ferma al termine
+    del passo corrente.
+    """
+    maintenance_finished = Signal(list)
+    # Segnale interno: inoltra le notifiche del database (da qualsiasi thread) al thread della UI
+    _local_change = Signal(object)
+
+    def __init__(self, is_busy, parent=None, settings=None):
+        """
+        Args:
+            is_busy: funzione senza argomenti che restituisce True quando
+                     la manutenzione non deve partire (es. test in corso).
+        """
+        super().__init__(parent)
+        self.settings = settings or config.MAINTENANCE_SETTINGS
+        self.enabled = self.settings['enabled']
+        self.idle_ms = max(1, self.settings['idle_minutes']) * 60 * 1000
+        self.is_busy = is_busy
+        self.worker_thread = None
+        self.worker = None
+
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.timeout.connect(self.trigger_maintenance)
+
+        self._local_change.connect(self._on_activity)
+
+    # --- Ciclo di vita ---
+
+    def start(self):
+        """Avvia il rilevamento dell'inattività."""
+        if not self.enabled:
+            logging.info("Manutenzione automatica del database disabilitata da config.ini.")
+            return
+        database.add_change_listener(self._emit_local_change)
+        app = QApplication.instance()
+        if app is not None:
+            app.installEventFilter(self)
+        self.idle_timer.start(self.idle_ms)
+
+    def stop(self):
+        """Ferma il timer e chiede al worker in corso di fermarsi."""
+        database.remove_change_listener(self._emit_local_change)
+        app = QApplication.instance()
+        if app is not None:
+            app.removeEventFilter(self)
+        self.idle_timer.stop()
+        if self.worker is not None:
+            self.worker.stop()
+
+    def shutdown(self, timeout_ms=5000):
+        """
+        Ferma il rilevamento e attende la fine della manutenzione in corso al
+        massimo 'timeout_ms': oltre, la query in corso viene interrotta, così la
+        chiusura dell'applicazione non resta bloccata su un passo lungo.
+        """
+        self.stop()
+        thread = self.worker_thread
+        if thread is None:
+            return
+        # Il quit accodato dai segnali del worker non verrebbe consegnato
+        # mentre il thread della UI è fermo qui ad attendere
+        thread.quit()
+        if not thread.wait(timeout_ms):
+            logging.warning("Manutenzione del database ancora in corso alla chiusura: interruzione.")
+            database.interrupt_all_connections()
+            thread.wait()
+
+    def is_running(self):
+        """True se una manutenzione è in corso."""
+        return self.worker is not None
+
+    # --- Rilevamento dell'attività ---
+
+    def eventFilter(self, watched, event):
+        if event.type() in _USER_ACTIVITY_EVENTS:
+            self._on_activity()
+        return False
+
+    def _emit_local_change(self, tables):
+        # Chiamato dal thread che ha eseguito il commit
+        self._local_change.emit(tables)
+
+    def _on_activity(self, _tables=None):
+        # Le scritture della manutenzione stessa non contano come attività
+        if self.worker is not None:
+            if _tables is None:
+                self.worker.stop()
+            return
+        self.idle_timer.start(self.idle_ms)
+
+    # --- Esecuzione ---
+
+    def trigger_maintenance(self):
+        """Avvia la manutenzione se è dovuta e l'applicazione è libera."""
+        if self.is_running():
+            return
+        if self.is_busy() or sync_manager.is_sync_locked():
+            self.idle_timer.start(self.idle_ms)
+            return
+        wait_seconds = maintenance_manager.seconds_until_maintenance_due(self.settings)
+        if wait_seconds > 0:
+            # Non ancora dovuta: se l'applicazione resta inattiva si ricontrolla
+            # alla scadenza (un input dell'utente riavvia comunque il timer).
+            # QTimer accetta al massimo 2^31 - 1 ms.
+            self.idle_timer.start(min(max(self.idle_ms, int(wait_seconds * 1000) + 1000), 2**31 - 1))
+            return
+
+        self.worker_thread = QThread()
+        self.worker = MaintenanceWorker()
+        self.worker.moveToThread(self.worker_thread)
+
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.finished.connect(self._on_worker_finished)
+        self.worker.error.connect(self._on_worker_error)
+        for signal in (self.worker.finished, self.worker.error):
+            signal.connect(self.worker_thread.quit)
+            signal.connect(self.worker.deleteLater)
+        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
+
+        logging.info("Avvio manutenzione del database locale (applicazione inattiva).")
+        self.worker_thread.start()
+
+    def _finish(self):
+        self.worker = None
+        self.worker_thread = None
+        if self.enabled:
+            self.idle_timer.start(self.idle_ms)
+
+    def _on_worker_finished(self, records):
+        self._finish()
+        self.maintenance_finished.emit(records)
+
+    def _on_worker_error(self, message):
+        logging.warning(f"Manutenzione del database non riuscita: {message}")
+        self._finish()
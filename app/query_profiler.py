@@ -0,0 +1,327 @@
+# app/query_profiler.py
+"""
+Strumentazione opzionale delle query SQLite (profile_queries = true nella
+sezione [database] di config.ini).
+
+Le connessioni del pool vengono aperte con ProfilingConnection: ogni cursore
+misura il tempo di esecuzione di uno statement, compresa la lettura delle
+righe, e lo registra raggruppato per funzione DAO chiamante e per
+"impronta" SQL (lo statement con i valori letterali sostituiti da '?').
+Le query oltre la soglia 'slow_query_ms' vengono scritte nel log (impronta
+e numero di parametri, mai i valori) insieme al loro EXPLAIN QUERY PLAN;
+write_report() produce un riepilogo con gli istogrammi delle latenze accanto
+al file di log.
+
+Con la strumentazione disattivata le connessioni sono quelle standard di
+sqlite3 e non c'è alcun costo aggiuntivo.
+"""
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from app import config
+
+# Limiti superiori (ms) delle classi degli istogrammi; l'ultima classe è aperta
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_THIS_FILE = os.path.normcase(os.path.abspath(__file__))
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_NAMED_PARAM_RE = re.compile(r"[:@$]\w+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE_RE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def fingerprint(sql: str) -> str:
+    """Normalizza uno statement: spazi compattati, letterali e liste IN ridotti a segnaposto."""
+    text = _STRING_LITERAL_RE.sub("?", sql)
+    text = _NUMBER_LITERAL_RE.sub("?", text)
+    text = _NAMED_PARAM_RE.sub("?", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip().rstrip(";")
+    return _PLACEHOLDER_LIST_RE.sub("(...)", text)
+
+
+class _LatencyStats:
+    """Conteggio, tempo totale e massimo e istogramma delle latenze di un gruppo."""
+    __slots__ = ("count", "total_ms", "max_ms", "slow_count", "buckets", "examples")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow_count = 0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.examples = set()
+
+    def add(self, elapsed_ms, slow, example):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.slow_count += slow
+        for index, bound in enumerate(HISTOGRAM_BOUNDS_MS):
+            if elapsed_ms < bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        if len(self.examples) < 5:
+            self.examples.add(example)
+
+
+_stats_lock = threading.Lock()
+_by_caller = {}
+_by_fingerprint = {}
+_profiling_started = datetime.now()
+
+
+def _find_caller():
+    """
+    Funzione a cui attribuire la query: la prima funzione pubblica di
+    database.py sopra il cursore (i suoi helper privati e il gestore di
+    contesto vengono saltati) oppure, per le query eseguite fuori dalla DAO,
+    la funzione che ha usato direttamente la connessione.
+    """
+    frame = sys._getframe(2)
+    first = None
+    while frame is not None:
+        code = frame.f_code
+        if os.path.normcase(os.path.abspath(code.co_filename)) != _THIS_FILE:
+            module = frame.f_globals.get("__name__", "?")
+            name = f"{module}.{code.co_name}"
+            if first is None:
+                first = name
+            if module != "database":
+                return first
+            if not code.co_name.startswith("_"):
+                return name
+        frame = frame.f_back
+    return first or "?"
+
+
+def _record(connection, sql, params, elapsed_ms, caller):
+    slow_threshold = config.DATABASE_SETTINGS['slow_query_ms']
+    slow = elapsed_ms >= slow_threshold
+    key = fingerprint(sql)
+    with _stats_lock:
+        _by_caller.setdefault(caller, _LatencyStats()).add(elapsed_ms, slow, key)
+        _by_fingerprint.setdefault(key, _LatencyStats()).add(elapsed_ms, slow, caller)
+    if slow:
+        # Solo impronta e numero di parametri: i valori (nomi dei clienti,
+        # matricole, inventari) non devono finire nel log dell'applicazione
+        logging.warning(f"Query lenta ({elapsed_ms:.1f} ms) in {caller}: {key} "
+                        f"| {_describe_params(params)}{_query_plan(connection, sql, params)}")
+
+
+def _describe_params(params):
+    if isinstance(params, str):
+        # "<executemany>" / "<script>"
+        return params
+    try:
+        return f"{len(params)} parametri"
+    except TypeError:
+        return "parametri non conteggiabili"
+
+
+def _query_plan(connection, sql, params):
+    if not _EXPLAINABLE_RE.match(sql):
+        return ""
+    try:
+        # Cursore standard: l'EXPLAIN non deve essere a sua volta misurato
+        cursor = sqlite3.Cursor(connection)
+        try:
+            rows = cursor.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        finally:
+            cursor.close()
+    except sqlite3.Error as e:
+        return f"\n    (piano non disponibile: {e})"
+    return "".join(f"\n    - {row[3]}" for row in rows)
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """
+    Cursore che misura ogni statement dall'esecuzione alla lettura dell'ultima
+    riga. La misura si chiude quando le righe sono esaurite, al successivo
+    execute, alla chiusura del cursore o quando il cursore viene rilasciato.
+    """
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._pending = None  # [sql, params, tempo accumulato in s, chiamante]
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._pending = [sql, params, 0.0, _find_caller()]
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        except sqlite3.Error:
+            # Statement fallito: non viene conteggiato
+            self._pending = None
+            raise
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, params, elapsed, caller = pending
+            _record(self.connection, sql, params, elapsed * 1000, caller)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:
+            # Statement senza righe da leggere: la misura è completa
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, "<executemany>")
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._begin(sql_script, "<script>")
+        self._timed(super().executescript, sql_script)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connessione i cui cursori (anche quelli di conn.execute) sono ProfilingCursor."""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def is_enabled() -> bool:
+    return bool(config.DATABASE_SETTINGS['profile_queries'])
+
+
+def reset():
+    """Azzera le statistiche raccolte."""
+    global _profiling_started
+    with _stats_lock:
+        _by_caller.clear()
+        _by_fingerprint.clear()
+        _profiling_started = datetime.now()
+
+
+def get_stats() -> dict:
+    """
+    Statistiche raccolte: {'by_caller': {...}, 'by_fingerprint': {...}}, dove ogni
+    gruppo riporta count, total_ms, avg_ms, max_ms, slow_count e histogram
+    (conteggi per le classi di HISTOGRAM_BOUNDS_MS, più quella aperta finale).
+    """
+    def export(groups):
+        return {
+            name: {
+                "count": s.count,
+                "total_ms": round(s.total_ms, 3),
+                "avg_ms": round(s.total_ms / s.count, 3) if s.count else 0.0,
+                "max_ms": round(s.max_ms, 3),
+                "slow_count": s.slow_count,
+                "histogram": list(s.buckets),
+                "examples": sorted(s.examples),
+            }
+            for name, s in groups.items()
+        }
+    with _stats_lock:
+        return {"by_caller": export(_by_caller), "by_fingerprint": export(_by_fingerprint)}
+
+
+def _histogram_labels():
+    labels, lower = [], 0
+    for bound in HISTOGRAM_BOUNDS_MS:
+        labels.append(f"{lower}-{bound}")
+        lower = bound
+    labels.append(f">={lower}")
+    return labels
+
+
+def format_report(stats=None, limit=40) -> str:
+    """Riepilogo testuale: funzioni DAO e impronte SQL ordinate per tempo totale."""
+    stats = stats or get_stats()
+    labels = _histogram_labels()
+    lines = [
+        "Profilo delle query SQLite",
+        f"Raccolto dal {_profiling_started:%Y-%m-%d %H:%M:%S} al {datetime.now():%Y-%m-%d %H:%M:%S}, "
+        f"soglia query lente {config.DATABASE_SETTINGS['slow_query_ms']} ms",
+        f"Classi degli istogrammi (ms): {' | '.join(labels)}",
+    ]
+    for title, key in (("PER FUNZIONE CHIAMANTE", "by_caller"), ("PER IMPRONTA SQL", "by_fingerprint")):
+        groups = sorted(stats[key].items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]
+        lines += ["", f"=== {title} ===", ""]
+        for name, s in groups:
+            lines.append(f"{s['total_ms']:>10.1f} ms totali  {s['count']:>7} chiamate  "
+                         f"media {s['avg_ms']:.2f} ms  max {s['max_ms']:.1f} ms  lente {s['slow_count']}")
+            lines.append(f"    {name}")
+            lines.append(f"    istogramma: {' '.join(str(n) for n in s['histogram'])}")
+            for example in s["examples"]:
+                lines.append(f"      · {example[:200]}")
+    return "\n".join(lines) + "\n"
+
+
+def write_report(path=None) -> str:
+    """Scrive il riepilogo nella cartella dei log e restituisce il percorso del file."""
+    if path is None:
+        os.makedirs(config.LOG_DIR, exist_ok=True)
+        path = os.path.join(config.LOG_DIR, f"query_profile_{datetime.now():%Y-%m-%d_%H%M%S}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(format_report())
+    logging.info(f"Profilo delle query salvato in {path}")
+    return path
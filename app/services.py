@@ -1,6 +1,9 @@
 # app/services.py (Versione completa per la sincronizzazione)
 import logging
 import json
+import copy
+import functools
+import threading
 from datetime import datetime, timezone
 import uuid
 
@@ -18,6 +21,87 @@ from app import auth_manager
 from app import config
 
 
+# ==============================================================================
+# CACHE DEI RISULTATI DI LETTURA
+# ==============================================================================
+# Alcune letture (elenchi per i menu a tendina, statistiche, strumenti) vengono
+# ripetute di continuo e restituiscono lo stesso risultato finché nessuno
+# scrive. I risultati restano in cache, per funzione e argomenti, e vengono
+# scartati quando cambia una delle tabelle da cui dipendono:
+# - scritture delle DAO e della sincronizzazione: listener delle modifiche
+#   di database.py, per tabella;
+# - scritture di altri processi e sostituzione del file:
+#   database.has_external_changes (PRAGMA data_version), che svuota l'intera
+#   cache.
+
+_query_cache = {}
+_query_cache_lock = threading.Lock()
+_query_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+# Incrementato a ogni invalidazione: un risultato letto prima di una scrittura
+# concorrente non viene salvato.
+_query_cache_generation = 0
+
+def invalidate_query_cache(tables=None):
+    """Scarta i risultati che dipendono da 'tables' (tutti se None)."""
+    global _query_cache_generation
+    with _query_cache_lock:
+        if tables is None:
+            stale_keys = list(_query_cache)
+        else:
+            stale_keys = [key for key, (dependencies, _) in _query_cache.items() if dependencies & tables]
+        for key in stale_keys:
+            del _query_cache[key]
+        _query_cache_generation += 1
+        _query_cache_stats["invalidations"] += len(stale_keys)
+
+def _invalidate_query_cache_on_change(tables):
+    invalidate_query_cache(frozenset(tables))
+
+database.add_change_listener(_invalidate_query_cache_on_change)
+
+def _check_query_cache_data_version():
+    """Svuota la cache se il database è cambiato fuori dalle DAO di questo processo."""
+    if database.has_external_changes():
+        invalidate_query_cache()
+
+def get_query_cache_stats() -> dict:
+    """Contatori della cache delle letture (successi, mancati, invalidazioni, voci)."""
+    with _query_cache_lock:
+        stats = dict(_query_cache_stats)
+        stats["entries"] = len(_query_cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+def _cached_query(*tables):
+    """
+    Decoratore per letture in sola lettura il cui risultato dipende solo dagli
+    argomenti e dal contenuto di 'tables' (incluse le tabelle che aggiornano
+    quelle lette tramite trigger). Restituisce sempre una copia del risultato.
+    """
+    dependencies = frozenset(tables)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            _check_query_cache_data_version()
+            with _query_cache_lock:
+                entry = _query_cache.get(key)
+                if entry is not None:
+                    _query_cache_stats["hits"] += 1
+                    return copy.copy(entry[1])
+                _query_cache_stats["misses"] += 1
+                generation = _query_cache_generation
+
+            result = func(*args, **kwargs)
+            with _query_cache_lock:
+                if generation == _query_cache_generation:
+                    _query_cache[key] = (dependencies, result)
+            return copy.copy(result)
+        return wrapper
+    return decorator
+
 
 # ==============================================================================
 # SERVIZI PER CLIENTI
@@ -76,15 +160,16 @@ def delete_customer(cust_id: int) -> tuple[bool, str]:
 # --- Wrapper di lettura per coerenza architetturale ---
 def get_all_customers(search_query=None):
     with database.DatabaseConnection() as conn:
-        if search_query:
+        expression = database.fts_match_expression(search_query) if search_query else None
+        if expression:
+            # Ricerca per prefisso su nome e indirizzo tramite l'indice full-text
             query = """
                 SELECT id, name, address, phone, email
                 FROM customers 
-                WHERE name LIKE ? OR address LIKE ?
+                WHERE id IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?)
                 ORDER BY name
             """
-            search_pattern = f"%{search_query}%"
-            return conn.execute(query, (search_pattern, search_pattern)).fetchall()
+            return conn.execute(query, (expression,)).fetchall()
         else:
             query = """
                 SELECT id, name, address, phone, email
@@ -96,9 +181,6 @@ def get_all_customers(search_query=None):
 def get_customer_by_id(customer_id):
     return database.get_customer_by_id(customer_id)
 
-def get_device_count_for_customer(customer_id):
-    return database.get_device_count_for_customer(customer_id)
-
 # ==============================================================================
 # SERVIZI PER DISPOSITIVI
 # ==============================================================================
@@ -136,6 +218,38 @@ def add_device(destination_id, serial, desc, mfg, model, department, applied_par
         default_profile_key, timestamp
     )
 
+def bulk_add_devices(devices: list) -> list:
+    """
+    Aggiunge un blocco di dispositivi in un'unica transazione.
+    Ogni elemento è un dict con gli argomenti di add_device (destination_id,
+    serial, desc, mfg, model, department, applied_parts, customer_inv, ams_inv,
+    verification_interval, default_profile_key).
+
+    Returns:
+        Lista allineata a 'devices' di tuple (esito, messaggio): esito 'added',
+        'reactivated' o 'skipped'; il messaggio spiega lo scarto.
+    """
+    results = [None] * len(devices)
+    valid_records, valid_positions = [], []
+    for position, device in enumerate(devices):
+        if not device.get('destination_id'):
+            results[position] = ('skipped', "Destinazione mancante.")
+            continue
+        if not device.get('desc'):
+            results[position] = ('skipped', "Descrizione mancante.")
+            continue
+        record = dict(device)
+        record['serial'] = normalize_serial(device.get('serial'))
+        record['uuid'] = str(uuid.uuid4())
+        valid_records.append(record)
+        valid_positions.append(position)
+
+    if valid_records:
+        timestamp = datetime.now(timezone.utc).isoformat()
+        for position, result in zip(valid_positions, database.bulk_add_devices(valid_records, timestamp)):
+            results[position] = result
+    return results
+
 def update_device(
     dev_id, destination_id, serial, desc, mfg, model, department,
     applied_parts, customer_inv, ams_inv, verification_interval, 
@@ -211,13 +325,27 @@ def get_customer_devices_for_inventory_export(customer_id: int):
 def get_devices_for_customer(customer_id, search_query=None):
     return database.get_devices_for_customer(customer_id, search_query)
 
+def get_devices_page_for_customer(customer_id, cursor=None, page_size=database.DEFAULT_PAGE_SIZE,
+                                  sort="description", search_query=None):
+    """Pagina di dispositivi di un cliente: (righe, cursore della pagina successiva o None)."""
+    return database.get_devices_page_for_customer(customer_id, cursor, page_size, sort, search_query)
+
+def get_device_count_for_customer(customer_id, search_query=None):
+    return database.get_device_count_for_customer(customer_id, search_query)
+
 def get_device_by_id(device_id):
     return database.get_device_by_id(device_id)
     
+@_cached_query("devices")
 def get_all_unique_device_descriptions():
     """Recupera tutte le descrizioni uniche dei dispositivi."""
     return database.get_all_unique_device_descriptions()
 
+@_cached_query("destinations", "customers")
+def get_all_destinations_with_customer():
+    """Recupera tutte le destinazioni attive con il nome del cliente."""
+    return database.get_all_destinations_with_customer()
+
 def get_devices_by_description(description: str):
     """Recupera i dispositivi che corrispondono a una data descrizione."""
     return database.get_devices_by_description(description)
@@ -232,8 +360,12 @@ def correct_device_description(old_description: str, new_description: str) -> in
 def search_device_globally(search_term):
     return database.search_device_globally(search_term)
 
-def get_devices_needing_verification(days_in_future=30):
-    return database.get_devices_needing_verification(days_in_future)
+def get_devices_needing_verification(days_in_future=30, limit=None):
+    return database.get_devices_needing_verification(days_in_future, limit)
+
+def get_dashboard_summary(days_in_future=30):
+    """Contatori e scadenze del pannello di controllo (non in cache: dipendono dalla data odierna)."""
+    return database.get_dashboard_summary(days_in_future)
 
 def advanced_search(criteria: dict):
     """
@@ -312,8 +444,9 @@ def generate_pdf_report(filename, verification_id, device_id, report_settings):
         raise ValueError(f"Cliente ID {customer_id} non trovato.")
     customer_info = dict(customer_info_row)
 
-    verifications = database.get_verifications_for_device(device_id)
-    verification = next((v for v in verifications if v.get('id') == verification_id), None)
+    verification = database.get_verification_by_id(verification_id)
+    if verification and verification.get('device_id') != device_id:
+        verification = None
     
     if not verification:
         raise ValueError(f"Dati di verifica mancanti per la verifica ID {verification_id}")
@@ -378,20 +511,41 @@ def get_verifications_for_customer_by_month(customer_id: int, year: int, month:
 def get_verifications_for_device(device_id: int, search_query: str = None):
     return database.get_verifications_for_device(device_id, search_query)
 
+def search_measurements(test_name: str, min_value: float = None, max_value: float = None,
+                        model: str = None, device_id: int = None, passed: bool = None) -> list:
+    return database.search_measurements(test_name, min_value, max_value, model, device_id, passed)
+
+def get_measurements_for_device(device_id: int, test_name: str = None) -> list:
+    return database.get_measurements_for_device(device_id, test_name)
+
+def get_verifications_page_for_device(device_id: int, cursor: str = None, page_size: int = database.DEFAULT_PAGE_SIZE,
+                                      search_query: str = None, include_json: bool = True):
+    """Pagina dello storico verifiche: (verifiche, cursore della pagina successiva o None)."""
+    return database.get_verifications_page_for_device(device_id, cursor, page_size, search_query=search_query,
+                                                      include_json=include_json)
+
+def get_verification_by_id(verification_id: int):
+    return database.get_verification_by_id(verification_id)
+
+def get_verification_count_for_device(device_id: int, search_query: str = None) -> int:
+    return database.get_verification_count_for_device(device_id, search_query)
+
 # ==============================================================================
 # SERVIZI PER IMPORT / EXPORT
 # ==============================================================================
 
-def process_device_import_row(row_data: dict, mapping: dict, destination_id: int):
-    serial_number = row_data.get(mapping.get('matricola'))
-    
+def build_device_import_record(row_data: dict, mapping: dict, destination_id: int) -> dict:
+    """
+    Converte una riga del file di importazione negli argomenti di add_device /
+    bulk_add_devices. Solleva ValueError se la riga non è importabile.
+    """
     description = row_data.get(mapping.get('descrizione'))
     if not description:
         raise ValueError("Descrizione mancante.")
     profile_key = (row_data.get(mapping.get('profilo')) or "IEC 62353 Metodo Diretto - Classe 1") if mapping.get('profilo') else None
-    add_device(
+    return dict(
         destination_id=destination_id,
-        serial=serial_number,
+        serial=row_data.get(mapping.get('matricola')),
         desc=description,
         mfg=row_data.get(mapping.get('costruttore'), ''),
         model=row_data.get(mapping.get('modello'), ''),
@@ -403,6 +557,9 @@ def process_device_import_row(row_data: dict, mapping: dict, destination_id: int
         default_profile_key=profile_key
     )
 
+def process_device_import_row(row_data: dict, mapping: dict, destination_id: int):
+    add_device(**build_device_import_record(row_data, mapping, destination_id))
+
 # --- NUOVA FUNZIONE PER LA RICERCA GLOBALE ---
 def search_globally(search_term: str) -> list:
     """
@@ -412,7 +569,8 @@ def search_globally(search_term: str) -> list:
     if not search_term or len(search_term) < 3:
         return []
     
-    customers = database.get_all_customers(search_term)
+    # Entrambe le ricerche usano gli indici full-text e restituiscono prima i risultati più pertinenti
+    customers = database.search_customers_globally(search_term)
     devices = database.search_device_globally(search_term)
     
     # Converti i risultati in dizionari e combinali
@@ -425,6 +583,7 @@ def search_globally(search_term: str) -> list:
 # SERVIZI PER STRUMENTI E IMPOSTAZIONI
 # ==============================================================================
 
+@_cached_query("mti_instruments")
 def get_all_instruments():
     return database.get_all_instruments()
 
@@ -450,6 +609,7 @@ def set_default_instrument(inst_id: int):
     timestamp = datetime.now(timezone.utc)
     database.set_default_instrument(inst_id, timestamp)
 
+@_cached_query("devices", "customers", "verifications")
 def get_stats():
     return database.get_stats()
 
@@ -487,6 +647,7 @@ def delete_profile(profile_id):
     timestamp = datetime.now(timezone.utc).isoformat()
     database.delete_profile(profile_id, timestamp)
 
+@_cached_query("devices")
 def get_unique_manufacturers():
     """Recupera tutti i costruttori unici dal database."""
     with database.DatabaseConnection() as conn:
@@ -500,6 +661,7 @@ def get_unique_manufacturers():
         """
         return conn.execute(query).fetchall()
 
+@_cached_query("devices")
 def get_unique_models():
     """Recupera tutti i modelli unici dal database."""
     with database.DatabaseConnection() as conn:
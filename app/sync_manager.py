@@ -6,10 +6,14 @@ from datetime import datetime, timezone, date
 import database
 import sqlite3
 import base64
+import gzip
+import hashlib
 import os
+import shutil
+import time
 from PySide6.QtWidgets  import QMessageBox
 
-from app import auth_manager, config
+from app import auth_manager, config, backup_manager
 LOCK_FILE = config.LOCK_FILE_DIR
 SYNC_ORDER = ["customers", "mti_instruments", "signatures", "profiles", "profile_tests", "destinations", "devices", "verifications"]
 
@@ -48,8 +52,113 @@ def _jsonify_value(v):
 def _jsonify_record(rec: dict) -> dict:
     return {k: _jsonify_value(v) for k, v in rec.items()}
 
-def _get_unsynced_local_changes():
-    """Recupera tutte le modifiche locali non sincronizzate in modo più compatto."""
+class SyncProgress:
+    """
+    Raccoglie i tempi delle fasi di una sincronizzazione ed emette eventi di
+    avanzamento strutturati verso una callback opzionale.
+
+    Ogni evento è un dizionario con: phase (collect, upload, server, download,
+    apply, reconcile), table, rows_done, rows_total, bytes_done, bytes_total,
+    rows_per_sec ed elapsed (secondi dall'inizio della fase).
+    """
+    PHASES = ("collect", "upload", "server", "download", "apply", "reconcile")
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.started_at = datetime.now(timezone.utc)
+        self.phase_durations = {}
+        self.current_phase = None
+        self.phase_start = None
+        self.rows_uploaded = 0
+        self.rows_downloaded = 0
+        self.bytes_uploaded = 0
+        self.bytes_downloaded = 0
+
+    def start_phase(self, phase):
+        self._close_phase()
+        self.current_phase = phase
+        self.phase_start = time.perf_counter()
+        self.report()
+
+    def _close_phase(self):
+        if self.current_phase is not None:
+            elapsed = time.perf_counter() - self.phase_start
+            self.phase_durations[self.current_phase] = round(
+                self.phase_durations.get(self.current_phase, 0.0) + elapsed, 3)
+        self.current_phase = None
+
+    def finish(self):
+        self._close_phase()
+
+    def report(self, table=None, rows_done=0, rows_total=0, bytes_done=0, bytes_total=0):
+        if self.callback is None or self.current_phase is None:
+            return
+        elapsed = time.perf_counter() - self.phase_start
+        event = {
+            "phase": self.current_phase,
+            "table": table,
+            "rows_done": rows_done,
+            "rows_total": rows_total,
+            "bytes_done": bytes_done,
+            "bytes_total": bytes_total,
+            "rows_per_sec": round(rows_done / elapsed, 1) if elapsed > 0 and rows_done else 0.0,
+            "elapsed": round(elapsed, 3),
+        }
+        try:
+            self.callback(event)
+        except Exception:
+            logging.warning("Errore nella callback di avanzamento della sincronizzazione.", exc_info=True)
+
+    def to_record(self, full_sync, status, message):
+        """Record di temporizzazione da salvare nella cronologia locale delle sincronizzazioni."""
+        self._close_phase()
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "full_sync": 1 if full_sync else 0,
+            "status": status,
+            "rows_uploaded": self.rows_uploaded,
+            "rows_downloaded": self.rows_downloaded,
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_downloaded": self.bytes_downloaded,
+            "phase_timings_json": json.dumps(self.phase_durations),
+            "message": message if isinstance(message, str) else None,
+        }
+
+
+class _UploadReader:
+    """Corpo della richiesta letto a blocchi, per misurare i byte inviati."""
+    def __init__(self, body: bytes, progress: SyncProgress):
+        self.body = body
+        self.offset = 0
+        self.progress = progress
+
+    def __len__(self):
+        return len(self.body)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.body) - self.offset
+        chunk = self.body[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        self.progress.bytes_uploaded = self.offset
+        self.progress.report(rows_done=self.progress.rows_uploaded, rows_total=self.progress.rows_uploaded,
+                             bytes_done=self.offset, bytes_total=len(self.body))
+        return chunk
+
+
+def _local_pk_column(table):
+    """Chiave primaria locale della tabella (signatures usa lo username)."""
+    return 'username' if table == 'signatures' else 'id'
+
+def _get_unsynced_local_changes(progress=None):
+    """
+    Recupera tutte le modifiche locali non sincronizzate in modo più compatto.
+
+    Restituisce (changes, pushed_versions): pushed_versions mappa ogni tabella
+    in {chiave_primaria_locale: last_modified} dei record inseriti nel payload,
+    così da confermare al termine solo quelle esatte versioni.
+    """
     
     # Definiamo le query e le trasformazioni per ogni tabella in una struttura dati
     TABLE_SYNC_CONFIG = {
@@ -76,42 +185,74 @@ def _get_unsynced_local_changes():
     }
 
     changes = {}
+    pushed_versions = {}
     with database.DatabaseConnection() as conn:
         conn.row_factory = sqlite3.Row
         
         for table, (query, cols_to_pop) in TABLE_SYNC_CONFIG.items():
             # Il nome della tabella viene inserito nella query se necessario
             final_query = query.format(table=table)
+            pk_column = _local_pk_column(table)
             
             rows = conn.execute(final_query).fetchall()
             records_list = []
+            versions = {}
             for row in rows:
                 record_dict = dict(row)
+                versions[record_dict.get(pk_column)] = record_dict.get('last_modified')
                 record_dict.pop('id', None) # Rimuoviamo sempre l'ID locale
 
-                # Rimuoviamo le chiavi esterne (FK) numeriche
-                for col in cols_to_pop:
+                # Rimuoviamo le chiavi esterne (FK) numeriche e le colonne solo locali
+                for col in (*cols_to_pop, *database.LOCAL_ONLY_COLUMNS.get(table, ())):
                     record_dict.pop(col, None)
                 
                 records_list.append(record_dict)
             
             changes[table] = records_list
+            pushed_versions[table] = versions
+            if progress is not None:
+                progress.rows_uploaded += len(records_list)
+                progress.report(table=table, rows_done=progress.rows_uploaded)
             
-    return changes
-
-def _apply_server_changes(conn, changes):
+    return changes, pushed_versions
+
+def _has_unpushed_local_edit(table, row, pushed_versions):
+    """
+    True se il record locale (chiave primaria, is_synced, last_modified) è stato
+    modificato dopo la raccolta del payload: non sincronizzato e con una versione
+    diversa da quella inviata. Queste modifiche non vanno sovrascritte dal server.
+    """
+    if row is None or row[1]:
+        return False
+    versions = pushed_versions.get(table, {})
+    return row[0] not in versions or versions[row[0]] != row[2]
+
+def _apply_server_changes(conn, changes, pushed_versions=None, progress=None):
+    pushed_versions = pushed_versions or {}
     applied_counts = {table: 0 for table in SYNC_ORDER}
     uuid_to_local_id = {"customers": {}, "devices": {}, "profiles": {}, "destinations": {}}
     cursor = conn.cursor()
+    rows_total = sum(len(changes.get(table) or []) for table in SYNC_ORDER)
+    rows_done = 0
 
     for table in SYNC_ORDER:
         records_from_server = changes.get(table, [])
         if not records_from_server:
             continue
+        if progress is not None:
+            progress.report(table=table, rows_done=rows_done, rows_total=rows_total)
+        rows_done += len(records_from_server)
 
         if table == 'signatures':
             records_to_upsert = []
             for record in records_from_server:
+                local_row = cursor.execute(
+                    "SELECT username, is_synced, last_modified FROM signatures WHERE username = ?",
+                    (record.get('username'),)
+                ).fetchone()
+                if _has_unpushed_local_edit(table, local_row, pushed_versions):
+                    logging.info(f"Firma di '{record.get('username')}' modificata durante la sync: mantengo la versione locale.")
+                    continue
                 # decode base64 -> bytes (già lo fai)
                 if record.get('signature_data'):
                     try:
@@ -186,9 +327,14 @@ def _apply_server_changes(conn, changes):
             record_uuid = record.get('uuid')
             if not record_uuid: continue
 
-            existing = cursor.execute(f"SELECT id FROM {table} WHERE uuid = ?", (record_uuid,)).fetchone()
+            existing = cursor.execute(
+                f"SELECT id, is_synced, last_modified FROM {table} WHERE uuid = ?", (record_uuid,)
+            ).fetchone()
             
             if existing:
+                if _has_unpushed_local_edit(table, existing, pushed_versions):
+                    logging.info(f"Record {record_uuid} in '{table}' modificato durante la sync: mantengo la versione locale.")
+                    continue
                 records_to_update.append(record)
             elif not record.get('is_deleted', False):
                 record.pop('id', None)
@@ -215,14 +361,30 @@ def _apply_server_changes(conn, changes):
             cursor.executemany(query, params)
             applied_counts[table] += cursor.rowcount
 
+    if progress is not None:
+        progress.report(rows_done=rows_done, rows_total=rows_total)
     logging.info(f"Modifiche batch dal server applicate: {json.dumps(applied_counts)}")
     return applied_counts
 
-def _mark_pushed_changes_as_synced(conn):
+def _mark_pushed_changes_as_synced(conn, pushed_versions):
+    """
+    Conferma solo i record effettivamente inviati, tramite la chiave primaria.
+    La condizione su last_modified lascia 'sporchi' i record modificati
+    mentre la sincronizzazione era in corso, che verranno inviati la volta successiva.
+    """
     cursor = conn.cursor()
+    acknowledged = 0
     for table in SYNC_ORDER:
-        cursor.execute(f"UPDATE {table} SET is_synced = 1 WHERE is_synced = 0")
-    logging.info("Tutti i record locali inviati sono stati marcati come sincronizzati.")
+        versions = pushed_versions.get(table)
+        if not versions:
+            continue
+        pk_column = _local_pk_column(table)
+        cursor.executemany(
+            f"UPDATE {table} SET is_synced = 1 WHERE {pk_column} = ? AND is_synced = 0 AND last_modified IS ?",
+            list(versions.items())
+        )
+        acknowledged += cursor.rowcount
+    logging.info(f"{acknowledged} record locali inviati marcati come sincronizzati.")
 
 def _handle_uuid_maps(conn, uuid_map: dict):
     if not uuid_map: return
@@ -246,81 +408,379 @@ def _handle_uuid_maps(conn, uuid_map: dict):
             continue
 
 
-def run_sync(full_sync=False):
+def run_sync(full_sync=False, notify_if_locked=True, progress_callback=None, allow_snapshot=True):
+    """
+    Esegue una sincronizzazione con il server.
+
+    Args:
+        progress_callback: funzione opzionale che riceve gli eventi di
+            avanzamento (vedi SyncProgress). Al termine i tempi delle fasi
+            vengono salvati nella cronologia locale delle sincronizzazioni.
+        allow_snapshot: se False non sostituisce mai il file del database
+            (le sincronizzazioni in background girano con la UI attiva).
+    """
     # 1. CONTROLLO DEL LOCK
     #    Verifica se un'altra sincronizzazione è già in esecuzione.
     #    Se sì, avvisa l'utente e interrompe l'operazione.
+    #    Le sincronizzazioni automatiche in background non mostrano avvisi.
     if is_sync_locked():
         logging.warning("Sync già in corso, operazione annullata.")
-        QMessageBox.warning(None, "Sincronizzazione in corso",
-                              "Un'altra operazione di sincronizzazione è già in corso. "
-                              "Attendere il completamento prima di avviarne un'altra.")
+        if notify_if_locked:
+            QMessageBox.warning(None, "Sincronizzazione in corso",
+                                  "Un'altra operazione di sincronizzazione è già in corso. "
+                                  "Attendere il completamento prima di avviarne un'altra.")
         return None, None # Restituisce None per indicare che non è successo nulla
 
     # 2. ACQUISIZIONE DEL LOCK E BLOCCO TRY...FINALLY
     lock_sync()
+    progress = SyncProgress(progress_callback)
+    status, data = "error", None
+    try:
+        status, data = _run_sync_locked(full_sync, progress, allow_snapshot)
+        return status, data
+    finally:
+        unlock_sync()
+        _save_sync_history(progress, full_sync, status, data)
+
+def _save_sync_history(progress, full_sync, status, data):
+    progress.finish()
     try:
-        # Se è richiesta una sincronizzazione completa, resetta il database locale
-        if full_sync:
-            try:
-                database.wipe_all_syncable_data()
-                auth_manager.update_session_timestamp(None)
-            except Exception as e:
-                # Se il reset fallisce, non procedere. L'unlock nel `finally`
-                # gestirà il rilascio del lock.
-                return "error", f"Impossibile resettare il database locale. Operazione annullata. Errore: {e}"
-
-        logging.info(f"Avvio processo di sincronizzazione (Full Sync: {full_sync})...")
-        last_sync = auth_manager.get_current_user_info().get('last_sync_timestamp')
-
-        # Prepara il payload con le modifiche locali non sincronizzate
-        local_changes = _get_unsynced_local_changes()
-        for table, rows in list(local_changes.items()):
-            if not rows:
-                continue
-            norm_rows = [_jsonify_record(dict(r) if not isinstance(r, dict) else r) for r in rows]
-            local_changes[table] = norm_rows
-        payload = {"last_sync_timestamp": last_sync, "changes": local_changes}
-
-        # 3. COMUNICAZIONE CON IL SERVER E GESTIONE DELLA RISPOSTA
+        database.add_sync_history(progress.to_record(full_sync, status, data))
+    except Exception:
+        logging.warning("Impossibile salvare la cronologia della sincronizzazione.", exc_info=True)
+    logging.info(f"Tempi della sincronizzazione (s): {json.dumps(progress.phase_durations)}")
+
+def _download_and_install_snapshot(progress):
+    """
+    Scarica dal server uno snapshot SQLite compresso con il relativo cursore di
+    sincronizzazione, ne verifica l'hash e l'integrità e lo installa al posto
+    del database locale. Restituisce il cursore, oppure None se il server non
+    offre snapshot (in quel caso si procede con la sincronizzazione JSON).
+    """
+    headers = auth_manager.get_auth_headers()
+    snapshot_url = f"{config.SERVER_URL}/snapshot"
+    download_path = config.DB_PATH + ".snapshot.gz"
+    snapshot_path = config.DB_PATH + ".snapshot"
+
+    progress.start_phase("download")
+    response = requests.get(snapshot_url, headers=headers, stream=True, timeout=(10, 300))
+    if response.status_code in (404, 405, 501):
+        logging.info("Il server non fornisce snapshot: uso la sincronizzazione completa via JSON.")
+        return None
+    response.raise_for_status()
+
+    expected_sha256 = response.headers.get("X-Snapshot-SHA256", "").lower()
+    sync_cursor = response.headers.get("X-Sync-Timestamp")
+    if not expected_sha256 or not sync_cursor:
+        raise ValueError("Risposta snapshot incompleta (hash o cursore mancanti).")
+
+    try:
+        digest = hashlib.sha256()
+        bytes_total = int(response.headers.get("Content-Length") or 0)
+        with open(download_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=256 * 1024):
+                f.write(chunk)
+                digest.update(chunk)
+                progress.bytes_downloaded += len(chunk)
+                progress.report(table="snapshot", bytes_done=progress.bytes_downloaded, bytes_total=bytes_total)
+        if digest.hexdigest() != expected_sha256:
+            raise ValueError("L'hash dello snapshot scaricato non corrisponde: download corrotto.")
+
+        progress.start_phase("apply")
+        progress.report(table="snapshot")
+        with gzip.open(download_path, "rb") as src, open(snapshot_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+
+        # Copia di sicurezza del database corrente prima della sostituzione
+        backup_manager.create_backup()
+        database.install_database_snapshot(snapshot_path)
+    finally:
+        for path in (download_path, snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    logging.info(f"Snapshot installato. Cursore di sincronizzazione: {sync_cursor}")
+    return sync_cursor
+
+def _run_sync_locked(full_sync, progress, allow_snapshot=True):
+    # Database nuovo o reset richiesto: prova prima con lo snapshot precompilato
+    # del server, molto più veloce del download record per record.
+    last_sync = auth_manager.get_current_user_info().get('last_sync_timestamp')
+    if allow_snapshot and (full_sync or (last_sync is None and not database.has_unsynced_changes())):
         try:
-            headers = auth_manager.get_auth_headers()
-            sync_url = f"{config.SERVER_URL}/sync"
-            response = requests.post(sync_url, json=payload, timeout=60, headers=headers)
-            response.raise_for_status() # Solleva un'eccezione per status code 4xx/5xx
-            server_response = response.json()
-
-            status = server_response.get("status")
-            if status == "conflict":
-                return "conflict", server_response.get("conflicts")
-            if status != "success":
-                raise Exception(f"Il server ha risposto con un errore: {server_response.get('message')}")
-
-            # Applica le modifiche ricevute dal server al database locale
-            with database.DatabaseConnection() as conn:
-                uuid_map = server_response.get("uuid_map", {})
-                if uuid_map: _handle_uuid_maps(conn, uuid_map)
-                changes_from_server = server_response.get("changes", {})
-                applied_counts = _apply_server_changes(conn, changes_from_server)
-                _mark_pushed_changes_as_synced(conn)
-
-            # Aggiorna il timestamp dell'ultima sincronizzazione
-            auth_manager.update_session_timestamp(server_response.get("new_sync_timestamp"))
-
-            # Prepara un messaggio di riepilogo per l'utente
-            summary = [f"{count} {table}" for table, count in applied_counts.items() if count > 0]
-            if not summary:
-                return "success", "Sincronizzazione completata. Nessuna nuova modifica ricevuta."
-            return "success", "Sincronizzazione completata. Dati aggiornati:\n- " + "\n- ".join(summary)
-
-        # 4. GESTIONE SPECIFICA DEGLI ERRORI
+            snapshot_cursor = _download_and_install_snapshot(progress)
         except requests.RequestException as e:
-            if e.response and e.response.status_code == 401:
-                 return "error", "Errore di autenticazione (401). La sessione potrebbe essere scaduta. Prova a riavviare."
-            return "error", str(f"Impossibile connettersi al server.\nControllare la connessione e l'indirizzo nel file config.ini.")
+            logging.warning(f"Download dello snapshot non riuscito: {e}")
+            snapshot_cursor = None
         except Exception as e:
-            logging.error(f"Sincronizzazione fallita. Errore: {e}", exc_info=True)
-            return "error", str(e)
+            logging.error(f"Snapshot scartato: {e}", exc_info=True)
+            snapshot_cursor = None
+        if snapshot_cursor:
+            auth_manager.update_session_timestamp(snapshot_cursor)
+            full_sync = False
+
+    # Se è richiesta una sincronizzazione completa, resetta il database locale
+    if full_sync:
+        try:
+            database.wipe_all_syncable_data()
+            auth_manager.update_session_timestamp(None)
+        except Exception as e:
+            # Se il reset fallisce, non procedere. L'unlock nel `finally`
+            # di run_sync gestirà il rilascio del lock.
+            return "error", f"Impossibile resettare il database locale. Operazione annullata. Errore: {e}"
+
+    logging.info(f"Avvio processo di sincronizzazione (Full Sync: {full_sync})...")
+    last_sync = auth_manager.get_current_user_info().get('last_sync_timestamp')
+
+    # Prepara il payload con le modifiche locali non sincronizzate
+    progress.start_phase("collect")
+    local_changes, pushed_versions = _get_unsynced_local_changes(progress)
+    for table, rows in list(local_changes.items()):
+        if not rows:
+            continue
+        norm_rows = [_jsonify_record(dict(r) if not isinstance(r, dict) else r) for r in rows]
+        local_changes[table] = norm_rows
+    payload = {"last_sync_timestamp": last_sync, "changes": local_changes}
 
+    # 3. COMUNICAZIONE CON IL SERVER E GESTIONE DELLA RISPOSTA
+    try:
+        headers = dict(auth_manager.get_auth_headers() or {})
+        headers["Content-Type"] = "application/json"
+        sync_url = f"{config.SERVER_URL}/sync"
+        body = json.dumps(payload).encode("utf-8")
+
+        progress.start_phase("upload")
+        response = requests.post(sync_url, data=_UploadReader(body, progress), timeout=60,
+                                 headers=headers, stream=True)
+        # Con stream=True la chiamata ritorna alla ricezione degli header:
+        # il tempo dopo l'upload è quello di elaborazione del server.
+        progress.start_phase("server")
+        response.raise_for_status() # Solleva un'eccezione per status code 4xx/5xx
+
+        progress.start_phase("download")
+        bytes_total = int(response.headers.get("Content-Length") or 0)
+        chunks = []
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            progress.bytes_downloaded += len(chunk)
+            progress.report(bytes_done=progress.bytes_downloaded, bytes_total=bytes_total)
+        server_response = json.loads(b"".join(chunks))
+
+        status = server_response.get("status")
+        if status == "conflict":
+            return "conflict", server_response.get("conflicts")
+        if status != "success":
+            raise Exception(f"Il server ha risposto con un errore: {server_response.get('message')}")
+
+        # Applica le modifiche ricevute dal server al database locale
+        progress.start_phase("apply")
+        with database.DatabaseConnection() as conn:
+            uuid_map = server_response.get("uuid_map", {})
+            if uuid_map: _handle_uuid_maps(conn, uuid_map)
+            changes_from_server = server_response.get("changes", {})
+            progress.rows_downloaded = sum(len(changes_from_server.get(t) or []) for t in SYNC_ORDER)
+            applied_counts = _apply_server_changes(conn, changes_from_server, pushed_versions, progress)
+            _mark_pushed_changes_as_synced(conn, pushed_versions)
+
+        # Aggiorna il timestamp dell'ultima sincronizzazione
+        auth_manager.update_session_timestamp(server_response.get("new_sync_timestamp"))
+
+        # Prepara un messaggio di riepilogo per l'utente
+        summary = [f"{count} {table}" for table, count in applied_counts.items() if count > 0]
+        if not summary:
+            return "success", "Sincronizzazione completata. Nessuna nuova modifica ricevuta."
+        return "success", "Sincronizzazione completata. Dati aggiornati:\n- " + "\n- ".join(summary)
+
+    # 4. GESTIONE SPECIFICA DEGLI ERRORI
+    except requests.RequestException as e:
+        if e.response is not None and e.response.status_code == 401:
+             return "error", "Errore di autenticazione (401). La sessione potrebbe essere scaduta. Prova a riavviare."
+        return "error", str(f"Impossibile connettersi al server.\nControllare la connessione e l'indirizzo nel file config.ini.")
+    except Exception as e:
+        logging.error(f"Sincronizzazione fallita. Errore: {e}", exc_info=True)
+        return "error", str(e)
+
+
+# ==============================================================================
+# RICONCILIAZIONE A HASH (ALBERO DI MERKLE SUGLI UUID)
+# ==============================================================================
+# Client e server calcolano, per ogni prefisso esadecimale dell'uuid, il numero
+# di record attivi e lo XOR degli hash di (uuid, last_modified). Solo i prefissi
+# con riepilogo diverso vengono suddivisi ulteriormente e, raggiunta una
+# dimensione ridotta, scaricati e riparati: una replica quasi allineata
+# scambia pochi kilobyte invece di riscaricare tutto.
+
+RECONCILE_TABLES = [t for t in SYNC_ORDER if t != "signatures"]  # le firme arrivano intere a ogni sync
+RECONCILE_LEAF_ROWS = 64      # sotto questa soglia un intervallo viene scaricato invece che suddiviso
+RECONCILE_MAX_PREFIX = 8      # profondità massima dell'albero
+RECONCILE_BATCH = 4096        # prefissi per richiesta
+HEX_DIGITS = "0123456789abcdef"
+
+def _normalize_reconcile_timestamp(value) -> str:
+    """Rappresentazione canonica di last_modified (UTC, microsecondi), identica a quella del server."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return str(value)
+
+def _reconcile_row_digest(row_uuid: str, last_modified) -> int:
+    key = f"{row_uuid.lower()}|{_normalize_reconcile_timestamp(last_modified)}".encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big")
+
+def _local_bucket_summaries(conn, table, prefixes):
+    """Riepilogo locale {prefisso: {'count', 'hash'}} per prefissi della stessa lunghezza."""
+    length = len(prefixes[0])
+    buckets = {p: [0, 0] for p in prefixes}
+    placeholders = ", ".join(["?"] * len(prefixes))
+    rows = conn.execute(
+        f"SELECT uuid, last_modified FROM {table} WHERE is_deleted = 0 AND uuid IS NOT NULL "
+        f"AND substr(lower(replace(uuid, '-', '')), 1, ?) IN ({placeholders})",
+        (length, *prefixes)
+    )
+    for row_uuid, last_modified in rows:
+        bucket = buckets[row_uuid.replace("-", "").lower()[:length]]
+        bucket[0] += 1
+        bucket[1] ^= _reconcile_row_digest(row_uuid, last_modified)
+    return {p: {"count": c, "hash": f"{h:016x}"} for p, (c, h) in buckets.items()}
+
+def _post_reconcile(endpoint, table, prefixes, progress):
+    body = json.dumps({"table": table, "prefixes": prefixes}).encode("utf-8")
+    headers = dict(auth_manager.get_auth_headers() or {})
+    headers["Content-Type"] = "application/json"
+    response = requests.post(f"{config.SERVER_URL}/reconcile/{endpoint}", data=body, headers=headers, timeout=60)
+    response.raise_for_status()
+    progress.bytes_uploaded += len(body)
+    progress.bytes_downloaded += len(response.content)
+    return response.json()
+
+def _repair_ranges(conn, table, prefixes, server_rows):
+    """
+    Allinea i record locali degli intervalli indicati con quelli del server.
+    Le modifiche locali non ancora inviate non vengono toccate; i record locali
+    sincronizzati ma assenti sul server vengono marcati per un nuovo invio.
+    Restituisce (record aggiornati dal server, record da reinviare).
+    """
+    length = len(prefixes[0])
+    placeholders = ", ".join(["?"] * len(prefixes))
+    local_rows = {
+        row["uuid"]: row for row in conn.execute(
+            f"SELECT id, uuid, is_synced, is_deleted, last_modified FROM {table} WHERE uuid IS NOT NULL "
+            f"AND substr(lower(replace(uuid, '-', '')), 1, ?) IN ({placeholders})",
+            (length, *prefixes)
+        )
+    }
+
+    server_uuids = set()
+    changed = []
+    for record in server_rows:
+        server_uuids.add(record.get("uuid"))
+        local = local_rows.get(record.get("uuid"))
+        if (local is None
+                or bool(local["is_deleted"]) != bool(record.get("is_deleted"))
+                or _normalize_reconcile_timestamp(local["last_modified"]) != _normalize_reconcile_timestamp(record.get("last_modified"))):
+            changed.append(record)
+    applied = _apply_server_changes(conn, {table: changed}).get(table, 0) if changed else 0
+
+    to_push = [(row["id"],) for uuid_value, row in local_rows.items()
+               if uuid_value not in server_uuids and not row["is_deleted"] and row["is_synced"]]
+    if to_push:
+        conn.executemany(f"UPDATE {table} SET is_synced = 0 WHERE id = ?", to_push)
+    return applied, len(to_push)
+
+def _reconcile_table(table, progress, stats):
+    """Confronta una tabella scendendo nell'albero dei prefissi solo dove i riepiloghi differiscono."""
+    prefixes = list(HEX_DIGITS)
+    to_fetch = []
+    while prefixes:
+        next_level = []
+        for i in range(0, len(prefixes), RECONCILE_BATCH):
+            batch = prefixes[i:i + RECONCILE_BATCH]
+            remote = _post_reconcile("summary", table, batch, progress)["buckets"]
+            with database.DatabaseConnection() as conn:
+                local = _local_bucket_summaries(conn, table, batch)
+            for prefix in batch:
+                stats["buckets_compared"] += 1
+                local_bucket = local[prefix]
+                remote_bucket = remote.get(prefix, {"count": 0, "hash": "0" * 16})
+                if local_bucket == remote_bucket:
+                    continue
+                if (max(local_bucket["count"], remote_bucket["count"]) <= RECONCILE_LEAF_ROWS
+                        or len(prefix) >= RECONCILE_MAX_PREFIX):
+                    to_fetch.append(prefix)
+                else:
+                    next_level.extend(prefix + digit for digit in HEX_DIGITS)
+        prefixes = next_level
+        progress.report(table=table, rows_done=stats["buckets_compared"])
+
+    # Gli intervalli da scaricare possono avere lunghezze diverse: si raggruppano per lunghezza
+    by_length = {}
+    for prefix in to_fetch:
+        by_length.setdefault(len(prefix), []).append(prefix)
+    for same_length in by_length.values():
+        for i in range(0, len(same_length), 256):
+            batch = same_length[i:i + 256]
+            rows = _post_reconcile("rows", table, batch, progress)["rows"]
+            stats["rows_fetched"] += len(rows)
+            with database.DatabaseConnection() as conn:
+                applied, to_push = _repair_ranges(conn, table, batch, rows)
+            stats["rows_repaired"] += applied
+            stats["rows_to_push"] += to_push
+            progress.rows_downloaded += len(rows)
+    stats["ranges_fetched"] += len(to_fetch)
+
+def run_reconciliation(notify_if_locked=True, progress_callback=None):
+    """
+    Modalità di riconciliazione: invia le modifiche in sospeso con una sync
+    incrementale, poi confronta i riepiloghi a hash con il server e ripara solo
+    gli intervalli di uuid che differiscono. Alternativa leggera al full sync.
+    """
+    if is_sync_locked():
+        logging.warning("Sync già in corso, riconciliazione annullata.")
+        if notify_if_locked:
+            QMessageBox.warning(None, "Sincronizzazione in corso",
+                                  "Un'altra operazione di sincronizzazione è già in corso. "
+                                  "Attendere il completamento prima di avviarne un'altra.")
+        return None, None
+
+    lock_sync()
+    progress = SyncProgress(progress_callback)
+    status, data = "error", None
+    try:
+        status, data = _run_sync_locked(False, progress)
+        if status != "success":
+            return status, data
+
+        progress.start_phase("reconcile")
+        stats = {"buckets_compared": 0, "ranges_fetched": 0, "rows_fetched": 0, "rows_repaired": 0, "rows_to_push": 0}
+        try:
+            for table in RECONCILE_TABLES:
+                _reconcile_table(table, progress, stats)
+        except requests.RequestException as e:
+            logging.error(f"Riconciliazione interrotta: {e}", exc_info=True)
+            status, data = "error", "Impossibile completare la riconciliazione: server non raggiungibile."
+            return status, data
+
+        logging.info(f"Riconciliazione completata: {json.dumps(stats)}")
+        status = "success"
+        data = (f"Riconciliazione completata.\n"
+                f"- Intervalli confrontati: {stats['buckets_compared']}\n"
+                f"- Intervalli scaricati: {stats['ranges_fetched']} ({stats['rows_fetched']} record)\n"
+                f"- Record locali corretti: {stats['rows_repaired']}\n"
+                f"- Record da reinviare al server: {stats['rows_to_push']}\n"
+                f"- Dati scambiati: {(progress.bytes_uploaded + progress.bytes_downloaded) / 1024:.1f} KB")
+        return status, data
+    except Exception as e:
+        logging.error(f"Riconciliazione fallita. Errore: {e}", exc_info=True)
+        status, data = "error", str(e)
+        return status, data
     finally:
-        unlock_sync()
\ No newline at end of file
+        unlock_sync()
+        _save_sync_history(progress, False, status, data)
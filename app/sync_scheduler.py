@@ -0,0 +1,177 @@
+# app/sync_scheduler.py
+import logging
+from PySide6.QtCore import QObject, QThread, QTimer, Signal
+
+import database
+from app import config, sync_manager
+from app.workers.sync_worker import SyncWorker
+
+# Tabelle le cui modifiche locali devono essere inviate al server
+SYNCABLE_TABLES = frozenset(sync_manager.SYNC_ORDER)
+
+
+class SyncScheduler(QObject):
+    """
+    Esegue piccole sincronizzazioni incrementali in background:
+    - a intervalli regolari;
+    - poco dopo una scrittura locale, con una finestra di debounce
+      (scritture ravvicinate producono un'unica sincronizzazione).
+
+    Non parte mai mentre l'applicazione non è inattiva (test, sync manuale,
+    caricamenti) e, in caso di errori di rete, allunga progressivamente
+    l'intervallo fino a 'max_backoff_minutes'.
+    """
+    sync_started = Signal()
+    sync_succeeded = Signal(str)
+    sync_failed = Signal(str)
+    sync_conflict = Signal(int)
+    # Segnale interno: inoltra le notifiche del database (da qualsiasi thread) al thread della UI
+    _local_change = Signal(object)
+
+    def __init__(self, is_busy, parent=None, settings=None):
+        """
+        Args:
+            is_busy: funzione senza argomenti che restituisce True quando
+                     la sincronizzazione non deve partire (es. test in corso).
+        """
+        super().__init__(parent)
+        settings = settings or config.SYNC_SETTINGS
+        self.enabled = settings['auto_sync']
+        self.base_interval_ms = max(1, settings['interval_minutes']) * 60 * 1000
+        self.max_interval_ms = max(settings['max_backoff_minutes'] * 60 * 1000, self.base_interval_ms)
+        self.debounce_ms = max(1, settings['debounce_seconds']) * 1000
+
+        self.is_busy = is_busy
+        self.current_interval_ms = self.base_interval_ms
+        self.consecutive_failures = 0
+        self.paused = False
+        self.sync_thread = None
+        self.sync_worker = None
+
+        self.interval_timer = QTimer(self)
+        self.interval_timer.setSingleShot(True)
+        self.interval_timer.timeout.connect(self.trigger_sync)
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self.trigger_sync)
+
+        self._local_change.connect(self._on_local_change)
+
+    # --- Ciclo di vita ---
+
+    def start(self):
+        """Avvia lo scheduler e si registra per le notifiche di scrittura del database."""
+        if not self.enabled:
+            logging.info("Sincronizzazione automatica disabilitata da config.ini.")
+            return
+        database.add_change_listener(self._emit_local_change)
+        self.interval_timer.start(self.current_interval_ms)
+        logging.info(f"Sincronizzazione automatica attiva (intervallo {self.base_interval_ms // 60000} min, "
+                     f"debounce {self.debounce_ms // 1000} s).")
+
+    def stop(self):
+        """Ferma i timer e smette di ascoltare le scritture locali."""
+        database.remove_change_listener(self._emit_local_change)
+        self.interval_timer.stop()
+        self.debounce_timer.stop()
+
+    def pause(self):
+        """Sospende le sincronizzazioni automatiche (es. conflitto da risolvere manualmente)."""
+        self.paused = True
+        self.debounce_timer.stop()
+
+    def resume(self):
+        """Riprende le sincronizzazioni automatiche azzerando il back-off."""
+        self.paused = False
+        self.consecutive_failures = 0
+        self.current_interval_ms = self.base_interval_ms
+        if self.enabled:
+            self.interval_timer.start(self.current_interval_ms)
+
+    def is_running(self):
+        """True se una sincronizzazione in background è in corso."""
+        return self.sync_worker is not None
+
+    # --- Notifiche di scrittura ---
+
+    def _emit_local_change(self, tables):
+        # Chiamato dal thread che ha eseguito il commit: passa dal segnale
+        # per arrivare in modo sicuro al thread della UI.
+        self._local_change.emit(tables)
+
+    def _on_local_change(self, tables):
+        # Le scritture fatte dalla sincronizzazione stessa non devono innescarne un'altra
+        if self.paused or self.is_running() or not (tables & SYNCABLE_TABLES):
+            return
+        # Durante il back-off non si insiste: ci penserà il timer di intervallo
+        if self.consecutive_failures:
+            return
+        self.debounce_timer.start(self.debounce_ms)
+
+    # --- Esecuzione ---
+
+    def trigger_sync(self):
+        """Avvia una sincronizzazione incrementale se le condizioni lo permettono."""
+        if self.paused or self.is_running():
+            return
+        if self.is_busy() or sync_manager.is_sync_locked():
+            # Riprova più tardi senza consumare un tentativo
+            logging.info("Sincronizzazione automatica rinviata: applicazione occupata.")
+            self.debounce_timer.start(self.debounce_ms)
+            return
+
+        self.interval_timer.stop()
+        self.debounce_timer.stop()
+
+        self.sync_thread = QThread()
+        self.sync_worker = SyncWorker(full_sync=False, max_retries=1, background=True)
+        self.sync_worker.moveToThread(self.sync_thread)
+
+        self.sync_thread.started.connect(self.sync_worker.run)
+        self.sync_worker.finished.connect(self._on_worker_success)
+        self.sync_worker.error.connect(self._on_worker_error)
+        self.sync_worker.conflict.connect(self._on_worker_conflict)
+        self.sync_worker.locked.connect(self._on_worker_locked)
+
+        for signal in (self.sync_worker.finished, self.sync_worker.error,
+                       self.sync_worker.conflict, self.sync_worker.locked):
+            signal.connect(self.sync_thread.quit)
+            signal.connect(self.sync_worker.deleteLater)
+        self.sync_thread.finished.connect(self.sync_thread.deleteLater)
+
+        logging.info("Avvio sincronizzazione automatica in background.")
+        self.sync_started.emit()
+        self.sync_thread.start()
+
+    def _finish(self):
+        self.sync_worker = None
+        self.sync_thread = None
+        if not self.paused and self.enabled:
+            self.interval_timer.start(self.current_interval_ms)
+
+    def _on_worker_success(self, message):
+        self.consecutive_failures = 0
+        self.current_interval_ms = self.base_interval_ms
+        self._finish()
+        self.sync_succeeded.emit(message)
+
+    def _on_worker_error(self, message):
+        # Probabilmente offline: raddoppia l'intervallo fino al massimo consentito
+        self.consecutive_failures += 1
+        self.current_interval_ms = min(self.base_interval_ms * (2 ** self.consecutive_failures),
+                                       self.max_interval_ms)
+        logging.warning(f"Sincronizzazione automatica fallita ({self.consecutive_failures} di fila). "
+                        f"Prossimo tentativo tra {self.current_interval_ms // 60000} min.")
+        self._finish()
+        self.sync_failed.emit(message)
+
+    def _on_worker_conflict(self, conflicts):
+        # I conflitti richiedono l'intervento dell'utente con una sincronizzazione manuale
+        logging.warning("Conflitto durante la sincronizzazione automatica: scheduler sospeso.")
+        self.pause()
+        self._finish()
+        self.sync_conflict.emit(len(conflicts))
+
+    def _on_worker_locked(self):
+        self._finish()
@@ -22,6 +22,7 @@ from app.workers.stm_import_worker import StmImportWorker
 from app.workers.export_worker import DailyExportWorker
 from app.workers.bulk_report_worker import BulkReportWorker
 from app.workers.table_export_worker import TableExportWorker
+from app.workers.dao_executor import DaoExecutor
 import database
 
 
@@ -42,6 +43,14 @@ class DbManagerDialog(QDialog):
         self.setWindowTitle("GESTIONE ANAGRAFICHE")
         self.resize(1400, 850)
         self._navigate_on_load_item = None
+        # Stato della paginazione (filtro, cursore della pagina successiva e lettura
+        # in corso) delle tabelle caricate a pagine durante lo scorrimento; None se non attiva.
+        self._customer_devices_paging = None
+        self._verifications_paging = None
+        # Elenco clienti e tabelle a pagine letti fuori dal thread della UI: si usa l'executor
+        # della finestra principale, i cui thread restano attivi tra un'apertura e l'altra
+        self._owns_dao = getattr(parent, "dao", None) is None
+        self.dao = DaoExecutor(parent=self) if self._owns_dao else parent.dao
         
         # Applica gli stili moderni da config
         self.setStyleSheet(config.MODERN_STYLESHEET)
@@ -86,6 +95,8 @@ class DbManagerDialog(QDialog):
         self.destination_search_box.textChanged.connect(self.customer_selected)
         self.device_search_box.textChanged.connect(self.destination_selected)
         self.verification_search_box.textChanged.connect(self.device_selected)
+        self.device_table.verticalScrollBar().valueChanged.connect(self.on_device_table_scrolled)
+        self.verifications_table.verticalScrollBar().valueChanged.connect(self.on_verifications_table_scrolled)
         
         self.reset_views(level='customer')
 
@@ -396,10 +407,12 @@ class DbManagerDialog(QDialog):
             self.destination_label.setText("ℹ️ Seleziona un cliente dalla scheda precedente")
             self.set_destination_buttons_enabled(False, False)
         if level in ['customer', 'destination']:
+            self._customer_devices_paging = None
             self.device_table.setRowCount(0)
             self.device_label.setText("ℹ️ Seleziona una destinazione dalla scheda precedente")
             self.set_device_buttons_enabled(False)
         if level in ['customer', 'destination', 'device']:
+            self._verifications_paging = None
             self.verifications_table.setRowCount(0)
             self.verification_label.setText("ℹ️ Seleziona un dispositivo dalla scheda precedente")
             self.set_verification_buttons_enabled(False)
@@ -427,12 +440,33 @@ class DbManagerDialog(QDialog):
         self.print_report_btn.setEnabled(enabled)
         self.delete_verif_btn.setEnabled(enabled)
 
+    def done(self, result):
+        # Un elenco ancora in caricamento non deve arrivare a una finestra chiusa
+        for channel in ("manager_customers", "manager_verifications",
+                        "manager_customer_devices", "manager_customer_devices_count"):
+            self.dao.cancel_channel(channel)
+        if self._owns_dao:
+            self.dao.shutdown()
+        super().done(result)
+
     def load_customers_table(self):
+        """
+        Svuota le viste e avvia la lettura dei clienti in background: la tabella
+        viene riempita da _fill_customers_table all'arrivo del risultato. Una
+        nuova chiamata (es. a ogni tasto nel filtro) annulla la lettura precedente.
+        """
         self.reset_views(level='customer') 
+        self.customer_table.setRowCount(0)
+        self.dao.submit(services.get_all_customers, self.customer_search_box.text(),
+                        channel="manager_customers", on_result=self._fill_customers_table,
+                        on_error=self._on_customers_load_error)
+
+    def _on_customers_load_error(self, message):
+        QMessageBox.critical(self, "ERRORE", f"IMPOSSIBILE CARICARE I CLIENTI:\n{message}".upper())
+
+    def _fill_customers_table(self, customers):
         self.customer_table.setRowCount(0)
         self.customer_table.setSortingEnabled(False) 
-        customers = services.get_all_customers(self.customer_search_box.text())
-        
         for cust in customers:
             row = self.customer_table.rowCount()
             self.customer_table.insertRow(row)
@@ -495,24 +529,16 @@ class DbManagerDialog(QDialog):
                 self._navigate_on_load_item = None
 
     def load_devices_table(self, destination_id):
+        self._customer_devices_paging = None
         self.device_table.setSortingEnabled(False)
         self.device_table.setRowCount(0)
         search_text = self.device_search_box.text()
 
         # --- INIZIO BLOCCO MODIFICATO ---
         
-        # 1. Recupera i dati arricchiti dalla nuova funzione del database
-        all_devices = database.get_devices_with_last_verification()
-        
-        # 2. Filtra i dispositivi per la destinazione corrente e la ricerca
-        devices_to_show = [
-            dev for dev in all_devices 
-            if dev.get('destination_id') == destination_id and (
-                not search_text or 
-                any(search_text.lower() in str(dev.get(field, '') or '').lower() for field in 
-                    ['description', 'serial_number', 'model', 'manufacturer', 'department', 'ams_inventory', 'customer_inventory'])
-            )
-        ]
+        # 1-2. Recupera solo i dispositivi della destinazione corrente, già filtrati
+        #      per la ricerca e arricchiti con l'ultima verifica (tutto in SQL)
+        devices_to_show = database.get_devices_for_manager_view(destination_id, search_text)
 
         # Colori per le righe in base all'esito
         color_pass = QColor("#0b5f1e")  # Verde chiaro
@@ -627,11 +653,50 @@ class DbManagerDialog(QDialog):
             self.verification_label.setText(f"STORICO VERIFICHE '{dev_desc.upper()}' - SN: '{serial.upper()}'")
             self.load_verifications_table(dev_id)
     
+    @staticmethod
+    def _scrolled_near_end(scrollbar):
+        return scrollbar.value() >= scrollbar.maximum() - scrollbar.pageStep()
+
     def load_verifications_table(self, device_id):
+        self._verifications_paging = None
         self.verifications_table.setRowCount(0)
-        self.verifications_table.setSortingEnabled(False) 
         search_query = self.verification_search_box.text()
-        verifications = services.get_verifications_for_device(device_id, search_query)
+        self._verifications_paging = {"device_id": device_id, "search": search_query, "cursor": None, "loading": False}
+        # I pulsanti si riattivano all'arrivo della prima pagina, se contiene verifiche
+        self.set_verification_buttons_enabled(False)
+        self.load_next_verifications_page()
+
+    def on_verifications_table_scrolled(self, _value):
+        paging = self._verifications_paging
+        if paging and paging["cursor"] and self._scrolled_near_end(self.verifications_table.verticalScrollBar()):
+            self.load_next_verifications_page()
+
+    def load_next_verifications_page(self):
+        """
+        Avvia in background la lettura della pagina successiva dello storico
+        verifiche; le righe vengono aggiunte da _append_verifications_page.
+        """
+        paging = self._verifications_paging
+        if paging["loading"]:
+            return
+        paging["loading"] = True
+        self.dao.submit(services.get_verifications_page_for_device,
+                        paging["device_id"], paging["cursor"], search_query=paging["search"], include_json=False,
+                        channel="manager_verifications",
+                        on_result=lambda page: self._append_verifications_page(paging, *page),
+                        on_error=lambda message: self._on_page_load_error(paging, message))
+
+    def _on_page_load_error(self, paging, message):
+        paging["loading"] = False
+        QMessageBox.critical(self, "ERRORE", f"IMPOSSIBILE CARICARE I DATI:\n{message}".upper())
+
+    def _append_verifications_page(self, paging, verifications, cursor):
+        # Nel frattempo è stato selezionato un altro dispositivo o cambiato il filtro
+        if paging is not self._verifications_paging:
+            return
+        paging["loading"] = False
+        paging["cursor"] = cursor
+        self.verifications_table.setSortingEnabled(False)
         for verif in verifications:
             row = self.verifications_table.rowCount()
             self.verifications_table.insertRow(row)
@@ -646,9 +711,9 @@ class DbManagerDialog(QDialog):
             self.verifications_table.setItem(row, 3, QTableWidgetItem(profile_display_name.upper()))
             self.verifications_table.setItem(row, 4, QTableWidgetItem(str(verif.get('technician_name', '')).upper()))
             self.verifications_table.setItem(row, 5, QTableWidgetItem(str(verif.get('verification_code', '')).upper()))
-        self.set_verification_buttons_enabled(self.verifications_table.rowCount() > 0)
         self.verifications_table.setSortingEnabled(True)
         self.verifications_table.resizeRowsToContents()
+        self.set_verification_buttons_enabled(self.verifications_table.rowCount() > 0)
 
     def add_customer(self):
         dialog = CustomerDialog(parent=self)
@@ -963,9 +1028,8 @@ class DbManagerDialog(QDialog):
         dev_id = self.get_selected_id(self.device_table)
         if not verif_id or not dev_id:
             return
-        all_verifs = services.get_verifications_for_device(dev_id)
-        verif_data = next((v for v in all_verifs if v.get('id') == verif_id), None)
-        if verif_data:
+        verif_data = services.get_verification_by_id(verif_id)
+        if verif_data and verif_data.get('device_id') == dev_id:
             dialog = VerificationViewerDialog(verif_data, self)
             dialog.exec()
         else:
@@ -1023,12 +1087,52 @@ class DbManagerDialog(QDialog):
             return
         self.destination_table.clearSelection()
         customer_name = self.customer_table.item(self.customer_table.currentRow(), 1).text()
-        self.device_label.setText(f"TUTTI I DISPOSITIVI PER '{customer_name.upper()}'")
+        search_text = self.device_search_box.text()
+        # I clienti più grandi hanno decine di migliaia di dispositivi: il totale
+        # arriva da un COUNT, le righe a pagine mentre l'utente scorre la tabella.
+        self.device_label.setText(f"TUTTI I DISPOSITIVI PER '{customer_name.upper()}' (...)")
         self.set_device_buttons_enabled(False)
-        self.device_table.setSortingEnabled(False)
+        self._customer_devices_paging = None
         self.device_table.setRowCount(0)
-        search_text = self.device_search_box.text()
-        devices = services.database.get_all_devices_for_customer(cust_id, search_text)
+        paging = {"customer_id": cust_id, "search": search_text, "cursor": None, "loading": False}
+        self._customer_devices_paging = paging
+        self.dao.submit(services.get_device_count_for_customer, cust_id, search_text,
+                        channel="manager_customer_devices_count",
+                        on_result=lambda total: self._show_customer_devices_total(paging, customer_name, total))
+        self.load_next_customer_devices_page()
+        self.tabs.setCurrentWidget(self.device_tab)
+
+    def _show_customer_devices_total(self, paging, customer_name, total):
+        if paging is self._customer_devices_paging:
+            self.device_label.setText(f"TUTTI I DISPOSITIVI PER '{customer_name.upper()}' ({total})")
+
+    def on_device_table_scrolled(self, _value):
+        paging = self._customer_devices_paging
+        if paging and paging["cursor"] and self._scrolled_near_end(self.device_table.verticalScrollBar()):
+            self.load_next_customer_devices_page()
+
+    def load_next_customer_devices_page(self):
+        """
+        Avvia in background la lettura della pagina successiva dei dispositivi
+        del cliente; le righe vengono aggiunte da _append_customer_devices_page.
+        """
+        paging = self._customer_devices_paging
+        if paging["loading"]:
+            return
+        paging["loading"] = True
+        self.dao.submit(services.get_devices_page_for_customer,
+                        paging["customer_id"], paging["cursor"], search_query=paging["search"],
+                        channel="manager_customer_devices",
+                        on_result=lambda page: self._append_customer_devices_page(paging, *page),
+                        on_error=lambda message: self._on_page_load_error(paging, message))
+
+    def _append_customer_devices_page(self, paging, devices, cursor):
+        # Nel frattempo è stata selezionata una destinazione o un altro cliente
+        if paging is not self._customer_devices_paging:
+            return
+        paging["loading"] = False
+        paging["cursor"] = cursor
+        self.device_table.setSortingEnabled(False)
         for dev_row in devices:
             dev = dict(dev_row)
             row = self.device_table.rowCount()
@@ -1052,7 +1156,6 @@ class DbManagerDialog(QDialog):
                     self.device_table.item(row, col).setForeground(QBrush(QColor("blue")))
         self.device_table.setSortingEnabled(True)
         self.device_table.resizeRowsToContents()
-        self.tabs.setCurrentWidget(self.device_tab)
         
     def find_and_select_item(self, table: QTableWidget, item_id: int):
         for row in range(table.rowCount()):
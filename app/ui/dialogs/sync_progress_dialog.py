@@ -0,0 +1,76 @@
+# app/ui/dialogs/sync_progress_dialog.py
+from PySide6.QtWidgets import QDialog, QVBoxLayout, QLabel, QProgressBar
+from PySide6.QtCore import Qt, Slot
+
+PHASE_LABELS = {
+    "collect": "Raccolta modifiche locali",
+    "upload": "Invio dati al server",
+    "server": "Elaborazione sul server",
+    "download": "Ricezione dati dal server",
+    "apply": "Applicazione modifiche locali",
+    "reconcile": "Confronto con il server (riconciliazione)",
+}
+
+
+def _format_bytes(num_bytes: int) -> str:
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.1f} MB"
+    if num_bytes >= 1024:
+        return f"{num_bytes / 1024:.1f} KB"
+    return f"{num_bytes} B"
+
+
+class SyncProgressDialog(QDialog):
+    """Mostra l'avanzamento di una sincronizzazione manuale (fase, tabella, righe, byte)."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Sincronizzazione in corso")
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowCloseButtonHint | Qt.WindowStaysOnTopHint)
+        self.setMinimumWidth(450)
+
+        layout = QVBoxLayout(self)
+        self.phase_label = QLabel("Avvio della sincronizzazione...")
+        self.phase_label.setStyleSheet("font-weight: bold;")
+        self.table_label = QLabel("")
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 0)
+        self.details_label = QLabel("")
+
+        layout.addWidget(self.phase_label)
+        layout.addWidget(self.table_label)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.details_label)
+
+    @Slot(dict)
+    def update_progress(self, event: dict):
+        """Aggiorna la finestra con un evento emesso da sync_manager.SyncProgress."""
+        phase = event.get("phase")
+        self.phase_label.setText(PHASE_LABELS.get(phase, phase or ""))
+        table = event.get("table")
+        self.table_label.setText(f"Tabella: {table}" if table else "")
+
+        rows_done, rows_total = event.get("rows_done", 0), event.get("rows_total", 0)
+        bytes_done, bytes_total = event.get("bytes_done", 0), event.get("bytes_total", 0)
+
+        # Barra determinata quando il totale è noto, altrimenti indeterminata
+        if phase in ("upload", "download") and bytes_total:
+            self.progress_bar.setRange(0, 1000)
+            self.progress_bar.setValue(int(1000 * min(bytes_done, bytes_total) / bytes_total))
+        elif phase == "apply" and rows_total:
+            self.progress_bar.setRange(0, rows_total)
+            self.progress_bar.setValue(min(rows_done, rows_total))
+        else:
+            self.progress_bar.setRange(0, 0)
+
+        details = []
+        if rows_total:
+            details.append(f"{rows_done}/{rows_total} righe")
+        elif rows_done:
+            details.append(f"{rows_done} righe")
+        if bytes_done:
+            details.append(_format_bytes(bytes_done))
+        if event.get("rows_per_sec"):
+            details.append(f"{event['rows_per_sec']:.0f} righe/s")
+        details.append(f"{event.get('elapsed', 0):.1f} s")
+        self.details_label.setText(" · ".join(details))
@@ -563,7 +563,7 @@ class ExportDestinationSelectionDialog(QDialog):
         self.combo.completer().setFilterMode(Qt.MatchContains)
         self.combo.completer().setCaseSensitivity(Qt.CaseInsensitive)
 
-        destinations = services.database.get_all_destinations_with_customer()
+        destinations = services.get_all_destinations_with_customer()
         for dest in destinations:
             display_text = f"{str(dest['customer_name']).upper()} / {str(dest['name']).upper()}"
             self.combo.addItem(display_text, dest['id'])
@@ -28,6 +28,10 @@ from app.backup_manager import restore_from_backup
 from app.ui.dialogs import (DbManagerDialog, VisualInspectionDialog, DeviceDialog, 
                             InstrumentManagerDialog, InstrumentSelectionDialog)
 from app.workers.sync_worker import SyncWorker
+from app.workers.dao_executor import DaoExecutor
+from app.sync_scheduler import SyncScheduler
+from app.maintenance_scheduler import MaintenanceScheduler
+from app.ui.dialogs.sync_progress_dialog import SyncProgressDialog
 from app.ui.dialogs.conflict_dialog import ConflictResolutionDialog
 from app import auth_manager
 from app.ui.dialogs.signature_manager_dialog import SignatureManagerDialog
@@ -57,6 +61,13 @@ class MainWindow(QMainWindow):
         self.current_mti_info = None
         self.current_technician_name = ""
         self.test_runner_widget = None
+        # Letture del database per i selettori e i dettagli: eseguite fuori dal thread della UI
+        self.dao = DaoExecutor(parent=self)
+        # Dispositivo da selezionare appena arriva l'elenco (es. dalla ricerca globale)
+        self._pending_device_id = None
+        # Cursore di attesa della ricerca globale: impostato una sola volta anche
+        # se una nuova ricerca annulla quella in corso (che non emette più nulla)
+        self._global_search_waiting = False
 
         # --- INIZIO MODIFICA: Integrazione StateManager ---
         self.state_manager = StateManager()
@@ -80,6 +91,22 @@ class MainWindow(QMainWindow):
         self.apply_permissions()
         self.load_all_data()
 
+        # Sincronizzazione automatica in background (intervallo + debounce sulle scritture)
+        self.sync_scheduler = SyncScheduler(is_busy=self.is_busy_for_background_sync, parent=self)
+        self.sync_scheduler.sync_started.connect(
+            lambda: self.statusBar().showMessage("Sincronizzazione automatica in corso...", 5000))
+        self.sync_scheduler.sync_succeeded.connect(self.on_background_sync_success)
+        self.sync_scheduler.sync_failed.connect(
+            lambda msg: self.statusBar().showMessage("Sincronizzazione automatica non riuscita: server non raggiungibile.", 10000))
+        self.sync_scheduler.sync_conflict.connect(
+            lambda count: self.statusBar().showMessage(
+                f"Sincronizzazione automatica sospesa: {count} conflitti da risolvere con 'Sincronizza'.", 15000))
+        self.sync_scheduler.start()
+
+        # Manutenzione del database locale quando l'applicazione è inattiva
+        self.maintenance_scheduler = MaintenanceScheduler(is_busy=self.is_busy_for_background_sync, parent=self)
+        self.maintenance_scheduler.start()
+
     def create_menu_bar(self):
         menubar = self.menuBar()
         file_menu = menubar.addMenu("&File")
@@ -102,6 +129,10 @@ class MainWindow(QMainWindow):
         self.full_sync_action.triggered.connect(lambda: self.run_synchronization(full_sync=True))
         settings_menu.addAction(self.full_sync_action)
 
+        self.reconcile_action = QAction(qta.icon('fa5s.balance-scale'), "Riconcilia con il Server...", self)
+        self.reconcile_action.triggered.connect(self.run_reconciliation)
+        settings_menu.addAction(self.reconcile_action)
+
         self.force_push_action = QAction(qta.icon('fa5s.cloud-upload-alt'), "Forza Upload (tutti i dati)...", self)
         self.force_push_action.triggered.connect(self.confirm_and_force_push)
         settings_menu.addAction(self.force_push_action)
@@ -172,24 +203,31 @@ class MainWindow(QMainWindow):
         dialog = ExportCustomerSelectionDialog(self)
         if dialog.exec():
             customer_id = dialog.get_selected_customer()
-            customer = database.get_customer_by_id(customer_id)
-            
-            # Create worker and thread
-            self.export_thread = QThread()
-            self.export_worker = InventoryExportWorker(customer_id, customer['name'])
-            self.export_worker.moveToThread(self.export_thread)
-            
-            # Connect signals - Fixed method name to match definition
-            self.export_thread.started.connect(self.export_worker.run)
-            self.export_worker.finished.connect(self.on_export_finished)  # Changed from handle_export_finished
-            self.export_worker.error.connect(self.on_export_error)  # Make sure this matches too
-            self.export_worker.get_save_path.connect(self.get_inventory_save_path)
-            self.export_worker.finished.connect(self.export_thread.quit)
-            self.export_worker.finished.connect(self.export_worker.deleteLater)
-            self.export_thread.finished.connect(self.export_thread.deleteLater)
-            
-            # Start export
-            self.export_thread.start()
+            self.dao.submit(database.get_customer_by_id, customer_id, channel="export_customer",
+                            on_result=lambda customer: self._start_inventory_export(customer_id, customer),
+                            on_error=lambda msg: QMessageBox.critical(self, "Errore", f"Impossibile leggere il cliente:\n{msg}"))
+
+    def _start_inventory_export(self, customer_id, customer):
+        if not customer:
+            QMessageBox.warning(self, "Attenzione", "Il cliente selezionato non esiste più.")
+            return
+
+        # Create worker and thread
+        self.export_thread = QThread()
+        self.export_worker = InventoryExportWorker(customer_id, customer['name'])
+        self.export_worker.moveToThread(self.export_thread)
+        
+        # Connect signals - Fixed method name to match definition
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.finished.connect(self.on_export_finished)  # Changed from handle_export_finished
+        self.export_worker.error.connect(self.on_export_error)  # Make sure this matches too
+        self.export_worker.get_save_path.connect(self.get_inventory_save_path)
+        self.export_worker.finished.connect(self.export_thread.quit)
+        self.export_worker.finished.connect(self.export_worker.deleteLater)
+        self.export_thread.finished.connect(self.export_thread.deleteLater)
+        
+        # Start export
+        self.export_thread.start()
 
     def get_inventory_save_path(self, suggested_name):
         """Handle save path selection for inventory export."""
@@ -427,19 +465,16 @@ class MainWindow(QMainWindow):
         # Aggiungi un widget vuoto per mantenere l'altezza quando non c'è nulla
         self.device_details_layout.addWidget(QLabel("Nessun dispositivo selezionato."), 0, 0, 1, 4)
 
-    def update_device_details_view(self, dev_id: int):
-        # Pulisce il layout prima di aggiungere nuovi elementi
-        self._clear_device_details()
-
+    @staticmethod
+    def _fetch_device_details(dev_id: int):
+        """Eseguita nel pool del DaoExecutor: dispositivo e nome di destinazione/cliente."""
         row = services.database.get_device_by_id(dev_id)
         if not row:
-            return
-
-        dev = dict(row)
+            return None, None
 
         dest_name = "—"
         try:
-            dest_row = services.database.get_destination_by_id(dev.get("destination_id"))
+            dest_row = services.database.get_destination_by_id(row.get("destination_id"))
             if dest_row:
                 dest = dict(dest_row)
                 cust_row = services.database.get_customer_by_id(dest.get("customer_id"))
@@ -447,6 +482,20 @@ class MainWindow(QMainWindow):
                 dest_name = f"{dest.get('name')} — {cust_name}" if cust_name else (dest.get('name') or "—")
         except Exception:
             pass
+        return dict(row), dest_name
+
+    def update_device_details_view(self, dev_id: int):
+        self.dao.submit(self._fetch_device_details, dev_id, channel="device_details",
+                        on_result=lambda details: self._show_device_details(dev_id, *details))
+
+    def _show_device_details(self, dev_id: int, dev, dest_name):
+        # La selezione potrebbe essere cambiata mentre i dati venivano letti
+        if self.device_selector.currentData() != dev_id:
+            return
+        # Pulisce il layout prima di aggiungere nuovi elementi
+        self._clear_device_details()
+        if not dev:
+            return
 
         prof_key = dev.get("default_profile_key")
         prof_label = prof_key or "—"
@@ -495,19 +544,31 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Attenzione", "Seleziona un dispositivo da modificare.")
             return
 
+        self.dao.submit(self._fetch_device_for_edit, dev_id, channel="device_edit",
+                        on_result=lambda details: self._open_device_editor(dev_id, *details),
+                        on_error=lambda msg: QMessageBox.critical(self, "Errore", f"Impossibile caricare i dati del dispositivo:\n{msg}"))
+
+    @staticmethod
+    def _fetch_device_for_edit(dev_id: int):
+        """Eseguita nel pool del DaoExecutor: dispositivo e cliente della sua destinazione."""
+        row = services.database.get_device_by_id(dev_id)
+        if not row:
+            return None, None
+        dev = dict(row)
+        dest_id = dev.get("destination_id")
+        dest_row = services.database.get_destination_by_id(dest_id) if dest_id else None
+        customer_id = dict(dest_row).get("customer_id") if dest_row else None
+        return dev, customer_id
+
+    def _open_device_editor(self, dev_id: int, dev, customer_id):
+        if not dev:
+            QMessageBox.critical(self, "Errore", "Impossibile caricare i dati del dispositivo.")
+            return
+
         try:
             from app.ui.dialogs.detail_dialogs import DeviceDialog
 
-            row = services.database.get_device_by_id(dev_id)
-            if not row:
-                QMessageBox.critical(self, "Errore", "Impossibile caricare i dati del dispositivo.")
-                return
-
-            dev = dict(row)
             dest_id = dev.get("destination_id")
-            dest_row = services.database.get_destination_by_id(dest_id) if dest_id else None
-            customer_id = dict(dest_row).get("customer_id") if dest_row else None
-
             dlg = DeviceDialog(customer_id=customer_id,
                             destination_id=dest_id,
                             device_data=dev,
@@ -597,15 +658,32 @@ class MainWindow(QMainWindow):
 
     def load_destinations(self):
         """Load destinations into the combo box."""
+        self.dao.submit(services.get_all_destinations_with_customer, channel="destinations",
+                        on_result=self._populate_destinations)
+
+    def _populate_destinations(self, destinations):
+        current_id = self.destination_selector.currentData()
         self.destination_selector.blockSignals(True)
         self.destination_selector.clear()
         
         # Load actual destinations
-        destinations = services.database.get_all_destinations_with_customer()
         for dest in destinations:
             self.destination_selector.addItem(f"{dest['customer_name']} / {dest['name']}", dest['id'])
+
+        # Dopo un ricaricamento resta selezionata la stessa destinazione, se esiste ancora
+        selection_lost = False
+        if current_id is not None:
+            index = self.destination_selector.findData(current_id)
+            if index != -1:
+                self.destination_selector.setCurrentIndex(index)
+            else:
+                selection_lost = True
         
         self.destination_selector.blockSignals(False)
+        # La destinazione è sparita (es. eliminata da una sincronizzazione): l'elenco
+        # dispositivi va riletto per quella ora selezionata, a segnali riattivati
+        if selection_lost:
+            self.on_destination_selected()
 
     def load_profiles(self):
         self.profile_selector.clear()
@@ -626,15 +704,22 @@ class MainWindow(QMainWindow):
             self.on_device_selected()
             return
 
-        devices = []
+        self.device_selector.addItem("Caricamento dispositivi...", -1)
+        self.device_selector.blockSignals(False)
+
         if self.filter_unverified_checkbox.isChecked():
             end_date = date.today()
             start_date = end_date - timedelta(days=60)
-            devices = services.database.get_unverified_devices_for_destination_in_period(
-                destination_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
-            )
+            self.dao.submit(services.database.get_unverified_devices_for_destination_in_period,
+                            destination_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'),
+                            channel="device_list", on_result=self._populate_device_selector)
         else:
-            devices = services.database.get_devices_for_destination(destination_id)
+            self.dao.submit(services.database.get_devices_for_destination, destination_id,
+                            channel="device_list", on_result=self._populate_device_selector)
+
+    def _populate_device_selector(self, devices):
+        self.device_selector.blockSignals(True)
+        self.device_selector.clear()
         for dev_row in devices:
             dev = dict(dev_row)
             display_text = f"{dev.get('description')} (S/N: {dev.get('serial_number')}) - (Inv AMS: {dev.get('ams_inventory')})"
@@ -642,16 +727,39 @@ class MainWindow(QMainWindow):
         if self.device_selector.count() > 0:
             self.device_selector.setCurrentIndex(0)
 
+        pending_id, self._pending_device_id = self._pending_device_id, None
+        if pending_id is not None:
+            pending_index = self.device_selector.findData(pending_id)
+            if pending_index != -1:
+                self.device_selector.setCurrentIndex(pending_index)
+            elif self.filter_unverified_checkbox.isChecked():
+                # Il dispositivo cercato potrebbe essere escluso dal filtro:
+                # lo si disattiva e si riprova sul nuovo elenco.
+                logging.info("Dispositivo non trovato con filtro attivo, disattivazione filtro e nuovo tentativo...")
+                self._pending_device_id = pending_id
+                self.device_selector.blockSignals(False)
+                self.filter_unverified_checkbox.setChecked(False)
+                return
+
         self.device_selector.blockSignals(False)
         self.on_device_selected()
         self.on_device_selection_changed(self.device_selector.currentIndex())
 
     def on_device_selected(self):
         device_id = self.device_selector.currentData()
+        if not device_id or device_id == -1:
+            self.dao.cancel_channel("device_profile")
+            self.profile_selector.blockSignals(True)
+            self.profile_selector.setCurrentIndex(0)
+            self.profile_selector.blockSignals(False)
+            return
+        self.dao.submit(services.database.get_device_by_id, device_id, channel="device_profile",
+                        on_result=lambda device_data: self._apply_default_profile(device_id, device_data))
+
+    def _apply_default_profile(self, device_id, device_data):
+        if self.device_selector.currentData() != device_id:
+            return
         self.profile_selector.blockSignals(True)
-        if not device_id or device_id == -1: self.profile_selector.setCurrentIndex(0); self.profile_selector.blockSignals(False); return
-        
-        device_data = services.database.get_device_by_id(device_id)
         if device_data and device_data.get('default_profile_key'):
             index = self.profile_selector.findData(device_data['default_profile_key'])
             if index != -1: self.profile_selector.setCurrentIndex(index)
@@ -668,11 +776,33 @@ class MainWindow(QMainWindow):
         device_id = self.device_selector.currentData()
         if not device_id or device_id == -1 or self.destination_selector.currentIndex() <= 0:
             QMessageBox.warning(self, "Attenzione", "Selezionare una destinazione e un dispositivo validi."); return
-            
-        device_info_row = services.database.get_device_by_id(device_id)
-        if not device_info_row:
+
+        self.dao.submit(self._fetch_verification_context, device_id, channel="start_verification",
+                        on_result=lambda context: self._continue_verification(manual_mode, device_id, *context),
+                        on_error=lambda msg: QMessageBox.critical(self, "Errore", f"Impossibile leggere i dati del dispositivo:\n{msg}"))
+
+    @staticmethod
+    def _fetch_verification_context(device_id: int):
+        """Eseguita nel pool del DaoExecutor: dispositivo, destinazione e cliente per la verifica."""
+        device_row = services.database.get_device_by_id(device_id)
+        if not device_row:
+            return None, None, None
+        device_info = dict(device_row)
+        destination_row = services.database.get_destination_by_id(device_info['destination_id'])
+        if not destination_row:
+            return device_info, None, None
+        destination_info = dict(destination_row)
+        customer_row = services.database.get_customer_by_id(destination_info['customer_id'])
+        return device_info, destination_info, (dict(customer_row) if customer_row else None)
+
+    def _continue_verification(self, manual_mode: bool, device_id: int, device_info, destination_info, customer_info):
+        # La selezione potrebbe essere cambiata mentre i dati venivano letti
+        if self.device_selector.currentData() != device_id:
+            return
+        if not device_info:
             QMessageBox.critical(self, "Errore", "Impossibile trovare i dati del dispositivo selezionato."); return
-        device_info = dict(device_info_row)
+        if not destination_info or not customer_info:
+            QMessageBox.critical(self, "Errore", "Destinazione o cliente del dispositivo non trovati."); return
 
         profile_key = self.profile_selector.currentData()
         if not profile_key:
@@ -723,7 +853,6 @@ class MainWindow(QMainWindow):
             
             clicked_btn = msg_box.clickedButton()
             if clicked_btn == btn_edit:
-                destination_info = dict(services.database.get_destination_by_id(device_info['destination_id']))
                 customer_id = destination_info['customer_id']
                 edit_dialog = DeviceDialog(customer_id=customer_id, destination_id=device_info['destination_id'], device_data=device_info, parent=self)
                 if edit_dialog.exec():
@@ -740,8 +869,6 @@ class MainWindow(QMainWindow):
             if self.test_runner_widget:
                 self.test_runner_widget.deleteLater()
 
-            destination_info = dict(services.database.get_destination_by_id(device_info['destination_id']))
-            customer_info = dict(services.database.get_customer_by_id(destination_info['customer_id']))
             report_settings = {"logo_path": self.logo_path}
             current_user = auth_manager.get_current_user_info()
             
@@ -781,7 +908,10 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Attenzione", "Selezionare una destinazione prima di aggiungere un dispositivo.")
             return
         
-        destination_data = services.database.get_destination_by_id(destination_id)
+        self.dao.submit(services.database.get_destination_by_id, destination_id, channel="quick_add_device",
+                        on_result=lambda destination_data: self._open_quick_add_dialog(destination_id, destination_data))
+
+    def _open_quick_add_dialog(self, destination_id, destination_data):
         if not destination_data: return
         customer_id = destination_data['customer_id']
 
@@ -840,11 +970,14 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         # --- INIZIO MODIFICA: Controllo stato prima di chiudere ---
-        if not self.state_manager.is_idle():
+        if not self.state_manager.is_idle() or self.sync_scheduler.is_running():
             QMessageBox.warning(self, "Operazione in Corso", "Attendi la fine della sincronizzazione o di altre operazioni prima di chiudere.")
             event.ignore()
             return
         # --- FINE MODIFICA ---
+        self.sync_scheduler.stop()
+        self.maintenance_scheduler.shutdown()
+        self.dao.shutdown()
         self.settings.setValue("geometry", self.saveGeometry())
         super().closeEvent(event)
 
@@ -939,6 +1072,10 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Operazione non permessa", "Impossibile avviare la sincronizzazione mentre un'altra operazione è in corso.")
             return
         # --- FINE MODIFICA ---
+        if self.sync_scheduler.is_running():
+            QMessageBox.information(self, "Sincronizzazione in corso",
+                                    "È in corso una sincronizzazione automatica. Riprova tra qualche istante.")
+            return
         if full_sync:
             reply = QMessageBox.question(self, 'Conferma Sincronizzazione Totale',
                                          "<b>ATTENZIONE:</b> Questa operazione eliminerà tutti i dati locali e li riscaricherà dal server. Le modifiche non sincronizzate andranno perse.\n\nSei sicuro di voler continuare?",
@@ -948,40 +1085,72 @@ class MainWindow(QMainWindow):
 
         self.start_sync_thread(full_sync) 
 
-    def start_sync_thread(self, full_sync=False):
+    def run_reconciliation(self):
+        """Confronta i dati locali con il server e scarica solo gli intervalli che differiscono."""
+        if not self.state_manager.can_sync() or self.sync_scheduler.is_running():
+            QMessageBox.warning(self, "Operazione non permessa", "Impossibile avviare la riconciliazione mentre un'altra operazione è in corso.")
+            return
+        reply = QMessageBox.question(self, 'Riconciliazione con il Server',
+                                     "Verranno inviate le modifiche in sospeso e confrontati i dati locali con quelli del server.\n"
+                                     "Saranno scaricati solo i record che risultano diversi.\n\nContinuare?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if reply == QMessageBox.Yes:
+            self.start_sync_thread(reconcile=True)
+
+    def start_sync_thread(self, full_sync=False, reconcile=False):
         """
         Avvia il processo di sincronizzazione in un thread separato
         e gestisce correttamente tutti i possibili esiti.
         """
         self.set_ui_enabled(False)
+        self.sync_scheduler.pause()
         # 1. Imposta lo stato di "sincronizzazione in corso"
         self.state_manager.set_state(AppState.SYNCING, "Sincronizzazione in corso...")
 
         # 2. Prepara il worker e il thread
         self.sync_thread = QThread()
-        self.sync_worker = SyncWorker(full_sync=full_sync)
+        self.sync_worker = SyncWorker(full_sync=full_sync, reconcile=reconcile)
         self.sync_worker.moveToThread(self.sync_thread)
 
+        # Finestra con l'avanzamento dettagliato (fase, tabella, righe, byte)
+        self.sync_progress_dialog = SyncProgressDialog()
+        self.sync_worker.progress.connect(self.sync_progress_dialog.update_progress)
+        self.sync_progress_dialog.show()
+
         # 3. Connetti i segnali del worker agli slot di gestione
         self.sync_thread.started.connect(self.sync_worker.run)
+        self.sync_worker.finished.connect(self.close_sync_progress_dialog)
+        self.sync_worker.error.connect(self.close_sync_progress_dialog)
+        self.sync_worker.conflict.connect(self.close_sync_progress_dialog)
+        self.sync_worker.locked.connect(self.close_sync_progress_dialog)
         self.sync_worker.finished.connect(self.on_sync_success)
         self.sync_worker.error.connect(self.on_sync_error)
         self.sync_worker.conflict.connect(self.on_sync_conflict)
+        self.sync_worker.locked.connect(self.on_sync_locked)
 
         # Assicura che il thread venga chiuso in ogni caso
         self.sync_worker.finished.connect(self.sync_thread.quit)
         self.sync_worker.error.connect(self.sync_thread.quit)
         self.sync_worker.conflict.connect(self.sync_thread.quit)
+        self.sync_worker.locked.connect(self.sync_thread.quit)
 
         # Pulisce le risorse
         self.sync_thread.finished.connect(self.sync_thread.deleteLater)
         self.sync_worker.finished.connect(self.sync_worker.deleteLater)
         self.sync_worker.error.connect(self.sync_worker.deleteLater)
         self.sync_worker.conflict.connect(self.sync_worker.deleteLater)
+        self.sync_worker.locked.connect(self.sync_worker.deleteLater)
 
         # 4. Avvia il thread
         self.sync_thread.start()
 
+    def close_sync_progress_dialog(self, *args):
+        """Chiude la finestra di avanzamento della sincronizzazione manuale."""
+        if getattr(self, 'sync_progress_dialog', None) is not None:
+            self.sync_progress_dialog.close()
+            self.sync_progress_dialog.deleteLater()
+            self.sync_progress_dialog = None
+
     def on_sync_success(self, message):
         """Gestisce il caso di sincronizzazione completata con successo."""
         QMessageBox.information(self, "Sincronizzazione Completata", message)
@@ -999,6 +1168,12 @@ class MainWindow(QMainWindow):
         self.restart_after_sync = True
         self.close()
 
+    def on_sync_locked(self):
+        """Un'altra sincronizzazione era già in corso: ripristina l'UI senza riavviare."""
+        self.state_manager.set_state(AppState.IDLE)
+        self.set_ui_enabled(True)
+        self.sync_scheduler.resume()
+
     def on_sync_error(self, error_message):
         """Gestisce il caso di errore durante la sincronizzazione."""
         QMessageBox.critical(self, "Errore di Sincronizzazione", error_message)
@@ -1022,11 +1197,41 @@ class MainWindow(QMainWindow):
             else:
                 QMessageBox.information(self, "Sincronizzazione Interrotta", "La sincronizzazione verrà riprovata più tardi.")
                 self.state_manager.set_state(AppState.IDLE)
+                # start_sync_thread aveva sospeso la sincronizzazione automatica
+                self.sync_scheduler.resume()
                 return
         QMessageBox.information(self, "Riprova Sincronizzazione", "Le risoluzioni sono state applicate. Verrà ora tentata una nuova sincronizzazione.")
         self.run_synchronization()
         self.set_ui_enabled(True)
 
+    def is_busy_for_background_sync(self):
+        """
+        True se la sincronizzazione automatica deve attendere.
+        Il TestRunner riporta lo stato a IDLE tra un passo e l'altro,
+        quindi si controlla anche la presenza del widget di test.
+        """
+        return not self.state_manager.can_sync() or self.test_runner_widget is not None
+
+    def on_background_sync_success(self, message):
+        """Aggiorna i dati visualizzati dopo una sincronizzazione automatica riuscita."""
+        logging.info(f"Sincronizzazione automatica completata: {message}")
+        self.statusBar().showMessage("Sincronizzazione automatica completata.", 5000)
+        if self.is_busy_for_background_sync():
+            return
+        self.load_control_panel_data()
+        # I profili sono in cache: vengono riletti dal database solo se la
+        # sincronizzazione ha modificato profili o test
+        current_profile = self.profile_selector.currentData()
+        config.load_verification_profiles()
+        self.profile_selector.blockSignals(True)
+        self.load_profiles()
+        index = self.profile_selector.findData(current_profile)
+        if index != -1:
+            self.profile_selector.setCurrentIndex(index)
+        self.profile_selector.blockSignals(False)
+        # Ricarica le destinazioni: _populate_destinations mantiene la selezione corrente
+        self.load_destinations()
+
     # --- INIZIO MODIFICA: Nuovo metodo per gestire i cambi di stato ---
     def handle_state_change(self, new_state: AppState):
         """Mostra o nasconde l'overlay in base allo stato dell'applicazione."""
@@ -1080,11 +1285,25 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Ricerca", "Inserisci almeno 3 caratteri.")
             return
 
-        QApplication.setOverrideCursor(Qt.WaitCursor)
-        try:
-            results = services.search_globally(search_term)
+        if not self._global_search_waiting:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            self._global_search_waiting = True
+        self.dao.submit(services.search_globally, search_term, channel="global_search",
+                        on_result=lambda results: self._show_global_search_results(search_term, results),
+                        on_error=self._on_global_search_error)
+
+    def _end_global_search_wait(self):
+        if self._global_search_waiting:
+            self._global_search_waiting = False
             QApplication.restoreOverrideCursor()
 
+    def _on_global_search_error(self, message):
+        self._end_global_search_wait()
+        QMessageBox.critical(self, "Errore", f"Si è verificato un errore durante la ricerca:\n{message}")
+
+    def _show_global_search_results(self, search_term, results):
+        self._end_global_search_wait()
+        try:
             if not results:
                 QMessageBox.information(self, "Ricerca", f"Nessun risultato trovato per '{search_term}'.")
                 return
@@ -1103,7 +1322,6 @@ class MainWindow(QMainWindow):
                         self.open_db_manager(navigate_to=selected)
 
         except Exception as e:
-            QApplication.restoreOverrideCursor()
             logging.error(f"Errore nella ricerca globale: {e}", exc_info=True)
             QMessageBox.critical(self, "Errore", f"Si è verificato un errore durante la ricerca:\n{e}")
 
@@ -1116,21 +1334,13 @@ class MainWindow(QMainWindow):
 
         dest_index = self.destination_selector.findData(destination_id)
         if dest_index != -1:
-            self.destination_selector.setCurrentIndex(dest_index)
-            QApplication.processEvents()
-            device_index = self.device_selector.findData(device_id)
-            if device_index != -1:
-                self.device_selector.setCurrentIndex(device_index)
+            # L'elenco dei dispositivi arriva in modo asincrono: la selezione
+            # (ed eventualmente la disattivazione del filtro) avviene in _populate_device_selector
+            self._pending_device_id = device_id
+            if self.destination_selector.currentIndex() == dest_index:
+                self.on_destination_selected()
             else:
-                # Se il dispositivo non viene trovato, potrebbe essere a causa del filtro.
-                # Disattiviamo il filtro e riproviamo.
-                if self.filter_unverified_checkbox.isChecked():
-                    logging.info("Dispositivo non trovato con filtro attivo, disattivazione filtro e nuovo tentativo...")
-                    self.filter_unverified_checkbox.setChecked(False)
-                    QApplication.processEvents() # Diamo tempo alla UI di aggiornare la lista
-                    device_index = self.device_selector.findData(device_id)
-                    if device_index != -1:
-                        self.device_selector.setCurrentIndex(device_index)
+                self.destination_selector.setCurrentIndex(dest_index)
 
     def setup_verification_session(self):
         dialog = InstrumentSelectionDialog(self)
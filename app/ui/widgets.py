@@ -18,6 +18,9 @@ class ControlPanelWidget(QWidget):
     """
     Il widget che funge da pannello di controllo / dashboard principale.
     """
+    # Scadenze mostrate nell'elenco (le più vecchie); i totali sono nei contatori
+    DUE_LIST_LIMIT = 100
+
     def __init__(self, parent=None):
         super().__init__(parent)
         
@@ -31,8 +34,12 @@ class ControlPanelWidget(QWidget):
         stats_layout.setRowWrapPolicy(QFormLayout.WrapAllRows)
         self.customers_stat_label = QLabel("...")
         self.devices_stat_label = QLabel("...")
+        self.overdue_stat_label = QLabel("...")
+        self.due_soon_stat_label = QLabel("...")
         stats_layout.addRow("Numero Clienti:", self.customers_stat_label)
         stats_layout.addRow("Numero Dispositivi:", self.devices_stat_label)
+        stats_layout.addRow("Verifiche Scadute:", self.overdue_stat_label)
+        stats_layout.addRow("In Scadenza entro 7 gg:", self.due_soon_stat_label)
         
         # Colonna Destra: Scadenze
         scadenze_group = QGroupBox("Verifiche Scadute o in Scadenza (30 gg)")
@@ -49,12 +56,14 @@ class ControlPanelWidget(QWidget):
         """Carica e aggiorna i dati visualizzati nel pannello di controllo."""
         logging.info("Caricamento dati per il pannello di controllo...")
         try:
-            stats = services.get_stats()
-            self.customers_stat_label.setText(f"<b>{stats.get('customers', 0)}</b>")
-            self.devices_stat_label.setText(f"<b>{stats.get('devices', 0)}</b>")
+            summary = services.get_dashboard_summary()
+            self.customers_stat_label.setText(f"<b>{summary['customers']}</b>")
+            self.devices_stat_label.setText(f"<b>{summary['devices']}</b>")
+            self.overdue_stat_label.setText(f"<b>{summary['overdue']}</b>")
+            self.due_soon_stat_label.setText(f"<b>{summary['due_7_days'] - summary['overdue']}</b>")
             
             self.scadenze_list.clear()
-            devices_to_check = services.get_devices_needing_verification()
+            devices_to_check = services.get_devices_needing_verification(limit=self.DUE_LIST_LIMIT)
             if not devices_to_check:
                 self.scadenze_list.addItem("Nessuna verifica in scadenza.")
             else:
@@ -79,10 +88,16 @@ class ControlPanelWidget(QWidget):
 
                     self.scadenze_list.addItem(list_item)
                     self.scadenze_list.setItemWidget(list_item, label)
+
+                hidden = summary['due_total'] - len(devices_to_check)
+                if hidden > 0:
+                    self.scadenze_list.addItem(f"... e altri {hidden} dispositivi in scadenza.")
         except Exception as e:
             logging.error(f"Impossibile caricare i dati della dashboard: {e}", exc_info=True)
             self.customers_stat_label.setText("<b style='color:red;'>Errore</b>")
             self.devices_stat_label.setText("<b style='color:red;'>Errore</b>")
+            self.overdue_stat_label.setText("<b style='color:red;'>Errore</b>")
+            self.due_soon_stat_label.setText("<b style='color:red;'>Errore</b>")
 
 class TestRunnerWidget(QWidget):
     """
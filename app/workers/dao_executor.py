@@ -0,0 +1,181 @@
+# app/workers/dao_executor.py
+import logging
+import threading
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+import database
+
+
+class DaoRequest(QObject):
+    """
+    Richiesta restituita da DaoExecutor.submit. I segnali vengono emessi nel
+    thread della UI; una richiesta annullata (o superata da una nuova
+    richiesta sullo stesso canale) non emette più nulla.
+    """
+    finished = Signal(object)
+    failed = Signal(str)
+
+    def __init__(self, executor, key, channel):
+        super().__init__()
+        self._executor = executor
+        self.key = key
+        self.channel = channel
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self._executor._release(self)
+
+
+class _JobSignals(QObject):
+    # chiave della richiesta, risultato, eccezione (None se riuscita)
+    done = Signal(object, object, object)
+
+
+class _DaoJob(QRunnable):
+    """Esegue una funzione DAO in un thread del pool e ne notifica l'esito."""
+
+    def __init__(self, key, fn, args, kwargs, signals, is_wanted):
+        super().__init__()
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = signals
+        self.is_wanted = is_wanted
+
+    def run(self):
+        # Tutti i richiedenti hanno annullato prima dell'avvio: nessuna query
+        if not self.is_wanted(self.key):
+            return
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            logging.error(f"Errore nella lettura asincrona '{getattr(self.fn, '__name__', self.fn)}'.", exc_info=True)
+            self.signals.done.emit(self.key, None, e)
+            return
+        self.signals.done.emit(self.key, result, None)
+
+
+class DaoExecutor(QObject):
+    """
+    Esegue le letture del database (funzioni DAO o di servizio) su un
+    QThreadPool dedicato, così le viste che la usano (finestra principale,
+    elenco clienti e tabelle a pagine del gestore anagrafiche) non attendono
+    SQLite nel thread della UI. Restano sincrone le scritture e, nel gestore
+    anagrafiche, le letture per chiave che precedono una finestra di modifica
+    o un report: toccano poche righe e chi le chiama ne usa subito l'esito.
+
+    - Le richieste identiche (stessa funzione e argomenti) ancora in corso
+      vengono unite: la query parte una volta sola e il risultato arriva a
+      tutti i richiedenti. Non vengono unite richieste separate da una
+      scrittura sul database, per non consegnare dati letti prima di essa.
+    - Una richiesta su un 'channel' annulla la precedente dello stesso canale
+      (es. l'elenco dispositivi di una destinazione appena deselezionata).
+
+    I thread del pool non scadono, quindi ognuno riusa la propria connessione
+    persistente al database.
+    """
+
+    def __init__(self, max_threads=2, parent=None):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        self._pool.setExpiryTimeout(-1)
+        self._signals = _JobSignals()
+        self._signals.done.connect(self._on_job_done)
+        self._lock = threading.Lock()
+        self._jobs = {}       # chiave -> richieste in attesa del risultato
+        self._channels = {}   # canale -> ultima richiesta
+        self._data_generation = 0
+        self.coalesced_count = 0
+        database.add_change_listener(self._on_data_changed)
+
+    def submit(self, fn, *args, channel=None, on_result=None, on_error=None, **kwargs) -> DaoRequest:
+        """
+        Pianifica fn(*args, **kwargs) nel pool e restituisce una DaoRequest.
+        on_result / on_error, se indicati, vengono collegati ai segnali
+        finished / failed della richiesta.
+        """
+        with self._lock:
+            key = self._make_key(fn, args, kwargs)
+        request = DaoRequest(self, key, channel)
+        if on_result is not None:
+            request.finished.connect(on_result)
+        if on_error is not None:
+            request.failed.connect(on_error)
+
+        if channel is not None:
+            previous = self._channels.get(channel)
+            if previous is not None:
+                previous.cancel()
+            self._channels[channel] = request
+
+        with self._lock:
+            waiting = self._jobs.get(key)
+            if waiting is not None:
+                waiting.append(request)
+                self.coalesced_count += 1
+                return request
+            self._jobs[key] = [request]
+        self._pool.start(_DaoJob(key, fn, args, kwargs, self._signals, self._is_wanted))
+        return request
+
+    def cancel_channel(self, channel):
+        request = self._channels.get(channel)
+        if request is not None:
+            request.cancel()
+
+    def shutdown(self, timeout_ms=3000):
+        """Annulla le richieste non ancora avviate e attende quelle in corso."""
+        database.remove_change_listener(self._on_data_changed)
+        for request in list(self._channels.values()):
+            request.cancel()
+        self._pool.clear()
+        self._pool.waitForDone(timeout_ms)
+
+    # --- Interni ---
+
+    def _make_key(self, fn, args, kwargs):
+        try:
+            key = (fn, args, tuple(sorted(kwargs.items())), self._data_generation)
+            hash(key)
+            return key
+        except TypeError:
+            # Argomenti non hashable: richiesta mai unita ad altre
+            return object()
+
+    def _on_data_changed(self, _tables):
+        # Chiamato da qualsiasi thread dopo un commit
+        with self._lock:
+            self._data_generation += 1
+
+    def _is_wanted(self, key):
+        """Chiamata all'avvio del job: se nessuno attende più il risultato, lo rimuove."""
+        with self._lock:
+            if any(not request.cancelled for request in self._jobs.get(key, ())):
+                return True
+            self._jobs.pop(key, None)
+            return False
+
+    def _release(self, request):
+        with self._lock:
+            waiting = self._jobs.get(request.key)
+            if waiting is not None and request in waiting:
+                waiting.remove(request)
+        if self._channels.get(request.channel) is request:
+            del self._channels[request.channel]
+
+    def _on_job_done(self, key, result, error):
+        with self._lock:
+            waiting = self._jobs.pop(key, [])
+        for request in waiting:
+            if request.cancelled:
+                continue
+            if self._channels.get(request.channel) is request:
+                del self._channels[request.channel]
+            if error is not None:
+                request.failed.emit(str(error))
+            else:
+                request.finished.emit(result)
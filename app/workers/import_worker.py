@@ -5,6 +5,10 @@ from app import services  # Importa i servizi, NON il database
 import logging
 
 class ImportWorker(QObject):
+    # Righe inserite per transazione: abbastanza per evitare un commit per riga,
+    # abbastanza poche da aggiornare spesso l'avanzamento e permettere l'annullamento
+    BATCH_SIZE = 500
+
     progress_updated = Signal(int)
     finished = Signal(int, list, str) 
     error = Signal(str)
@@ -35,22 +39,37 @@ class ImportWorker(QObject):
             self.error.emit(f"Impossibile leggere il file:\n{e}")
             return
             
-        added_count, skipped_rows_details, total_rows = 0, [], len(df)
+        added_count, skipped_rows, total_rows = 0, [], len(df)
+        rows = list(df.iterrows())
 
-        for index, row in df.iterrows():
+        # Le righe vengono inserite a blocchi, ciascuno in un'unica transazione
+        for batch_start in range(0, total_rows, self.BATCH_SIZE):
             if self._is_cancelled:
                 break
+            batch_rows, records = [], []
+            for index, row in rows[batch_start:batch_start + self.BATCH_SIZE]:
+                try:
+                    # Passa il destination_id al servizio
+                    records.append(services.build_device_import_record(row.to_dict(), self.mapping, self.destination_id))
+                    batch_rows.append(index)
+                except ValueError as e:
+                    skipped_rows.append((index, str(e)))
+
             try:
-                # Passa il destination_id al servizio
-                services.process_device_import_row(row.to_dict(), self.mapping, self.destination_id) # Modificato
-                added_count += 1
-            except ValueError as e:
-                skipped_rows_details.append(f"Riga {index + 2}: {e}")
+                results = services.bulk_add_devices(records)
             except Exception as e:
-                logging.error(f"Errore imprevisto importando la riga {index + 2}", exc_info=True)
-                skipped_rows_details.append(f"Riga {index + 2}: Errore imprevisto ({e})")
-            
-            self.progress_updated.emit(int(((index + 1) / total_rows) * 100))
-        
+                logging.error(f"Errore imprevisto importando il blocco dalla riga {batch_start + 2}", exc_info=True)
+                results = [('skipped', f"Errore imprevisto ({e})")] * len(records)
+
+            for index, (outcome, message) in zip(batch_rows, results):
+                if outcome == 'skipped':
+                    skipped_rows.append((index, message))
+                else:
+                    added_count += 1
+
+            processed = min(batch_start + self.BATCH_SIZE, total_rows)
+            self.progress_updated.emit(int((processed / total_rows) * 100))
+
+        skipped_rows_details = [f"Riga {index + 2}: {message}" for index, message in sorted(skipped_rows)]
         status = "Annullato" if self._is_cancelled else "Completato"
-        self.finished.emit(added_count, skipped_rows_details, status)
\ No newline at end of file
+        self.finished.emit(added_count, skipped_rows_details, status)
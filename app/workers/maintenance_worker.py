@@ -0,0 +1,28 @@
+# app/workers/maintenance_worker.py
+import logging
+from PySide6.QtCore import QObject, Signal
+
+from app import maintenance_manager
+
+
+class MaintenanceWorker(QObject):
+    """Esegue la manutenzione del database locale in un thread separato."""
+    finished = Signal(list)
+    error = Signal(str)
+
+    def __init__(self, tasks=maintenance_manager.MAINTENANCE_TASKS):
+        super().__init__()
+        self.tasks = tasks
+        self._stop_requested = False
+
+    def stop(self):
+        """Chiede di non avviare altri passi (quello in corso viene completato)."""
+        self._stop_requested = True
+
+    def run(self):
+        try:
+            records = maintenance_manager.run_maintenance(self.tasks, should_stop=lambda: self._stop_requested)
+            self.finished.emit(records)
+        except Exception as e:
+            logging.error("Errore durante la manutenzione del database.", exc_info=True)
+            self.error.emit(str(e))
@@ -8,32 +8,47 @@ class SyncWorker(QObject):
     finished = Signal(str)
     error = Signal(str)
     conflict = Signal(list)
+    locked = Signal()
+    progress = Signal(dict)
 
-    def __init__(self, full_sync=False):
+    def __init__(self, full_sync=False, max_retries=3, background=False, reconcile=False):
         super().__init__()
         self.full_sync = full_sync
+        # Riconciliazione a hash invece della normale sincronizzazione
+        self.reconcile = reconcile
+        self.max_retries = max_retries
+        # In background non si mostrano avvisi all'utente
+        self.background = background
 
     def run(self):
         """
         Esegue la sincronizzazione in un thread separato,
         con una logica di re-tentativo in caso di errori.
         """
-        max_retries = 3      # Numero massimo di tentativi
+        max_retries = self.max_retries  # Numero massimo di tentativi
         retry_delay = 10     # Secondi di attesa tra un tentativo e l'altro
 
-        logging.info(f"SyncWorker avviato (Sincronizzazione Completa: {self.full_sync}).")
+        logging.info(f"SyncWorker avviato (Sincronizzazione Completa: {self.full_sync}, Background: {self.background}).")
 
         for attempt in range(max_retries):
             try:
                 logging.info(f"Tentativo di sincronizzazione {attempt + 1} di {max_retries}...")
                 
                 # Chiama la funzione principale che ora gestisce il locking
-                status, data = sync_manager.run_sync(full_sync=self.full_sync)
+                if self.reconcile:
+                    status, data = sync_manager.run_reconciliation(notify_if_locked=not self.background,
+                                                                   progress_callback=self.progress.emit)
+                else:
+                    status, data = sync_manager.run_sync(full_sync=self.full_sync,
+                                                         notify_if_locked=not self.background,
+                                                         progress_callback=self.progress.emit,
+                                                         allow_snapshot=not self.background)
                 
                 # Se 'status' è None, significa che la sync è bloccata.
                 # Il worker termina silenziosamente perché l'utente è già stato avvisato.
                 if status is None:
                     logging.warning("Sincronizzazione già in corso. Il worker si arresta.")
+                    self.locked.emit()
                     return
 
                 if status == "success":
@@ -1,13 +1,20 @@
 # database.py (Versione aggiornata con Gestore di Contesto)
 import sqlite3
+import copy
 import json
 import os
 import logging
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 import re
+import base64
+import threading
+import time
+import weakref
 import serial
 from app import config
 from app.data_models import VerificationProfile, Test, Limit
+from app import query_profiler
+from sql_scripts import split_sql_statements
 import uuid
 
 IGNORABLE_ERROR_SNIPPETS = (
@@ -19,47 +26,326 @@ IGNORABLE_ERROR_SNIPPETS = (
 DB_PATH = config.DB_PATH
 os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
+# Riconosce gli statement di scrittura ed estrae il nome della tabella coinvolta
+_WRITE_STATEMENT_RE = re.compile(
+    r'^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+["\[`]?(\w+)',
+    re.IGNORECASE,
+)
+
+# Callback invocate dopo ogni commit con l'insieme delle tabelle modificate
+_change_listeners = []
+
+def add_change_listener(callback):
+    """
+    Registra una funzione da chiamare dopo ogni commit che ha modificato dati.
+    La callback riceve un frozenset con i nomi delle tabelle scritte e può
+    essere invocata da qualsiasi thread.
+    """
+    if callback not in _change_listeners:
+        _change_listeners.append(callback)
+
+def remove_change_listener(callback):
+    """Rimuove una callback registrata con add_change_listener."""
+    if callback in _change_listeners:
+        _change_listeners.remove(callback)
+
+def _notify_change_listeners(tables):
+    for callback in list(_change_listeners):
+        try:
+            callback(frozenset(tables))
+        except Exception:
+            logging.error("Errore in un listener delle modifiche al database.", exc_info=True)
+
 # ==============================================================================
 # SEZIONE 1: GESTORE DI CONTESTO PER LA CONNESSIONE AL DATABASE
 # ==============================================================================
 
+_JOURNAL_MODES = {"WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"}
+_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+def apply_storage_profile(conn, settings=None):
+    """
+    Applica a una connessione il profilo di archiviazione definito in config.ini.
+    Con il journal WAL i lettori (es. worker di esportazione) non bloccano le
+    scritture e viceversa; 'synchronous=NORMAL' in WAL resta sicuro in caso di
+    crash dell'applicazione e riduce i fsync a ogni commit.
+    """
+    settings = settings or config.DATABASE_SETTINGS
+    journal_mode = settings['journal_mode'] if settings['journal_mode'] in _JOURNAL_MODES else "WAL"
+    synchronous = settings['synchronous'] if settings['synchronous'] in _SYNCHRONOUS_MODES else "NORMAL"
+
+    conn.execute(f"PRAGMA busy_timeout = {max(0, int(settings['busy_timeout_ms']))};")
+    try:
+        # Il journal_mode WAL è persistente nel file: dopo la prima volta è una semplice verifica
+        mode = conn.execute(f"PRAGMA journal_mode = {journal_mode};").fetchone()[0]
+        if mode.upper() != journal_mode:
+            logging.warning(f"Impossibile impostare journal_mode={journal_mode}, in uso: {mode}.")
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Impossibile impostare journal_mode={journal_mode}: {e}")
+    conn.execute(f"PRAGMA synchronous = {synchronous};")
+    # cache_size negativo = dimensione in KiB invece che in pagine
+    conn.execute(f"PRAGMA cache_size = {-max(0, int(settings['cache_size_mb'])) * 1024};")
+    conn.execute(f"PRAGMA mmap_size = {max(0, int(settings['mmap_size_mb'])) * 1024 * 1024};")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+
+def copy_database_file(source_path, dest_path):
+    """
+    Copia un database SQLite con la backup API: il risultato è consistente anche
+    in modalità WAL (comprende le pagine non ancora riportate nel file principale)
+    e, se la destinazione è in uso, viene sostituita in un'unica transazione.
+    """
+    source = sqlite3.connect(source_path)
+    try:
+        dest = sqlite3.connect(dest_path, timeout=config.DATABASE_SETTINGS['busy_timeout_ms'] / 1000)
+        try:
+            source.backup(dest)
+        finally:
+            dest.close()
+    finally:
+        source.close()
+
+class _ThreadConnection:
+    """Connessione persistente di un thread, con il relativo stato di transazione."""
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.generation = _pool_generation
+        self.depth = 0
+        self.written_tables = set()
+        # Con profile_queries attivo i cursori misurano ogni query (vedi app/query_profiler.py)
+        factory = query_profiler.ProfilingConnection if query_profiler.is_enabled() else sqlite3.Connection
+        self.conn = sqlite3.connect(db_name, check_same_thread=False, factory=factory)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON;")
+        apply_storage_profile(self.conn)
+        self.conn.set_trace_callback(self._track_statement)
+        logging.debug(f"Connessione persistente al database aperta per il thread {threading.current_thread().name}.")
+
+    def _track_statement(self, statement):
+        """Trace callback: annota le tabelle modificate dagli statement eseguiti."""
+        match = _WRITE_STATEMENT_RE.match(statement)
+        if match:
+            self.written_tables.add(match.group(1).lower())
+
+    def close(self):
+        try:
+            self.conn.close()
+        except sqlite3.Error:
+            logging.warning("Errore durante la chiusura di una connessione al database.", exc_info=True)
+
+
+_thread_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_generation = 0
+_all_connections = weakref.WeakSet()
+
+def _get_thread_connection(db_name, acquire=False):
+    """
+    Restituisce la connessione persistente del thread corrente, riaprendola se
+    il pool è stato chiuso. Con acquire=True la connessione viene anche segnata
+    come in uso (depth + 1) sotto _pool_lock, nella stessa sezione critica in
+    cui close_all_connections la esamina: non può quindi essere chiusa tra il
+    controllo della generazione e il suo utilizzo.
+    """
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    pooled = connections.get(db_name)
+    if pooled is not None and pooled.depth > 0:
+        # Già in uso da questo thread: close_all_connections non la chiude
+        if acquire:
+            pooled.depth += 1
+        return pooled
+    with _pool_lock:
+        if pooled is not None and pooled.generation != _pool_generation:
+            # Il pool è stato chiuso (es. sostituzione del file): si riapre
+            pooled.close()
+            pooled = None
+        if pooled is None:
+            pooled = _ThreadConnection(db_name)
+            connections[db_name] = pooled
+            _all_connections.add(pooled)
+        if acquire:
+            pooled.depth += 1
+    return pooled
+
+def _release_thread_connection(pooled, db_name):
+    """Segna come libera la connessione; se nel frattempo il pool è stato chiuso, la chiude."""
+    with _pool_lock:
+        pooled.depth -= 1
+        if pooled.generation != _pool_generation:
+            pooled.close()
+            _thread_local.connections.pop(db_name, None)
+
+def close_all_connections():
+    """
+    Chiude le connessioni persistenti di tutti i thread (es. prima di sostituire
+    il file del database). I thread le riapriranno al prossimo utilizzo.
+    """
+    global _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        for pooled in list(_all_connections):
+            if pooled.depth == 0:
+                pooled.close()
+    with _data_version_lock:
+        _close_data_version_connection()
+    logging.info("Connessioni persistenti al database chiuse.")
+
+def interrupt_all_connections():
+    """
+    Interrompe le query in corso su tutte le connessioni persistenti (es. alla
+    chiusura dell'applicazione): lo statement interrotto fallisce con
+    sqlite3.OperationalError e la sua transazione viene annullata.
+    """
+    with _pool_lock:
+        for pooled in list(_all_connections):
+            try:
+                pooled.conn.interrupt()
+            except sqlite3.Error:
+                pass
+
+# Connessione dedicata alla lettura di PRAGMA data_version, che cambia a ogni
+# commit di un'altra connessione. I commit di questo processo vengono
+# "riconosciuti" subito dopo il commit (_acknowledge_local_commit), perché
+# sono già notificati per tabella ai listener: restano così visibili solo le
+# modifiche fatte fuori dal processo e la sostituzione del file.
+_data_version_lock = threading.Lock()
+_data_version_conn = None       # (percorso, generazione del pool, connessione)
+_data_version_seen = None
+
+def _read_data_version():
+    """Da chiamare con _data_version_lock acquisito."""
+    global _data_version_conn
+    db_name = DB_PATH
+    if _data_version_conn is None or _data_version_conn[:2] != (db_name, _pool_generation):
+        _close_data_version_connection()
+        _data_version_conn = (db_name, _pool_generation, sqlite3.connect(db_name, check_same_thread=False))
+    return db_name, _pool_generation, _data_version_conn[2].execute("PRAGMA data_version").fetchone()[0]
+
+def _close_data_version_connection():
+    """Da chiamare con _data_version_lock acquisito."""
+    global _data_version_conn
+    if _data_version_conn is not None:
+        try:
+            _data_version_conn[2].close()
+        except sqlite3.Error:
+            logging.warning("Errore durante la chiusura della connessione di controllo.", exc_info=True)
+        _data_version_conn = None
+
+def _acknowledge_local_commit():
+    global _data_version_seen
+    with _data_version_lock:
+        if _data_version_seen is not None:
+            _data_version_seen = _read_data_version()
+
+def has_external_changes() -> bool:
+    """
+    True se dall'ultima chiamata il database è stato modificato fuori da questo
+    processo o il file è stato sostituito (snapshot, ripristino backup).
+    Le scritture delle DAO di questo processo, in qualunque thread, non contano:
+    vengono notificate per tabella tramite add_change_listener.
+    """
+    global _data_version_seen
+    with _data_version_lock:
+        version = _read_data_version()
+        changed = version != _data_version_seen
+        _data_version_seen = version
+        return changed
+
 class DatabaseConnection:
     """
     Un gestore di contesto robusto per la connessione al database SQLite.
-    Gestisce automaticamente l'apertura, la chiusura, il commit e il rollback.
+    Ogni thread riutilizza una propria connessione persistente (apertura e PRAGMA
+    una sola volta per thread); il blocco 'with' delimita la transazione:
+    commit all'uscita, rollback in caso di eccezione. I blocchi annidati nello
+    stesso thread usano un SAVEPOINT, così un errore interno annulla solo la
+    propria parte.
     """
-    def __init__(self, db_name=DB_PATH):
-        self.db_name = db_name
+    def __init__(self, db_name=None):
+        self.db_name = db_name or DB_PATH
         self.conn = None
+        self._pooled = None
+        self._savepoint = None
 
     def __enter__(self):
         """Metodo chiamato quando si entra nel blocco 'with'."""
         try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.conn.row_factory = sqlite3.Row
-            self.conn.execute("PRAGMA foreign_keys = ON;")
-            logging.info("Connessione al database aperta.")
-            return self.conn
+            self._pooled = _get_thread_connection(self.db_name, acquire=True)
         except sqlite3.Error as e:
             logging.error(f"Errore di connessione al database: {e}", exc_info=True)
             raise
+        self.conn = self._pooled.conn
+        outer_depth = self._pooled.depth - 1
+        if outer_depth > 0:
+            self._savepoint = f"sp_{outer_depth}"
+            try:
+                if not self.conn.in_transaction:
+                    # sqlite3 apre la transazione solo al primo DML: se il blocco
+                    # esterno non ha ancora scritto, il SAVEPOINT aprirebbe una
+                    # transazione propria e il suo RELEASE la confermerebbe subito,
+                    # sottraendola al rollback del blocco esterno.
+                    self.conn.execute("BEGIN")
+                self.conn.execute(f"SAVEPOINT {self._savepoint}")
+            except sqlite3.Error:
+                self._pooled.depth -= 1
+                raise
+        return self.conn
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Metodo chiamato quando si esce dal blocco 'with'."""
-        if exc_type:
-            logging.warning(f"Si è verificata un'eccezione, transazione DB annullata (rollback). Errore: {exc_val}")
-            if self.conn is not None:
-                self.conn.rollback()
-        else:
-            logging.info("Transazione DB completata, modifiche confermate (commit).")
-            if self.conn is not None:
+        pooled = self._pooled
+
+        if self._savepoint is not None:
+            # Blocco annidato: conferma o annulla solo il proprio savepoint
+            try:
+                if exc_type:
+                    self.conn.execute(f"ROLLBACK TO {self._savepoint}")
+                self.conn.execute(f"RELEASE {self._savepoint}")
+            except sqlite3.Error:
+                # Savepoint in uno stato non recuperabile: si annulla l'intera
+                # transazione, che il blocco esterno non potrebbe più confermare
+                logging.error(f"Errore sul savepoint {self._savepoint}, transazione DB annullata (rollback).", exc_info=True)
+                self._rollback(pooled)
+                raise
+            finally:
+                pooled.depth -= 1
+            return False
+
+        try:
+            if exc_type:
+                logging.warning(f"Si è verificata un'eccezione, transazione DB annullata (rollback). Errore: {exc_val}")
+                self._rollback(pooled)
+                # Uno script interrotto potrebbe aver lasciato i vincoli disattivati
+                self.conn.execute("PRAGMA foreign_keys = ON;")
+                return False # Non sopprime eventuali eccezioni
+
+            try:
                 self.conn.commit()
-        
-        if self.conn is not None:
-            self.conn.close()
-        logging.info("Connessione al database chiusa.")
+            except sqlite3.Error:
+                # La connessione è persistente: una transazione rimasta aperta
+                # verrebbe confermata dal blocco successivo di questo thread
+                logging.error("Commit non riuscito, transazione DB annullata (rollback).", exc_info=True)
+                self._rollback(pooled)
+                raise
+            logging.debug("Transazione DB completata, modifiche confermate (commit).")
+        finally:
+            # Il pool potrebbe essere stato chiuso mentre la connessione era in uso
+            _release_thread_connection(pooled, self.db_name)
+
+        written_tables, pooled.written_tables = pooled.written_tables, set()
+        if written_tables:
+            _acknowledge_local_commit()
+            _notify_change_listeners(written_tables)
         return False # Non sopprime eventuali eccezioni
 
+    def _rollback(self, pooled):
+        """Annulla la transazione aperta e dimentica le tabelle modificate al suo interno."""
+        pooled.written_tables = set()
+        try:
+            self.conn.rollback()
+        except sqlite3.Error:
+            logging.error("Rollback non riuscito sulla connessione persistente.", exc_info=True)
+
 # ==============================================================================
 # SEZIONE 2: MIGRAZIONE DEL DATABASE
 # ==============================================================================
@@ -69,7 +355,8 @@ def _execute_sql_script_compat(conn, sql_script: str) -> None:
     Esegue uno script SQL rendendolo compatibile con versioni SQLite
     che non supportano 'ADD COLUMN IF NOT EXISTS'.
     - Rimuove 'IF NOT EXISTS' solo nei contesti 'ADD COLUMN'
-    - Esegue statement singolarmente
+    - Esegue statement singolarmente (i corpi BEGIN ... END dei trigger
+      restano interi)
     - Ignora errori idempotenti (colonna già esistente / oggetto già esistente)
     """
     # 1) normalizza gli 'ADD COLUMN IF NOT EXISTS' -> 'ADD COLUMN'
@@ -79,10 +366,9 @@ def _execute_sql_script_compat(conn, sql_script: str) -> None:
         sql_script,
     )
 
-    # 2) split molto semplice per ';' (gli script di migrazione sono lineari)
-    statements = [s.strip() for s in script.split(';') if s.strip()]
+    # 2) split in statement completi (i corpi BEGIN ... END dei trigger restano interi)
     cur = conn.cursor()
-    for stmt in statements:
+    for stmt in split_sql_statements(script):
         try:
             cur.execute(stmt)
         except sqlite3.OperationalError as e:
@@ -94,50 +380,109 @@ def _execute_sql_script_compat(conn, sql_script: str) -> None:
             raise
     cur.close()
 
-def migrate_database():
-    """Applica le migrazioni SQL al database in modo sequenziale."""
+def _list_migrations(migrations_path):
+    """Migrazioni disponibili come lista ordinata di (versione, nome del file)."""
+    migrations = []
+    for m_file in os.listdir(migrations_path):
+        if not m_file.endswith('.sql'):
+            continue
+        try:
+            migrations.append((int(m_file.split('_')[0]), m_file))
+        except (ValueError, IndexError):
+            logging.warning(f"File di migrazione '{m_file}' non nominato correttamente. Ignorato.")
+    return sorted(migrations)
+
+def _read_schema_version(conn) -> int:
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL);")
+    result = conn.execute("SELECT version FROM schema_version;").fetchone()
+    return result['version'] if result else 0
+
+def migrate_database(progress_callback=None) -> list:
+    """
+    Applica le migrazioni SQL al database in modo sequenziale.
+
+    Args:
+        progress_callback: funzione opzionale chiamata prima di ogni migrazione
+                           con (indice, totale, nome del file).
+
+    Returns:
+        Lista di (nome del file, durata in ms) delle migrazioni applicate.
+        Al termine PRAGMA user_version viene allineato alla versione dello
+        schema: è il controllo veloce usato da ensure_database_schema.
+    """
     migrations_path = os.path.join(config.BASE_DIR, 'migrations') 
     if not os.path.isdir(migrations_path):
         logging.info(f"Cartella delle migrazioni '{migrations_path}' non trovata. Migrazione saltata.")
-        return
+        return []
 
+    applied = []
     try:
         with DatabaseConnection() as conn:
-            conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL);")
-            result = conn.execute("SELECT version FROM schema_version;").fetchone()
-            current_version = result['version'] if result else 0
-        
-        migration_files = sorted([f for f in os.listdir(migrations_path) if f.endswith('.sql')])
-
-        for m_file in migration_files:
-            try:
-                file_version = int(m_file.split('_')[0])
-            except (ValueError, IndexError):
-                logging.warning(f"File di migrazione '{m_file}' non nominato correttamente. Ignorato.")
-                continue
+            current_version = _read_schema_version(conn)
+
+        pending = [(v, f) for v, f in _list_migrations(migrations_path) if v > current_version]
+        for index, (file_version, m_file) in enumerate(pending):
+            if progress_callback is not None:
+                progress_callback(index, len(pending), m_file)
+            logging.info(f"Applicando migrazione: {m_file}...")
+            start = time.perf_counter()
+            with open(os.path.join(migrations_path, m_file), 'r', encoding='utf-8') as f:
+                sql_script = f.read()
+
+            with DatabaseConnection() as conn:
+                try:
+                    _execute_sql_script_compat(conn, sql_script)
+                except Exception:
+                    logging.critical("Errore critico durante la migrazione del database.", exc_info=True)
+                    raise
+                # Aggiorna la versione dello schema
+                if current_version == 0 and file_version == 1:
+                    conn.execute("INSERT INTO schema_version (version) VALUES (?)", (file_version,))
+                else:
+                    conn.execute("UPDATE schema_version SET version = ?", (file_version,))
+
+            current_version = file_version
+            elapsed_ms = int((time.perf_counter() - start) * 1000)
+            applied.append((m_file, elapsed_ms))
+            logging.info(f"Database aggiornato alla versione {current_version} ({m_file}: {elapsed_ms} ms).")
 
-            if file_version > current_version:
-                logging.info(f"Applicando migrazione: {m_file}...")
-                with open(os.path.join(migrations_path, m_file), 'r', encoding='utf-8') as f:
-                    sql_script = f.read()
-                
-                with DatabaseConnection() as conn:
-                    try:
-                        _execute_sql_script_compat(conn, sql_script)
-                    except Exception:
-                        logging.critical("Errore critico durante la migrazione del database.", exc_info=True)
-                        raise
-                    # Aggiorna la versione dello schema
-                    if current_version == 0 and file_version == 1:
-                        conn.execute("INSERT INTO schema_version (version) VALUES (?)", (file_version,))
-                    else:
-                        conn.execute("UPDATE schema_version SET version = ?", (file_version,))
-                
-                current_version = file_version
-                logging.info(f"Database aggiornato alla versione {current_version}.")
-    except Exception as e:
+        with DatabaseConnection() as conn:
+            conn.execute(f"PRAGMA user_version = {int(current_version)}")
+    except Exception:
         logging.critical("Errore critico durante la migrazione del database.", exc_info=True)
         raise
+    if progress_callback is not None and applied:
+        progress_callback(len(applied), len(applied), None)
+    return applied
+
+def is_schema_current() -> bool:
+    """
+    Controllo veloce all'avvio: PRAGMA user_version (nell'intestazione del
+    file) coincide con l'ultima migrazione disponibile. Basta l'elenco dei
+    nomi dei file, senza leggerli né interrogare schema_version.
+    """
+    with DatabaseConnection() as conn:
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    return user_version == get_latest_migration_version()
+
+def ensure_database_schema(progress_callback=None) -> list:
+    """
+    Fase di avvio: porta il database all'ultima versione dello schema.
+    Se il controllo veloce (is_schema_current) riesce non viene fatto altro;
+    altrimenti vengono applicate le migrazioni mancanti, con avanzamento e
+    durate come in migrate_database. Database creati o copiati da versioni
+    precedenti (user_version = 0) passano una volta dal percorso completo.
+    """
+    start = time.perf_counter()
+    if is_schema_current():
+        logging.info(f"Schema del database già aggiornato (controllo in {(time.perf_counter() - start) * 1000:.1f} ms).")
+        return []
+    applied = migrate_database(progress_callback)
+    total_ms = int((time.perf_counter() - start) * 1000)
+    if applied:
+        logging.info(f"Migrazioni applicate all'avvio: {len(applied)} in {total_ms} ms "
+                     f"({', '.join(f'{name} {ms} ms' for name, ms in applied)}).")
+    return applied
 
 # ==============================================================================
 # SEZIONE 3: FUNZIONI DI MANIPOLAZIONE DATI (DAO)
@@ -156,6 +501,39 @@ def _decode_json_fields(row, fields_to_decode):
             data[new_key] = []
     return data
 
+# --- Helper per la ricerca full-text (FTS5) ---
+
+# Pesi bm25 per le colonne di devices_fts (stesso ordine della migrazione 008):
+# un riscontro su matricola o inventario conta più di uno sul nome del cliente.
+_DEVICES_FTS_WEIGHTS = "10.0, 8.0, 8.0, 4.0, 3.0, 2.0, 1.0, 1.0, 1.0"
+
+def fts_match_expression(search_term, columns=None):
+    """
+    Converte il testo digitato dall'utente in un'espressione MATCH FTS5:
+    ogni parola diventa una ricerca per prefisso e devono essere presenti tutte
+    ('sn 12' -> '"sn"* AND "12"*'). Con 'columns' la ricerca è limitata a
+    quelle colonne. Restituisce None se il testo non contiene parole.
+    """
+    tokens = re.findall(r"\w+", search_term or "")
+    if not tokens:
+        return None
+    expression = " AND ".join(f'"{token}"*' for token in tokens)
+    if columns:
+        expression = "{" + " ".join(columns) + "} : (" + expression + ")"
+    return expression
+
+def _devices_fts_filter(search_query, columns, alias=""):
+    """Condizione SQL e parametri per filtrare i dispositivi tramite devices_fts."""
+    expression = fts_match_expression(search_query, columns)
+    if expression is None:
+        return "", []
+    return f" AND {alias}id IN (SELECT rowid FROM devices_fts WHERE devices_fts MATCH ?)", [expression]
+
+# Colonne calcolate localmente (trigger), da non inviare al server
+LOCAL_ONLY_COLUMNS = {
+    "devices": ("last_verification_id", "last_verification_date", "last_outcome"),
+}
+
 # --- Gestione Dispositivi (Devices) ---
 
 def find_device_by_serial(serial_number: str, include_deleted: bool = False):
@@ -193,6 +571,89 @@ def add_device(uuid, destination_id, serial, desc, mfg, model, department, appli
         )
         conn.execute(query, params)
 
+def bulk_add_devices(devices: list, timestamp: str) -> list:
+    """
+    Inserisce un blocco di dispositivi (es. un'importazione da file) in
+    un'unica transazione, con executemany invece di una transazione per riga.
+
+    Ogni elemento è un dict con le chiavi di add_device (uuid, destination_id,
+    serial, desc, mfg, model, department, applied_parts, customer_inv, ams_inv,
+    verification_interval, default_profile_key) e la matricola già normalizzata.
+    Come per l'inserimento singolo, una matricola usata da un dispositivo attivo
+    viene rifiutata e una appartenente a un dispositivo eliminato lo riattiva;
+    il controllo tiene conto anche delle righe precedenti dello stesso blocco.
+
+    Returns:
+        Lista allineata a 'devices' di tuple (esito, messaggio), con esito
+        'added', 'reactivated' o 'skipped' (messaggio solo per 'skipped').
+    """
+    results = []
+    inserts, reactivations = [], []
+    # Matricole già usate nel blocco: True se attive, altrimenti id del dispositivo eliminato
+    seen_serials = {}
+
+    with DatabaseConnection() as conn:
+        for device in devices:
+            try:
+                interval = int(device['verification_interval']) if device.get('verification_interval') not in [None, "Nessuno"] else None
+            except (TypeError, ValueError) as e:
+                results.append(('skipped', f"Intervallo di verifica non valido ({e})."))
+                continue
+
+            serial = device.get('serial')
+            state = None
+            if serial:
+                if serial in seen_serials:
+                    state = seen_serials[serial]
+                else:
+                    # Stessa logica di device_exists / find_device_by_serial, un indice per matricola
+                    rows = conn.execute(
+                        "SELECT id, is_deleted FROM devices WHERE serial_number = ? AND status = 'active' ORDER BY id",
+                        (serial,)).fetchall()
+                    if any(not row['is_deleted'] for row in rows):
+                        state = True
+                    elif rows:
+                        state = rows[0]['id']
+                if state is True:
+                    results.append(('skipped', f"Il numero di serie '{serial}' è già utilizzato da un altro dispositivo attivo."))
+                    continue
+                seen_serials[serial] = True
+
+            pa_json = json.dumps([pa if isinstance(pa, dict) else pa.__dict__ for pa in device.get('applied_parts') or []])
+            values = (serial, device['destination_id'], device['desc'], device.get('mfg'), device.get('model'),
+                      device.get('department'), pa_json, device.get('customer_inv'), device.get('ams_inv'),
+                      interval, device.get('default_profile_key'), timestamp)
+            if state is not None:
+                logging.warning(f"Dispositivo S/N {serial} trovato come eliminato localmente. Riattivazione in corso.")
+                reactivations.append(values + (state,))
+                results.append(('reactivated', None))
+            else:
+                inserts.append((device['uuid'],) + values)
+                results.append(('added', None))
+
+        if inserts:
+            conn.executemany("""
+                INSERT INTO devices (
+                    uuid, serial_number, destination_id, description, manufacturer,
+                    model, department, applied_parts_json, customer_inventory,
+                    ams_inventory, verification_interval, default_profile_key,
+                    last_modified, is_synced, is_deleted, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, 'active')
+            """, inserts)
+        if reactivations:
+            conn.executemany("""
+                UPDATE devices SET
+                    serial_number = ?, destination_id = ?, description = ?,
+                    manufacturer = ?, model = ?, department = ?,
+                    applied_parts_json = ?, customer_inventory = ?,
+                    ams_inventory = ?, verification_interval = ?, default_profile_key = ?,
+                    last_modified = ?, is_synced = 0, is_deleted = 0
+                WHERE id = ?
+            """, reactivations)
+    logging.info(f"Inserimento massivo: {len(inserts)} dispositivi aggiunti, {len(reactivations)} riattivati, "
+                 f"{len(devices) - len(inserts) - len(reactivations)} scartati.")
+    return results
+
 def update_device(
     dev_id, destination_id, serial, desc, mfg, model, department,
     applied_parts, customer_inv, ams_inv,
@@ -270,8 +731,9 @@ def get_devices_for_destination(destination_id: int, search_query=None):
         query = "SELECT * FROM devices WHERE destination_id = ? AND is_deleted = 0 AND status = 'active'"
         params = [destination_id]
         if search_query:
-            query += " AND (description LIKE ? OR serial_number LIKE ? OR model LIKE ?)"
-            params.extend([f"%{search_query}%"] * 3)
+            condition, search_params = _devices_fts_filter(search_query, ("description", "serial_number", "model"))
+            query += condition
+            params.extend(search_params)
         query += " ORDER BY description"
         return conn.execute(query, params).fetchall()
 
@@ -281,8 +743,10 @@ def get_devices_for_destination_manager(destination_id: int, search_query=None):
         query = "SELECT * FROM devices WHERE destination_id = ? AND is_deleted = 0" # No status filter
         params = [destination_id]
         if search_query:
-            query += " AND (description LIKE ? OR serial_number LIKE ? OR model LIKE ? OR AMS_inventory LIKE ? OR Customer_inventory LIKE ?)"
-            params.extend([f"%{search_query}%"] * 5)
+            condition, search_params = _devices_fts_filter(
+                search_query, ("description", "serial_number", "model", "ams_inventory", "customer_inventory"))
+            query += condition
+            params.extend(search_params)
         query += " ORDER BY status, description" # Ordina per stato
         return conn.execute(query, params).fetchall()
 
@@ -323,19 +787,27 @@ def bulk_update_device_description(old_description: str, new_description: str, t
         return cursor.rowcount
 
 
+def _customer_devices_filter(customer_id, search_query=None):
+    """
+    Clausole FROM/WHERE (e parametri) dei dispositivi attivi di un cliente,
+    condivise da elenchi, pagine e conteggi.
+    """
+    query = """
+        FROM devices d
+        JOIN destinations dest ON d.destination_id = dest.id
+        WHERE dest.customer_id = ? AND d.is_deleted = 0
+    """
+    params = [customer_id]
+    if search_query:
+        condition, search_params = _devices_fts_filter(search_query, ("description", "serial_number", "model"), "d.")
+        query += condition
+        params.extend(search_params)
+    return query, params
+
 def get_devices_for_customer(customer_id, search_query=None):
+    filter_sql, params = _customer_devices_filter(customer_id, search_query)
     with DatabaseConnection() as conn:
-        query = """
-            SELECT d.* FROM devices d
-            JOIN destinations dest ON d.destination_id = dest.id
-            WHERE dest.customer_id = ? AND d.is_deleted = 0
-        """
-        params = [customer_id]
-        if search_query:
-            query += " AND (d.description LIKE ? OR d.serial_number LIKE ? OR d.model LIKE ?)"
-            params.extend([f"%{search_query}%"]*3)
-        query += " ORDER BY d.description"
-        return conn.execute(query, params).fetchall()
+        return conn.execute("SELECT d.* " + filter_sql + " ORDER BY d.description", params).fetchall()
 
 def get_device_by_id(device_id: int):
     with DatabaseConnection() as conn:
@@ -347,17 +819,17 @@ def device_exists(serial_number: str):
     with DatabaseConnection() as conn:
         return conn.execute("SELECT id FROM devices WHERE serial_number = ? AND is_deleted = 0 AND status = 'active'", (serial_number,)).fetchone() is not None
 
-def get_device_count_for_customer(customer_id):
+def get_device_count_for_customer(customer_id, search_query=None):
+    filter_sql, params = _customer_devices_filter(customer_id, search_query)
     with DatabaseConnection() as conn:
-        return conn.execute("""
-            SELECT COUNT(d.id)
-            FROM devices d
-            JOIN destinations dest ON d.destination_id = dest.id
-            WHERE dest.customer_id = ? AND d.is_deleted = 0
-        """, (customer_id,)).fetchone()[0]
+        return conn.execute("SELECT COUNT(d.id) " + filter_sql, params).fetchone()[0]
 
-def get_devices_needing_verification(days_in_future=30):
-    """Recupera i dispositivi ATTIVI con verifica scaduta o in scadenza."""
+def get_devices_needing_verification(days_in_future=30, limit=None):
+    """
+    Recupera i dispositivi ATTIVI con verifica scaduta o in scadenza, dalla
+    scadenza più vecchia. Con 'limit' legge solo i primi dall'indice
+    idx_devices_next_verification_date (il totale è in get_dashboard_summary).
+    """
     from datetime import date, timedelta
     future_date = date.today() + timedelta(days=days_in_future)
     
@@ -372,28 +844,76 @@ def get_devices_needing_verification(days_in_future=30):
             AND d.is_deleted = 0 AND d.status = 'active'
             ORDER BY d.next_verification_date ASC
         """
-        return conn.execute(query, (future_date.strftime('%Y-%m-%d'),)).fetchall()
+        params = [future_date.strftime('%Y-%m-%d')]
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        return conn.execute(query, params).fetchall()
+
+def get_dashboard_summary(days_in_future=30) -> dict:
+    """
+    Riepilogo del pannello di controllo letto dalle tabelle mantenute dai
+    trigger (migrazione 013): numero di clienti e dispositivi e dispositivi
+    attivi con verifica scaduta, in scadenza entro 7 giorni ed entro
+    'days_in_future' giorni (comprese le scadute). Le scadenze si sommano su
+    dashboard_due_dates, che ha una riga per data e non per dispositivo.
+    """
+    today = date.today()
+    week = (today + timedelta(days=7)).isoformat()
+    horizon = (today + timedelta(days=days_in_future)).isoformat()
+    with DatabaseConnection() as conn:
+        counters = {row['name']: row['value'] for row in conn.execute("SELECT name, value FROM dashboard_counters")}
+        due = conn.execute("""
+            SELECT COALESCE(SUM(CASE WHEN due_date < :today THEN device_count END), 0) AS overdue,
+                   COALESCE(SUM(CASE WHEN due_date <= :week THEN device_count END), 0) AS due_7_days,
+                   COALESCE(SUM(device_count), 0) AS due_total
+            FROM dashboard_due_dates
+            WHERE due_date <= :horizon
+        """, {"today": today.isoformat(), "week": week, "horizon": horizon}).fetchone()
+    return {
+        "customers": counters.get('customers', 0),
+        "devices": counters.get('devices', 0),
+        "overdue": due['overdue'],
+        "due_7_days": due['due_7_days'],
+        "due_total": due['due_total'],
+        "days_in_future": days_in_future,
+    }
+
+def rebuild_dashboard_summary():
+    """
+    Ricalcola i contatori e le scadenze della dashboard dai dati (es. dopo
+    l'installazione di uno snapshot, che non passa dai trigger).
+    """
+    with DatabaseConnection() as conn:
+        conn.execute("DELETE FROM dashboard_counters")
+        conn.execute("INSERT INTO dashboard_counters (name, value) SELECT name, value FROM dashboard_counters_source")
+        conn.execute("DELETE FROM dashboard_due_dates")
+        conn.execute("INSERT INTO dashboard_due_dates (due_date, device_count) "
+                     "SELECT due_date, device_count FROM dashboard_due_dates_source")
+    logging.info("Riepilogo della dashboard ricostruito.")
     
 def search_device_globally(search_term):
     """
     Cerca un dispositivo in tutto il database e restituisce anche il nome del cliente
     a cui appartiene, navigando attraverso le destinazioni.
+    La ricerca usa l'indice full-text devices_fts (matricola, inventari,
+    descrizione, modello, marca, reparto, destinazione e cliente), per prefisso,
+    con i risultati più pertinenti per primi.
     """
+    expression = fts_match_expression(search_term)
+    if expression is None:
+        return []
     with DatabaseConnection() as conn:
-        query = """
+        query = f"""
             SELECT d.*, c.name as customer_name 
-            FROM devices d
+            FROM devices_fts
+            JOIN devices d ON d.id = devices_fts.rowid
             JOIN destinations dest ON d.destination_id = dest.id
             JOIN customers c ON dest.customer_id = c.id
-            WHERE (
-                d.serial_number LIKE ? OR 
-                d.ams_inventory LIKE ? OR 
-                d.description LIKE ? OR 
-                d.model LIKE ?
-            ) AND d.is_deleted = 0
+            WHERE devices_fts MATCH ? AND d.is_deleted = 0
+            ORDER BY bm25(devices_fts, {_DEVICES_FTS_WEIGHTS}), d.description
         """
-        like_term = f"%{search_term}%"
-        rows = conn.execute(query, (like_term, like_term, like_term, like_term)).fetchall()
+        rows = conn.execute(query, (expression,)).fetchall()
         
         if not rows:
             return []
@@ -405,6 +925,8 @@ def get_devices_with_last_verification_for_destination(destination_id: int):
     """
     Recupera tutti i dispositivi di una destinazione con i dati della loro ultima verifica.
     Ora include l'inventario cliente e il nome della destinazione.
+    L'ultima verifica è quella indicata da devices.last_verification_id,
+    mantenuta dai trigger sulle verifiche.
     """
     with DatabaseConnection() as conn:
         
@@ -421,23 +943,17 @@ def get_devices_with_last_verification_for_destination(destination_id: int):
                 d.model AS "MODELLO",
                 d.serial_number AS "MATRICOLA",
                 d.department AS "REPARTO",
-                v.verification_date AS "DATA",
+                d.last_verification_date AS "DATA",
                 v.technician_name AS "TECNICO",
                 CASE
-                    WHEN v.overall_status = "PASSATO" THEN "CONFORME"
-                    WHEN v.overall_status = "FALLITO" THEN "NON CONFORME"
+                    WHEN d.last_outcome = "PASSATO" THEN "CONFORME"
+                    WHEN d.last_outcome = "FALLITO" THEN "NON CONFORME"
                 END AS "ESITO",
                 dest.name AS "DESTINAZIONE" 
             FROM
                 devices d
             LEFT JOIN
-                (
-                    SELECT
-                        *,
-                        ROW_NUMBER() OVER(PARTITION BY device_id ORDER BY verification_date DESC) as rn
-                    FROM verifications
-                    WHERE is_deleted = 0
-                ) v ON d.id = v.device_id AND v.rn = 1
+                verifications v ON v.id = d.last_verification_id
             JOIN
                 destinations dest ON d.destination_id = dest.id
             WHERE
@@ -454,23 +970,14 @@ def get_devices_with_verifications_for_destination_by_date_range(destination_id:
     verifica PIÙ RECENTE per ciascun dispositivo.
     """
     with DatabaseConnection() as conn:
-        # --- INIZIO QUERY CORRETTA ---
-        # La query ora recupera TUTTI i dispositivi della destinazione.
-        # Poi, tramite un LEFT JOIN su una sottoquery (RankedVerifications), associa
-        # i dati della verifica PIÙ RECENTE eseguita nell'intervallo di date.
+        # La query recupera TUTTI i dispositivi della destinazione e, per ognuno,
+        # l'id della verifica PIÙ RECENTE nell'intervallo di date con una
+        # sottoquery correlata che legge l'indice (device_id, verification_date).
+        # Se l'ultima verifica in assoluto cade nell'intervallo è già quella
+        # denormalizzata su devices e la sottoquery non viene eseguita.
         # Se un dispositivo non ha verifiche nel periodo, i campi relativi (DATA, TECNICO, ESITO)
         # risulteranno vuoti, ma il dispositivo sarà comunque presente una sola volta.
         query = """
-            WITH RankedVerifications AS (
-                SELECT
-                    v.*,
-                    ROW_NUMBER() OVER(PARTITION BY v.device_id ORDER BY v.verification_date DESC) as rn
-                FROM
-                    verifications v
-                WHERE
-                    v.is_deleted = 0
-                    AND v.verification_date BETWEEN ? AND ?
-            )
             SELECT
                 CASE 
                     WHEN d.status = "active" THEN "IN USO"
@@ -495,14 +1002,23 @@ def get_devices_with_verifications_for_destination_by_date_range(destination_id:
             JOIN 
                 destinations dest ON d.destination_id = dest.id
             LEFT JOIN 
-                RankedVerifications rv ON d.id = rv.device_id AND rv.rn = 1
+                verifications rv ON rv.id = CASE
+                    WHEN d.last_verification_date >= :start AND d.last_verification_date < :end THEN d.last_verification_id
+                    ELSE (
+                        SELECT v.id FROM verifications v
+                        WHERE v.device_id = d.id AND v.is_deleted = 0
+                          AND v.verification_date >= :start AND v.verification_date < :end
+                        ORDER BY v.verification_date DESC, v.id DESC
+                        LIMIT 1
+                    )
+                END
             WHERE 
-                d.destination_id = ? AND d.is_deleted = 0
+                d.destination_id = :destination_id AND d.is_deleted = 0
             ORDER BY 
                 d.description;
         """
-        # I parametri devono corrispondere ai '?' nella query nell'ordine corretto
-        return conn.execute(query, (start_date, end_date, destination_id)).fetchall()
+        start, end = _period_bounds(start_date, end_date)
+        return conn.execute(query, {"start": start, "end": end, "destination_id": destination_id}).fetchall()
     
 def get_devices_for_customer_inventory_export(customer_id: int):
     """Get devices for customer inventory export."""
@@ -656,8 +1172,8 @@ def advanced_search(criteria: dict):
         params.append(f"%{criteria['model']}%")
 
     if criteria.get("start_date") and criteria.get("end_date"):
-        base_query += " AND v.id IS NOT NULL AND v.verification_date BETWEEN ? AND ?"
-        params.extend([criteria["start_date"], criteria["end_date"]])
+        base_query += " AND v.id IS NOT NULL AND v.verification_date >= ? AND v.verification_date < ?"
+        params.extend(_period_bounds(criteria["start_date"], criteria["end_date"]))
 
     outcome = criteria.get("outcome")
     if outcome and outcome != "Qualsiasi":
@@ -752,12 +1268,31 @@ def get_all_customers(search_query=None):
     with DatabaseConnection() as conn:
         query = "SELECT * FROM customers WHERE is_deleted = 0"
         params = []
-        if search_query:
-            query += " AND name LIKE ?"
-            params.append(f"%{search_query}%")
+        expression = fts_match_expression(search_query, ("name",)) if search_query else None
+        if expression:
+            query += " AND id IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?)"
+            params.append(expression)
         query += " ORDER BY name"
         return conn.execute(query, params).fetchall()
 
+def search_customers_globally(search_term):
+    """
+    Cerca i clienti per nome o indirizzo tramite l'indice full-text customers_fts,
+    per prefisso, ordinando i risultati per pertinenza.
+    """
+    expression = fts_match_expression(search_term)
+    if expression is None:
+        return []
+    with DatabaseConnection() as conn:
+        query = """
+            SELECT c.*
+            FROM customers_fts
+            JOIN customers c ON c.id = customers_fts.rowid
+            WHERE customers_fts MATCH ? AND c.is_deleted = 0
+            ORDER BY bm25(customers_fts, 5.0, 1.0), c.name
+        """
+        return conn.execute(query, (expression,)).fetchall()
+
 def get_customer_by_id(customer_id):
     with DatabaseConnection() as conn:
         return conn.execute("SELECT * FROM customers WHERE id = ? AND is_deleted = 0", (customer_id,)).fetchone()
@@ -777,6 +1312,34 @@ def get_signature_by_username(username: str):
 
     return row['signature_data'] if row and row['signature_data'] else None
 
+# --- Helper per i periodi di date ---
+
+def _as_iso_date(value):
+    """Accetta date, datetime o stringhe 'YYYY-MM-DD[...]' e restituisce un oggetto date."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+def _period_bounds(start_date, end_date=None):
+    """
+    Converte un periodo a giorni inclusi [start_date, end_date] nei limiti
+    semiaperti (inizio, fine_esclusa) da usare come
+    "verification_date >= ? AND verification_date < ?".
+    Il confronto resta su colonna nuda (quindi può usare gli indici) e include
+    anche eventuali date con l'orario nell'ultimo giorno del periodo.
+    """
+    start = _as_iso_date(start_date)
+    end = _as_iso_date(end_date) if end_date is not None else start
+    return start.isoformat(), (end + timedelta(days=1)).isoformat()
+
+def _month_bounds(year: int, month: int):
+    """Limiti semiaperti di un mese: ('YYYY-MM-01', primo giorno del mese successivo)."""
+    start = date(int(year), int(month), 1)
+    next_month = date(start.year + (start.month // 12), start.month % 12 + 1, 1)
+    return start.isoformat(), next_month.isoformat()
+
 # --- Gestione Verifiche (Verifications) ---
 
 def generate_verification_code(conn, verification_date: str, technician_name: str = "", technician_username: str = "") -> str:
@@ -784,6 +1347,8 @@ def generate_verification_code(conn, verification_date: str, technician_name: st
     Genera un codice univoco per verifica: 2 iniziali-AAMMGG-4 cifre progressive.
     Il progressivo si resetta ogni giorno per ogni tecnico.
     Esempio: EM-240731-0001
+    Va chiamata nella stessa transazione (conn) che inserisce la verifica:
+    il progressivo è preso dalla tabella verification_code_counters.
     """
     def _initials_from(name: str) -> str:
         name = (name or "").strip()
@@ -809,25 +1374,16 @@ def generate_verification_code(conn, verification_date: str, technician_name: st
     # Il prefisso completo ora include iniziali e data
     full_prefix = f"{initials}-{date_prefix}-"
 
-    cur = conn.execute("""
-        SELECT verification_code
-        FROM verifications
-        WHERE verification_code LIKE ?
-        ORDER BY verification_code DESC
-        LIMIT 1;
-    """, (full_prefix + "%",))
-    row = cur.fetchone()
-
-    if row and row[0]:
-        try:
-            # Estrae il numero dopo l'ultimo trattino
-            last_num_str = row[0].split('-')[-1]
-            last_num = int(last_num_str)
-        except Exception:
-            last_num = 0
-        new_num = last_num + 1
-    else:
-        new_num = 1
+    # Allocazione atomica del progressivo: l'UPSERT acquisisce subito il lock di
+    # scrittura, quindi due salvataggi concorrenti non possono ottenere lo stesso
+    # numero; il contatore viene confermato insieme all'inserimento della verifica.
+    row = conn.execute("""
+        INSERT INTO verification_code_counters (initials, code_date, last_number)
+        VALUES (?, ?, 1)
+        ON CONFLICT (initials, code_date) DO UPDATE SET last_number = last_number + 1
+        RETURNING last_number;
+    """, (initials, date_prefix)).fetchone()
+    new_num = row[0]
 
     return f"{full_prefix}{new_num:04d}"
 
@@ -897,10 +1453,10 @@ def get_verifications_for_destination_by_date_range(destination_id: int, start_d
             JOIN devices d ON v.device_id = d.id
             WHERE v.is_deleted = 0 AND d.is_deleted = 0
             AND d.destination_id = ?
-            AND v.verification_date BETWEEN ? AND ?
+            AND v.verification_date >= ? AND v.verification_date < ?
             ORDER BY d.description, v.verification_date;
         """
-        return conn.execute(query, (destination_id, start_date, end_date)).fetchall()
+        return conn.execute(query, (destination_id, *_period_bounds(start_date, end_date))).fetchall()
 
 def get_full_verification_data_for_date(target_date: str) -> dict:
     """
@@ -919,10 +1475,10 @@ def get_full_verification_data_for_date(target_date: str) -> dict:
             JOIN devices d ON v.device_id = d.id
             JOIN destinations dest ON d.destination_id = dest.id
             JOIN customers c ON dest.customer_id = c.id
-            WHERE v.verification_date = ? AND v.is_deleted = 0
+            WHERE v.verification_date >= ? AND v.verification_date < ? AND v.is_deleted = 0
             ORDER BY c.name, d.description
         """
-        rows = conn.execute(query, (target_date,)).fetchall()
+        rows = conn.execute(query, _period_bounds(target_date)).fetchall()
 
     export_structure = {"export_format_version": "1.0", "export_creation_date": datetime.now().isoformat(), "verifications_for_date": target_date, "verifications": []}
     for row_proxy in rows:
@@ -946,38 +1502,149 @@ def soft_delete_verification(verification_id, timestamp):
         return True
     return False
 
+def _device_verifications_filter(device_id: int, search_query: str = None):
+    """Clausole FROM/WHERE (e parametri) delle verifiche attive di un dispositivo."""
+    query = " FROM verifications WHERE device_id = ? AND is_deleted = 0"
+    params = [device_id]
+    if search_query:
+        query += " AND (verification_date LIKE ? OR technician_name LIKE ? OR verification_code LIKE ?)"
+        like_term = f"%{search_query}%"
+        params.extend([like_term] * 3)
+    return query, params
+
+# Colonne di verifications senza i campi JSON: per gli elenchi, che mostrano
+# solo data, esito, profilo e tecnico, non serve leggere risultati e checklist.
+_VERIFICATION_SUMMARY_COLUMNS = (
+    "id, device_id, verification_date, profile_name, overall_status, mti_instrument, mti_serial, "
+    "mti_version, mti_cal_date, technician_name, technician_username, verification_code, uuid, "
+    "last_modified, is_deleted, is_synced"
+)
+_VERIFICATION_JSON_FIELDS = ['results_json', 'visual_inspection_json']
+
 def get_verifications_for_device(device_id: int, search_query: str = None):
+    filter_sql, params = _device_verifications_filter(device_id, search_query)
     with DatabaseConnection() as conn:
-        query = "SELECT * FROM verifications WHERE device_id = ? AND is_deleted = 0"
-        params = [device_id]
-        if search_query:
-            query += " AND (verification_date LIKE ? OR technician_name LIKE ? OR verification_code LIKE ?)"
-            like_term = f"%{search_query}%"
-            params.extend([like_term] * 3)
-        
-        query += " ORDER BY verification_date DESC"
-        rows = conn.execute(query, tuple(params)).fetchall()
-    return [_decode_json_fields(r, ['results_json', 'visual_inspection_json']) for r in rows]
+        rows = conn.execute("SELECT *" + filter_sql + " ORDER BY verification_date DESC", params).fetchall()
+    return [_decode_json_fields(r, _VERIFICATION_JSON_FIELDS) for r in rows]
+
+def get_verification_by_id(verification_id: int):
+    """Una verifica attiva con risultati e ispezione visiva decodificati, o None."""
+    with DatabaseConnection() as conn:
+        row = conn.execute("SELECT * FROM verifications WHERE id = ? AND is_deleted = 0", (verification_id,)).fetchone()
+    return _decode_json_fields(row, _VERIFICATION_JSON_FIELDS)
+
+def get_verification_count_for_device(device_id: int, search_query: str = None) -> int:
+    filter_sql, params = _device_verifications_filter(device_id, search_query)
+    with DatabaseConnection() as conn:
+        return conn.execute("SELECT COUNT(*)" + filter_sql, params).fetchone()[0]
 
 def get_verifications_for_destination_by_month(destination_id: int, year: int, month: int) -> list:
     """
     Recupera tutte le verifiche per una specifica destinazione eseguite in un dato mese e anno.
     """
-    month_str = f"{month:02d}"
-    year_str = str(year)
-    
     with DatabaseConnection() as conn:
         query = """
             SELECT v.*, d.serial_number, d.ams_inventory
             FROM verifications v
             JOIN devices d ON v.device_id = d.id
             WHERE v.is_deleted = 0 AND d.is_deleted = 0
-            AND strftime('%Y', v.verification_date) = ?
-            AND strftime('%m', v.verification_date) = ?
+            AND v.verification_date >= ? AND v.verification_date < ?
             AND d.destination_id = ?
             ORDER BY d.description, v.verification_date;
         """
-        return conn.execute(query, (year_str, month_str, destination_id)).fetchall()
+        return conn.execute(query, (*_month_bounds(year, month), destination_id)).fetchall()
+
+def get_verifications_for_customer_by_month(customer_id: int, year: int, month: int) -> list:
+    """
+    Recupera tutte le verifiche dei dispositivi di un cliente (tutte le sue
+    destinazioni) eseguite in un dato mese e anno.
+    """
+    with DatabaseConnection() as conn:
+        query = """
+            SELECT v.*, d.serial_number, d.ams_inventory, dest.name AS destination_name
+            FROM verifications v
+            JOIN devices d ON v.device_id = d.id
+            JOIN destinations dest ON d.destination_id = dest.id
+            WHERE v.is_deleted = 0 AND d.is_deleted = 0
+            AND v.verification_date >= ? AND v.verification_date < ?
+            AND dest.customer_id = ?
+            ORDER BY dest.name, d.description, v.verification_date;
+        """
+        return conn.execute(query, (*_month_bounds(year, month), customer_id)).fetchall()
+
+# --- Misure elettriche normalizzate (verification_measurements) ---
+# Righe derivate da results_json e mantenute dai trigger della migrazione 011.
+
+def search_measurements(test_name: str, min_value: float = None, max_value: float = None,
+                        model: str = None, device_id: int = None, passed: bool = None) -> list:
+    """
+    Misure di un test (nome come in verification_measurements.test_name) nelle
+    verifiche non eliminate, con filtri opzionali su valore, modello del
+    dispositivo, dispositivo ed esito. Esempio: resistenze di terra oltre una
+    soglia per un modello.
+    """
+    query = """
+        SELECT m.*, v.device_id, v.verification_date, v.verification_code,
+               d.description, d.serial_number, d.manufacturer, d.model
+        FROM verification_measurements m
+        JOIN verifications v ON v.id = m.verification_id
+        JOIN devices d ON d.id = v.device_id
+        WHERE m.test_name = ? AND v.is_deleted = 0 AND d.is_deleted = 0
+    """
+    params = [test_name]
+    if min_value is not None:
+        query += " AND m.value >= ?"
+        params.append(min_value)
+    if max_value is not None:
+        query += " AND m.value <= ?"
+        params.append(max_value)
+    if model:
+        query += " AND d.model = ?"
+        params.append(model)
+    if device_id is not None:
+        query += " AND v.device_id = ?"
+        params.append(device_id)
+    if passed is not None:
+        query += " AND m.passed = ?"
+        params.append(1 if passed else 0)
+    query += " ORDER BY m.value DESC, v.verification_date DESC"
+    with DatabaseConnection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+def get_measurements_for_device(device_id: int, test_name: str = None) -> list:
+    """Storico delle misure di un dispositivo (o di un solo test), in ordine cronologico."""
+    query = """
+        SELECT m.*, v.verification_date, v.verification_code
+        FROM verifications v
+        JOIN verification_measurements m ON m.verification_id = v.id
+        WHERE v.device_id = ? AND v.is_deleted = 0
+    """
+    params = [device_id]
+    if test_name:
+        query += " AND m.test_name = ?"
+        params.append(test_name)
+    query += " ORDER BY v.verification_date, v.id, m.position"
+    with DatabaseConnection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+def get_measurement_test_names() -> list:
+    """Nomi dei test presenti nelle misure registrate."""
+    with DatabaseConnection() as conn:
+        rows = conn.execute("SELECT DISTINCT test_name FROM verification_measurements ORDER BY test_name").fetchall()
+    return [row['test_name'] for row in rows]
+
+def rebuild_verification_measurements() -> int:
+    """
+    Ricostruisce verification_measurements da results_json di tutte le verifiche
+    (es. dopo l'installazione di uno snapshot, che non passa dai trigger).
+    Restituisce il numero di misure scritte.
+    """
+    with DatabaseConnection() as conn:
+        conn.execute("DELETE FROM verification_measurements")
+        cursor = conn.execute("INSERT INTO verification_measurements SELECT * FROM verification_measurements_source")
+        count = cursor.rowcount
+    logging.info(f"Tabella delle misure ricostruita: {count} misure.")
+    return count
 
 def update_device_next_verification_date(device_id, interval_months, timestamp):
     from dateutil.relativedelta import relativedelta
@@ -991,66 +1658,86 @@ def get_devices_with_last_verification():
     Recupera tutti i dispositivi dal database, arricchiti con la data
     e l'esito della loro ultima verifica.
     """
-    # --- CORREZIONE: Gestione di più verifiche nello stesso giorno ---
-    # La sottoquery 'latest_ver' ora usa ROW_NUMBER() per identificare in modo univoco
-    # la verifica più recente per ogni dispositivo, anche se ci sono più verifiche
-    # eseguite nello stesso giorno. Questo previene la duplicazione dei dispositivi.
+    # Data ed esito dell'ultima verifica sono colonne di devices mantenute dai
+    # trigger sulle verifiche (migrazione 009): niente join né sottoquery.
     query = """
     SELECT
         d.*,
-        v.verification_date AS last_verification_date,
-        v.overall_status AS last_verification_outcome
+        d.last_outcome AS last_verification_outcome
     FROM
         devices d
-    LEFT JOIN verifications v ON v.id = (
-        -- Sottoquery per trovare l'ID dell'ultima verifica per ogni dispositivo
-        SELECT
-            id
-        FROM
-            verifications
-        WHERE device_id = d.id AND is_deleted = 0
-        ORDER BY verification_date DESC, id DESC
-        LIMIT 1
-    )
     WHERE 
         d.is_deleted = 0
     ORDER BY
         d.id DESC;
     """
     with DatabaseConnection() as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        rows = conn.execute(query).fetchall()
         return [dict(row) for row in rows]
 
 
+def get_devices_for_manager_view(destination_id: int, search_query: str = None):
+    """
+    Dispositivi di una destinazione (attivi e dismessi) per la tabella del
+    gestore database, con data ed esito dell'ultima verifica, ordinati per
+    descrizione. La ricerca è eseguita in SQL e vengono lette solo le colonne
+    mostrate; l'ordinamento per colonna lo fa la tabella.
+
+    Args:
+        search_query: testo cercato su descrizione, reparto, matricola, marca,
+                      modello e inventari (per prefisso).
+    """
+    query = """
+        SELECT d.id, d.description, d.department, d.serial_number, d.manufacturer, d.model,
+               d.customer_inventory, d.ams_inventory, d.verification_interval, d.status,
+               d.last_verification_date, d.last_outcome AS last_verification_outcome
+        FROM devices d
+        WHERE d.destination_id = ? AND d.is_deleted = 0
+    """
+    params = [destination_id]
+    if search_query:
+        condition, search_params = _devices_fts_filter(
+            search_query,
+            ("description", "serial_number", "model", "manufacturer", "department", "ams_inventory", "customer_inventory"),
+            "d.")
+        query += condition
+        params.extend(search_params)
+    query += " ORDER BY d.description, d.id"
+
+    with DatabaseConnection() as conn:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+
 def get_devices_verification_status_by_period(destination_id: int, start_date: str, end_date: str):
     """
     Recupera tutti i dispositivi di una specifica destinazione e controlla il loro
     stato di verifica in un dato intervallo di date.
     """
+    start, end = _period_bounds(start_date, end_date)
     with DatabaseConnection() as conn:
-        # 1. Recupera tutti i dispositivi attivi della destinazione selezionata
-        all_devices_query = "SELECT id, description, serial_number, model FROM devices WHERE destination_id = ? AND is_deleted = 0 ORDER BY description"
-        all_devices = conn.execute(all_devices_query, (destination_id,)).fetchall()
-
-        # 2. Recupera gli ID dei dispositivi di QUESTA destinazione che sono stati verificati nel periodo
-        verified_devices_query = """
-            SELECT DISTINCT device_id FROM verifications
-            WHERE device_id IN (SELECT id FROM devices WHERE destination_id = ?)
-            AND verification_date BETWEEN ? AND ?
-            AND is_deleted = 0
+        # Una sola query: l'EXISTS correlato si risolve con una ricerca puntuale
+        # su idx_verifications_device_date per ciascun dispositivo.
+        query = """
+            SELECT d.id, d.description, d.serial_number, d.model,
+                   EXISTS (
+                       SELECT 1 FROM verifications v
+                       WHERE v.device_id = d.id
+                         AND v.verification_date >= :start AND v.verification_date < :end
+                         AND v.is_deleted = 0
+                   ) AS is_verified
+            FROM devices d
+            WHERE d.destination_id = :destination_id AND d.is_deleted = 0
+            ORDER BY d.description
         """
-        verified_ids_cursor = conn.execute(verified_devices_query, (destination_id, start_date, end_date))
-        verified_ids = {row['device_id'] for row in verified_ids_cursor}
+        rows = conn.execute(query, {"start": start, "end": end, "destination_id": destination_id}).fetchall()
 
     verified_list = []
     unverified_list = []
 
-    for device_row in all_devices:
+    for device_row in rows:
         device_dict = dict(device_row)
-        if device_dict['id'] in verified_ids:
+        is_verified = device_dict.pop('is_verified')
+        if is_verified:
             verified_list.append(device_dict)
         else:
             unverified_list.append(device_dict)
@@ -1060,54 +1747,146 @@ def get_devices_verification_status_by_period(destination_id: int, start_date: s
 def get_all_devices_for_customer(customer_id: int, search_query=None):
     """
     Recupera TUTTI i dispositivi di un cliente, da tutte le sue destinazioni.
+    Per i clienti molto grandi usare get_devices_page_for_customer.
     """
+    filter_sql, params = _customer_devices_filter(customer_id, search_query)
     with DatabaseConnection() as conn:
-        query = """
-            SELECT d.* FROM devices d
-            JOIN destinations dest ON d.destination_id = dest.id
-            WHERE dest.customer_id = ? AND d.is_deleted = 0
-        """
-        params = [customer_id]
-        if search_query:
-            query += " AND (d.description LIKE ? OR d.serial_number LIKE ? OR d.model LIKE ?)"
-            params.extend([f"%{search_query}%"] * 3)
-        query += " ORDER BY d.description"
-        return conn.execute(query, params).fetchall()
+        return conn.execute("SELECT d.* " + filter_sql + " ORDER BY d.description", params).fetchall()
+
+# --- Paginazione a chiave (keyset) ---
+# Ogni pagina riprende dall'ultima riga della precedente ("description > ultima
+# descrizione" invece di OFFSET), quindi il costo di una pagina non cresce
+# scorrendo l'elenco. Il cursore restituito al chiamante è opaco: va solo
+# ripassato così com'è per ottenere la pagina successiva.
+
+DEFAULT_PAGE_SIZE = 200
+
+# Chiavi di ordinamento ammesse: colonna e direzione (True = decrescente).
+# Lo spareggio è sempre sull'id, così ogni riga ha una posizione univoca.
+_DEVICE_PAGE_SORTS = {
+    "description": ("d.description", False),
+    "serial_number": ("d.serial_number", False),
+    "department": ("d.department", False),
+    "id": ("d.id", False),
+}
+
+_VERIFICATION_PAGE_SORTS = {
+    "verification_date": ("verification_date", True),
+    "id": ("id", True),
+}
+
+def _encode_page_cursor(sort: str, value, row_id: int) -> str:
+    payload = json.dumps([sort, value, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def _decode_page_cursor(cursor: str, sort: str):
+    """Restituisce (valore, id) dell'ultima riga letta. Solleva ValueError se il cursore non è valido."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Cursore di paginazione non valido.") from e
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise ValueError("Il cursore di paginazione appartiene a un ordinamento diverso.")
+    return value, row_id
+
+def _keyset_condition(column: str, id_column: str, descending: bool, value, row_id: int):
+    """
+    Condizione "righe dopo (valore, id)" coerente con l'ordinamento di SQLite,
+    che mette i NULL per primi in ordine crescente e per ultimi in decrescente.
+    """
+    if descending:
+        if value is None:
+            return f"({column} IS NULL AND {id_column} < ?)", [row_id]
+        return f"({column} < ? OR ({column} = ? AND {id_column} < ?) OR {column} IS NULL)", [value, value, row_id]
+    if value is None:
+        return f"(({column} IS NULL AND {id_column} > ?) OR {column} IS NOT NULL)", [row_id]
+    return f"({column} > ? OR ({column} = ? AND {id_column} > ?))", [value, value, row_id]
+
+def _fetch_keyset_page(conn, select_sql: str, params: list, sorts: dict, sort: str, id_column: str,
+                       cursor: str = None, page_size: int = DEFAULT_PAGE_SIZE):
+    """Esegue una query a pagine; restituisce (righe, cursore_successivo o None)."""
+    if sort not in sorts:
+        raise ValueError(f"Ordinamento non supportato: {sort}")
+    if page_size <= 0:
+        raise ValueError("La dimensione della pagina deve essere positiva.")
+    column, descending = sorts[sort]
+    params = list(params)
+    if cursor:
+        condition, cursor_params = _keyset_condition(column, id_column, descending, *_decode_page_cursor(cursor, sort))
+        select_sql += " AND " + condition
+        params.extend(cursor_params)
+    direction = "DESC" if descending else "ASC"
+    select_sql += f" ORDER BY {column} {direction}, {id_column} {direction} LIMIT ?"
+    # Una riga in più indica se esiste una pagina successiva senza un COUNT
+    params.append(page_size + 1)
+
+    rows = conn.execute(select_sql, params).fetchall()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, _encode_page_cursor(sort, last[column.split('.')[-1]], last[id_column.split('.')[-1]])
+
+def get_devices_page_for_customer(customer_id: int, cursor: str = None, page_size: int = DEFAULT_PAGE_SIZE,
+                                  sort: str = "description", search_query: str = None):
+    """
+    Una pagina dei dispositivi attivi di un cliente (tutte le destinazioni).
+
+    Args:
+        cursor: None per la prima pagina, altrimenti il cursore restituito
+                dalla chiamata precedente (con lo stesso ordinamento e filtro).
+        sort: una delle chiavi di _DEVICE_PAGE_SORTS.
+
+    Returns:
+        (righe, next_cursor): next_cursor è None sull'ultima pagina. Il totale
+        si ottiene con get_device_count_for_customer(customer_id, search_query).
+    """
+    filter_sql, params = _customer_devices_filter(customer_id, search_query)
+    with DatabaseConnection() as conn:
+        return _fetch_keyset_page(conn, "SELECT d.* " + filter_sql, params, _DEVICE_PAGE_SORTS, sort,
+                                  "d.id", cursor, page_size)
+
+def get_verifications_page_for_device(device_id: int, cursor: str = None, page_size: int = DEFAULT_PAGE_SIZE,
+                                      sort: str = "verification_date", search_query: str = None,
+                                      include_json: bool = True):
+    """
+    Una pagina dello storico verifiche di un dispositivo, dalla più recente.
+    Stesse regole di get_devices_page_for_customer; il totale si ottiene con
+    get_verification_count_for_device. Con include_json=False results_json e
+    visual_inspection_json non vengono letti (per gli elenchi).
+    """
+    filter_sql, params = _device_verifications_filter(device_id, search_query)
+    columns = "*" if include_json else _VERIFICATION_SUMMARY_COLUMNS
+    with DatabaseConnection() as conn:
+        rows, next_cursor = _fetch_keyset_page(conn, f"SELECT {columns}" + filter_sql, params,
+                                               _VERIFICATION_PAGE_SORTS, sort, "id", cursor, page_size)
+    if not include_json:
+        return [dict(r) for r in rows], next_cursor
+    return [_decode_json_fields(r, _VERIFICATION_JSON_FIELDS) for r in rows], next_cursor
 
 def get_unverified_devices_for_destination_in_period(destination_id: int, start_date: str, end_date: str):
     """
     Returns a list of devices for a specific destination that have NOT had
     a verification within the specified period.
     """
+    start, end = _period_bounds(start_date, end_date)
     with DatabaseConnection() as conn:
-        # First, find the IDs of devices in this destination that WERE verified in the period
-        verified_devices_query = """
-            SELECT DISTINCT device_id FROM verifications
-            WHERE device_id IN (SELECT id FROM devices WHERE destination_id = ?)
-            AND verification_date BETWEEN ? AND ?
-            AND is_deleted = 0
+        # Anti-join: statement fisso (nessun elenco di id da espandere in
+        # segnaposto), risolto con idx_verifications_device_date.
+        query = """
+            SELECT d.* FROM devices d
+            WHERE d.destination_id = :destination_id
+              AND d.is_deleted = 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM verifications v
+                  WHERE v.device_id = d.id
+                    AND v.verification_date >= :start AND v.verification_date < :end
+                    AND v.is_deleted = 0
+              )
+            ORDER BY d.description
         """
-        verified_ids_cursor = conn.execute(verified_devices_query, (destination_id, start_date, end_date))
-        verified_ids = {row['device_id'] for row in verified_ids_cursor}
-
-        # Now, get all devices from this destination that are NOT in the verified list
-        # We need to handle the case where verified_ids is empty
-        if not verified_ids:
-            unverified_devices_query = "SELECT * FROM devices WHERE destination_id = ? AND is_deleted = 0 ORDER BY description"
-            params = (destination_id,)
-        else:
-            # Create a string of placeholders for the IN clause
-            placeholders = ', '.join('?' for _ in verified_ids)
-            unverified_devices_query = f"""
-                SELECT * FROM devices
-                WHERE destination_id = ?
-                AND is_deleted = 0
-                AND id NOT IN ({placeholders})
-                ORDER BY description
-            """
-            params = (destination_id, *verified_ids)
-
-        return conn.execute(unverified_devices_query, params).fetchall()
+        return conn.execute(query, {"start": start, "end": end, "destination_id": destination_id}).fetchall()
 
 # --- Gestione Strumenti (Instruments) ---
 
@@ -1136,8 +1915,11 @@ def set_default_instrument(inst_id, timestamp):
 def get_stats():
     with DatabaseConnection() as conn:
         try:
-            device_count = conn.execute("SELECT COUNT(id) FROM devices WHERE is_deleted = 0").fetchone()[0]
-            customer_count = conn.execute("SELECT COUNT(id) FROM customers WHERE is_deleted = 0").fetchone()[0]
+            # Contatori mantenuti dai trigger (dashboard_counters), non conteggi sulle tabelle
+            counters = {row['name']: row['value'] for row in conn.execute("SELECT name, value FROM dashboard_counters")}
+            device_count = counters.get('devices', 0)
+            customer_count = counters.get('customers', 0)
+            # Lettura all'estremo di idx_verifications_date
             last_verif_date = conn.execute("SELECT MAX(verification_date) FROM verifications WHERE is_deleted = 0").fetchone()[0]
         except (TypeError, IndexError):
             return {"devices": 0, "customers": 0, "last_verif": "N/A"}
@@ -1190,40 +1972,74 @@ def overwrite_local_record(table_name: str, record_data: dict):
 # SEZIONE 4: GESTORE PROFILI DI VERIFICA
 # ==============================================================================
 
-def get_all_profiles_from_db():
+# Cache in memoria dei profili: invalidata dalle scritture su profiles/profile_tests
+# (modifiche locali e sincronizzazione, tramite i listener delle modifiche) e
+# dalla sostituzione del file del database (snapshot, ripristino backup).
+_PROFILE_TABLES = frozenset({"profiles", "profile_tests"})
+_profiles_cache = None
+_profiles_cache_lock = threading.Lock()
+# Incrementato a ogni invalidazione: i profili letti prima di una scrittura
+# concorrente non vengono salvati in cache.
+_profiles_cache_generation = 0
+
+def invalidate_profiles_cache():
+    """Scarta i profili in cache: verranno riletti dal database alla prossima richiesta."""
+    global _profiles_cache, _profiles_cache_generation
+    with _profiles_cache_lock:
+        _profiles_cache = None
+        _profiles_cache_generation += 1
+
+def _invalidate_profiles_cache_on_change(tables):
+    if tables & _PROFILE_TABLES:
+        invalidate_profiles_cache()
+
+add_change_listener(_invalidate_profiles_cache_on_change)
+
+def get_all_profiles_from_db(use_cache=True):
     """
     Legge i profili e i test dal database locale e li ricostruisce
     nello stesso formato del vecchio file JSON.
+    Profili e test vengono letti con un'unica query e il risultato resta in
+    cache finché profili o test non vengono modificati.
     """
+    global _profiles_cache
+    with _profiles_cache_lock:
+        if use_cache and _profiles_cache is not None:
+            # Copia profonda: i chiamanti (es. editor dei profili) modificano gli oggetti
+            return copy.deepcopy(_profiles_cache)
+        generation = _profiles_cache_generation
+
     profiles_dict = {}
     with DatabaseConnection() as conn:
-        # 1. Recupera tutti i profili
-        profiles_rows = conn.execute("SELECT * FROM profiles WHERE is_deleted = 0").fetchall()
-
-        for profile_row in profiles_rows:
-            profile_id = profile_row['id']
-            profile_key = profile_row['profile_key']
-
-            # 2. Per ogni profilo, recupera i suoi test
-            tests_rows = conn.execute("SELECT * FROM profile_tests WHERE profile_id = ? AND is_deleted = 0", (profile_id,)).fetchall()
-
-            tests_list = []
-            for test_row in tests_rows:
-                limits_data = json.loads(test_row['limits_json'] or '{}')
-                limits_obj = {key: Limit(**data) for key, data in limits_data.items()}
-
-                tests_list.append(Test(
-                    name=test_row['name'],
-                    parameter=test_row['parameter'],
-                    limits=limits_obj,
-                    is_applied_part_test=bool(test_row['is_applied_part_test'])
-                ))
-
-            profiles_dict[profile_key] = VerificationProfile(
-                name=profile_row['name'],
-                tests=tests_list
-            )
-
+        # Profili con i rispettivi test (LEFT JOIN: anche i profili senza test)
+        rows = conn.execute("""
+            SELECT p.profile_key, p.name AS profile_name,
+                   pt.id AS test_id, pt.name, pt.parameter, pt.limits_json, pt.is_applied_part_test
+            FROM profiles p
+            LEFT JOIN profile_tests pt ON pt.profile_id = p.id AND pt.is_deleted = 0
+            WHERE p.is_deleted = 0
+            ORDER BY p.id, pt.id
+        """).fetchall()
+
+    for row in rows:
+        profile = profiles_dict.get(row['profile_key'])
+        if profile is None:
+            profile = profiles_dict[row['profile_key']] = VerificationProfile(name=row['profile_name'], tests=[])
+        if row['test_id'] is None:
+            continue
+
+        limits_data = json.loads(row['limits_json'] or '{}')
+        limits_obj = {key: Limit(**data) for key, data in limits_data.items()}
+        profile.tests.append(Test(
+            name=row['name'],
+            parameter=row['parameter'],
+            limits=limits_obj,
+            is_applied_part_test=bool(row['is_applied_part_test'])
+        ))
+
+    with _profiles_cache_lock:
+        if generation == _profiles_cache_generation:
+            _profiles_cache = copy.deepcopy(profiles_dict)
     logging.info(f"Caricati {len(profiles_dict)} profili dal database locale.")
     return profiles_dict
 
@@ -1399,8 +2215,251 @@ def mark_everything_for_full_push(conn: sqlite3.Connection) -> dict:
     return res
 
 # ==============================================================================
-# ESECUZIONE INIZIALE
+# SEZIONE 6: CRONOLOGIA DELLE SINCRONIZZAZIONI
 # ==============================================================================
 
-# Applica le migrazioni del database all'avvio del modulo
-migrate_database()
\ No newline at end of file
+def add_sync_history(record: dict):
+    """Salva il record di temporizzazione di una sincronizzazione (tabella locale, non sincronizzata)."""
+    columns = ["started_at", "finished_at", "full_sync", "status", "rows_uploaded", "rows_downloaded",
+               "bytes_uploaded", "bytes_downloaded", "phase_timings_json", "message"]
+    with DatabaseConnection() as conn:
+        conn.execute(
+            f"INSERT INTO sync_history ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+            tuple(record.get(col) for col in columns)
+        )
+
+def get_sync_history(limit: int = 50):
+    """Restituisce le ultime sincronizzazioni registrate, dalla più recente."""
+    with DatabaseConnection() as conn:
+        rows = conn.execute("SELECT * FROM sync_history ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [_decode_json_fields(row, ['phase_timings_json']) for row in rows]
+
+# ==============================================================================
+# SEZIONE 7: SNAPSHOT DEL DATABASE (BOOTSTRAP DAL SERVER)
+# ==============================================================================
+
+# Tabelle che uno snapshot valido deve contenere
+SNAPSHOT_REQUIRED_TABLES = ("schema_version", "customers", "destinations", "devices", "verifications",
+                            "profiles", "profile_tests", "mti_instruments", "signatures")
+# Tabelle solo locali da conservare quando si sostituisce il database
+LOCAL_ONLY_TABLES = ("sync_history", "maintenance_log")
+
+def get_latest_migration_version() -> int:
+    """Numero dell'ultima migrazione disponibile nella cartella 'migrations'."""
+    migrations_path = os.path.join(config.BASE_DIR, 'migrations')
+    versions = [0]
+    if os.path.isdir(migrations_path):
+        for m_file in os.listdir(migrations_path):
+            if m_file.endswith('.sql'):
+                try:
+                    versions.append(int(m_file.split('_')[0]))
+                except (ValueError, IndexError):
+                    continue
+    return max(versions)
+
+def has_unsynced_changes() -> bool:
+    """True se esiste almeno un record locale non ancora inviato al server."""
+    tables = ["customers", "mti_instruments", "signatures", "profiles", "profile_tests",
+              "destinations", "devices", "verifications"]
+    with DatabaseConnection() as conn:
+        for table in tables:
+            if conn.execute(f"SELECT 1 FROM {table} WHERE is_synced = 0 LIMIT 1").fetchone():
+                return True
+    return False
+
+def validate_database_snapshot(snapshot_path: str) -> int:
+    """
+    Verifica l'integrità di uno snapshot SQLite scaricato dal server.
+    Restituisce la versione di schema dello snapshot, solleva ValueError se non valido.
+    """
+    conn = sqlite3.connect(snapshot_path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()
+        if not result or result[0] != 'ok':
+            raise ValueError(f"Controllo di integrità fallito: {result[0] if result else 'nessun risultato'}")
+        if conn.execute("PRAGMA foreign_key_check").fetchone():
+            raise ValueError("Lo snapshot contiene riferimenti (foreign key) non validi.")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = [t for t in SNAPSHOT_REQUIRED_TABLES if t not in tables]
+        if missing:
+            raise ValueError(f"Tabelle mancanti nello snapshot: {', '.join(missing)}")
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        snapshot_version = row[0] if row and row[0] is not None else 0
+    finally:
+        conn.close()
+
+    if snapshot_version > get_latest_migration_version():
+        raise ValueError(f"Lo snapshot usa uno schema più recente (v{snapshot_version}) "
+                         f"di quello supportato da questa versione del programma.")
+    return snapshot_version
+
+def install_database_snapshot(snapshot_path: str):
+    """
+    Sostituisce in modo atomico il database locale con uno snapshot già validato.
+    Le tabelle solo locali vengono copiate nello snapshot prima dello scambio e,
+    a scambio avvenuto, vengono applicate le eventuali migrazioni mancanti.
+    """
+    validate_database_snapshot(snapshot_path)
+
+    if os.path.exists(DB_PATH):
+        conn = sqlite3.connect(snapshot_path)
+        try:
+            conn.execute("ATTACH DATABASE ? AS old_db", (DB_PATH,))
+            old_tables = {row[0] for row in conn.execute("SELECT name FROM old_db.sqlite_master WHERE type = 'table'")}
+            new_tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")}
+            for table in LOCAL_ONLY_TABLES:
+                if table in old_tables and table in new_tables:
+                    conn.execute(f"DELETE FROM main.{table}")
+                    conn.execute(f"INSERT INTO main.{table} SELECT * FROM old_db.{table}")
+            conn.commit()
+            conn.execute("DETACH DATABASE old_db")
+        finally:
+            conn.close()
+
+    # In modalità WAL il file non può essere sostituito sul disco (il -wal
+    # rimasto verrebbe applicato al nuovo file): lo snapshot viene copiato con la
+    # backup API, in un'unica transazione, dopo aver rilasciato le connessioni.
+    close_all_connections()
+    copy_database_file(snapshot_path, DB_PATH)
+    invalidate_profiles_cache()
+    logging.warning(f"Database locale sostituito con lo snapshot del server ({DB_PATH}).")
+    migrate_database()
+    # Lo snapshot arriva già popolato: le tabelle derivate vanno ricalcolate
+    rebuild_verification_measurements()
+    rebuild_dashboard_summary()
+
+# ==============================================================================
+# SEZIONE 8: MANUTENZIONE DEL DATABASE LOCALE
+# ==============================================================================
+
+# Tabelle da cui eliminare i record cancellati logicamente, figli prima dei
+# padri. La condizione esclude i record ancora referenziati da altre righe
+# (anche cancellate): verifications e profile_tests verrebbero altrimenti
+# eliminate a cascata prima di essere state inviate al server.
+_TOMBSTONE_PURGE_ORDER = (
+    ("verifications", None),
+    ("profile_tests", None),
+    ("devices", "NOT EXISTS (SELECT 1 FROM verifications v WHERE v.device_id = t.id)"),
+    ("destinations", "NOT EXISTS (SELECT 1 FROM devices d WHERE d.destination_id = t.id)"),
+    ("customers", "NOT EXISTS (SELECT 1 FROM destinations dest WHERE dest.customer_id = t.id)"),
+    ("profiles", "NOT EXISTS (SELECT 1 FROM profile_tests pt WHERE pt.profile_id = t.id)"),
+    ("mti_instruments", None),
+)
+
+def get_database_page_stats() -> dict:
+    """Dimensione del file in pagine, pagine libere e modalità di auto_vacuum."""
+    with DatabaseConnection() as conn:
+        return {
+            "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+            "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+            "freelist_count": conn.execute("PRAGMA freelist_count").fetchone()[0],
+            "auto_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0],
+        }
+
+def purge_acknowledged_tombstones(retention_days: int = 30) -> dict:
+    """
+    Elimina fisicamente i record cancellati logicamente che il server ha già
+    ricevuto (is_synced = 1) e non modificati negli ultimi 'retention_days'
+    giorni. Le cancellazioni non ancora inviate restano, così come i record
+    a cui fanno ancora riferimento altre righe.
+    Restituisce {tabella: record eliminati}.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=max(0, retention_days))).date().isoformat()
+    purged = {}
+    with DatabaseConnection() as conn:
+        for table, extra_condition in _TOMBSTONE_PURGE_ORDER:
+            query = (f"DELETE FROM {table} AS t WHERE t.is_deleted = 1 AND t.is_synced = 1 "
+                     f"AND t.last_modified < ?")
+            if extra_condition:
+                query += f" AND {extra_condition}"
+            purged[table] = conn.execute(query, (cutoff,)).rowcount
+    return purged
+
+def optimize_database() -> str:
+    """
+    Aggiorna le statistiche del query planner. Al primo passaggio (nessuna
+    statistica presente) esegue ANALYZE, poi PRAGMA optimize, che rianalizza
+    solo le tabelle cambiate in modo significativo. analysis_limit limita il
+    numero di righe esaminate per indice, quindi la durata resta breve anche
+    su database grandi. Restituisce l'operazione eseguita.
+    """
+    with DatabaseConnection() as conn:
+        conn.execute("PRAGMA analysis_limit = 1000")
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone() is not None
+        if has_stats:
+            conn.execute("PRAGMA optimize")
+            return "optimize"
+        conn.execute("ANALYZE")
+        return "analyze"
+
+def is_incremental_vacuum_enabled() -> bool:
+    with DatabaseConnection() as conn:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+def enable_incremental_vacuum():
+    """
+    Converte il database ad auto_vacuum=INCREMENTAL con un VACUUM completo, che
+    riscrive l'intero file: su un database grande può richiedere minuti, quindi
+    va eseguito una sola volta e in modo esplicito (all'avvio, vedi main.py),
+    mai durante la manutenzione nei periodi di inattività.
+    """
+    with DatabaseConnection() as conn:
+        # Fuori da una transazione: VACUUM non può girarvi dentro
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    logging.info("Database convertito ad auto_vacuum=INCREMENTAL.")
+
+def reclaim_free_pages(max_pages: int = 0) -> dict:
+    """
+    Restituisce al file system le pagine libere del database con PRAGMA
+    incremental_vacuum, che ne libera al massimo 'max_pages' (0 = tutte) senza
+    riscrivere il file. Se il database non è ancora in auto_vacuum=INCREMENTAL
+    (vedi enable_incremental_vacuum) non viene fatto nulla.
+    Restituisce le statistiche prima e dopo e la modalità usata.
+    """
+    before = get_database_page_stats()
+    if before["auto_vacuum"] != 2:
+        return {"mode": "unavailable", "before": before, "after": before}
+    with DatabaseConnection() as conn:
+        # Con execute() il sqlite3 di Python esegue un solo passo del pragma
+        # (una pagina): executescript lo porta a termine.
+        conn.executescript(f"PRAGMA incremental_vacuum({max(0, int(max_pages))});")
+    after = get_database_page_stats()
+    return {"mode": "incremental", "before": before, "after": after}
+
+def add_maintenance_log(record: dict):
+    """Salva un passo di manutenzione (tabella locale, non sincronizzata)."""
+    record = dict(record)
+    if isinstance(record.get("details_json"), (dict, list)):
+        record["details_json"] = json.dumps(record["details_json"])
+    # Solo le colonne presenti: le altre prendono il valore predefinito della tabella
+    columns = [col for col in ("run_id", "task", "started_at", "duration_ms", "status", "rows_affected",
+                               "pages_before", "pages_after", "pages_freed", "details_json", "message")
+               if record.get(col) is not None]
+    with DatabaseConnection() as conn:
+        conn.execute(
+            f"INSERT INTO maintenance_log ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+            tuple(record.get(col) for col in columns)
+        )
+
+def get_maintenance_log(limit: int = 50):
+    """Restituisce gli ultimi passi di manutenzione registrati, dal più recente."""
+    with DatabaseConnection() as conn:
+        rows = conn.execute("SELECT * FROM maintenance_log ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [_decode_json_fields(row, ['details_json']) for row in rows]
+
+def get_last_maintenance_time(task: str = None):
+    """Inizio dell'ultimo passo di manutenzione riuscito (di un tipo, se indicato), o None."""
+    query = "SELECT MAX(started_at) FROM maintenance_log WHERE status = 'ok'"
+    params = ()
+    if task:
+        query += " AND task = ?"
+        params = (task,)
+    with DatabaseConnection() as conn:
+        return conn.execute(query, params).fetchone()[0]
+
+# Nessuna operazione sul database all'import del modulo: le migrazioni sono una
+# fase esplicita dell'avvio (ensure_database_schema in main.py); gli strumenti
+# in tools/ chiamano migrate_database() sul proprio database di prova.
@@ -3,7 +3,7 @@ import logging
 import sys
 import os
 from PySide6.QtCore import Qt
-from PySide6.QtWidgets import QApplication, QMessageBox, QDialog
+from PySide6.QtWidgets import QApplication, QMessageBox, QDialog, QProgressDialog
 from PySide6.QtGui import QGuiApplication, QFontDatabase
 from jose import jwt, JWTError
 import app.auth_manager as auth_manager
@@ -14,13 +14,64 @@ from app.ui.main_window import MainWindow
 from app.logging_config import setup_logging
 from app.backup_manager import create_backup
 from app.ui.dialogs.login_dialog import LoginDialog
-from app import config
+from app import config, query_profiler
+import database
 
 load_dotenv()
+
 # La SECRET_KEY qui deve essere IDENTICA a quella in real_server.py
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 
+def run_startup_migrations():
+    """
+    Porta il database all'ultima versione dello schema prima di aprire le
+    finestre. Di norma basta il controllo veloce di ensure_database_schema;
+    l'avanzamento viene mostrato solo se servono migrazioni (la finestra si
+    apre alla prima notifica).
+    """
+    progress = None
+
+    def on_progress(index, total, file_name):
+        nonlocal progress
+        if progress is None:
+            progress = QProgressDialog("Aggiornamento del database in corso...", None, 0, total)
+            progress.setWindowTitle("Safety Test Manager")
+            progress.setWindowModality(Qt.ApplicationModal)
+            progress.setMinimumDuration(0)
+        progress.setMaximum(total)
+        progress.setValue(index)
+        if file_name:
+            progress.setLabelText(f"Aggiornamento del database ({index + 1} di {total}):\n{file_name}")
+        QApplication.processEvents()
+
+    try:
+        database.ensure_database_schema(progress_callback=on_progress)
+    finally:
+        if progress is not None:
+            progress.close()
+
+def run_incremental_vacuum_conversion():
+    """
+    Conversione una tantum ad auto_vacuum=INCREMENTAL, richiesta dal recupero
+    dello spazio della manutenzione automatica. È un VACUUM completo: viene
+    fatta qui, con un avviso, e non durante la manutenzione, dove bloccherebbe
+    la chiusura dell'applicazione.
+    """
+    if not config.MAINTENANCE_SETTINGS['enabled'] or database.is_incremental_vacuum_enabled():
+        return
+    progress = QProgressDialog("Ottimizzazione del database in corso (solo la prima volta)...", None, 0, 0)
+    progress.setWindowTitle("Safety Test Manager")
+    progress.setWindowModality(Qt.ApplicationModal)
+    progress.setMinimumDuration(0)
+    progress.show()
+    QApplication.processEvents()
+    try:
+        database.enable_incremental_vacuum()
+    finally:
+        progress.close()
+
+
 if __name__ == '__main__':
  # Configure High DPI settings BEFORE creating QApplication
     QGuiApplication.setHighDpiScaleFactorRoundingPolicy(
@@ -51,6 +102,20 @@ if __name__ == '__main__':
         logging.error(f"Errore durante il backup: {e}")
         QMessageBox.warning(None, "Avviso", "Impossibile creare il backup automatico.")
 
+    try:
+        run_startup_migrations()
+    except Exception as e:
+        logging.critical(f"Aggiornamento del database non riuscito: {e}", exc_info=True)
+        QMessageBox.critical(None, "ERRORE DATABASE",
+                             f"IMPOSSIBILE AGGIORNARE IL DATABASE LOCALE:\n{str(e).upper()}")
+        sys.exit(1)
+
+    try:
+        run_incremental_vacuum_conversion()
+    except Exception as e:
+        # Non bloccante: senza conversione la manutenzione salta solo il recupero dello spazio
+        logging.error(f"Conversione ad auto_vacuum incrementale non riuscita: {e}", exc_info=True)
+
     while True:
         logged_in_successfully = False
         
@@ -102,5 +167,11 @@ if __name__ == '__main__':
         else:
             break
 
+    if query_profiler.is_enabled():
+        try:
+            query_profiler.write_report()
+        except OSError as e:
+            logging.error(f"Impossibile salvare il profilo delle query: {e}")
+
     logging.info("Applicazione chiusa.")
     sys.exit(0)
\ No newline at end of file
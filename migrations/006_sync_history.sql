@@ -0,0 +1,22 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Cronologia locale delle sincronizzazioni (non viene sincronizzata):
+-- permette di analizzare a posteriori le sincronizzazioni lente.
+CREATE TABLE IF NOT EXISTS sync_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    full_sync INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    rows_uploaded INTEGER NOT NULL DEFAULT 0,
+    rows_downloaded INTEGER NOT NULL DEFAULT 0,
+    bytes_uploaded INTEGER NOT NULL DEFAULT 0,
+    bytes_downloaded INTEGER NOT NULL DEFAULT 0,
+    phase_timings_json TEXT,
+    message TEXT
+);
+
+UPDATE schema_version SET version = 6;
+COMMIT;
+PRAGMA foreign_keys=ON;
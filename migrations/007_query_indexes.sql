@@ -0,0 +1,67 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Indici secondari per le query più frequenti di database.py.
+-- Le colonne seguono l'ordine "filtro di uguaglianza, poi ordinamento", così
+-- SQLite può evitare sia la scansione completa sia l'ordinamento temporaneo.
+
+-- Dispositivi di una destinazione ordinati per descrizione (elenchi, export,
+-- stato verifiche) e controlli di integrità referenziale sulle destinazioni.
+CREATE INDEX IF NOT EXISTS idx_devices_destination_description
+ON devices(destination_id, description);
+
+-- Ricerca per matricola (importazioni, controllo duplicati).
+CREATE INDEX IF NOT EXISTS idx_devices_serial_number
+ON devices(serial_number);
+
+-- Elenco delle descrizioni uniche e rinomina massiva delle descrizioni.
+CREATE INDEX IF NOT EXISTS idx_devices_active_description
+ON devices(description)
+WHERE is_deleted = 0;
+
+-- Scadenzario: solo i dispositivi attivi con una prossima verifica pianificata.
+CREATE INDEX IF NOT EXISTS idx_devices_next_verification_date
+ON devices(next_verification_date)
+WHERE next_verification_date IS NOT NULL AND is_deleted = 0 AND status = 'active';
+
+-- Storico verifiche di un dispositivo e "ultima verifica" (l'id implicito
+-- nell'indice risolve anche lo spareggio ORDER BY verification_date, id).
+CREATE INDEX IF NOT EXISTS idx_verifications_device_date
+ON verifications(device_id, verification_date);
+
+-- Verifiche per data o intervallo di date (export STM, report mensili).
+CREATE INDEX IF NOT EXISTS idx_verifications_date
+ON verifications(verification_date);
+
+-- Destinazioni di un cliente ordinate per nome.
+CREATE INDEX IF NOT EXISTS idx_destinations_customer_name
+ON destinations(customer_id, name);
+
+-- Elenco clienti ordinato e ricerca esatta per nome.
+CREATE INDEX IF NOT EXISTS idx_customers_name
+ON customers(name);
+
+-- Test di un profilo.
+CREATE INDEX IF NOT EXISTS idx_profile_tests_profile
+ON profile_tests(profile_id);
+
+-- Ricerca per uuid durante la sincronizzazione (le altre tabelle hanno già
+-- un vincolo UNIQUE sull'uuid, quindi un indice implicito).
+CREATE INDEX IF NOT EXISTS idx_customers_uuid ON customers(uuid);
+CREATE INDEX IF NOT EXISTS idx_verifications_uuid ON verifications(uuid);
+CREATE INDEX IF NOT EXISTS idx_mti_instruments_uuid ON mti_instruments(uuid);
+
+-- Record da inviare al server: indici parziali minuscoli, contengono solo
+-- le righe con modifiche locali non ancora sincronizzate.
+CREATE INDEX IF NOT EXISTS idx_customers_unsynced ON customers(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_mti_instruments_unsynced ON mti_instruments(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_signatures_unsynced ON signatures(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_profiles_unsynced ON profiles(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_profile_tests_unsynced ON profile_tests(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_destinations_unsynced ON destinations(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_devices_unsynced ON devices(is_synced) WHERE is_synced = 0;
+CREATE INDEX IF NOT EXISTS idx_verifications_unsynced ON verifications(is_synced) WHERE is_synced = 0;
+
+UPDATE schema_version SET version = 7;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,104 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Indici full-text (FTS5) per la ricerca globale e la ricerca dispositivi.
+-- Sostituiscono i LIKE '%termine%' su più colonne (scansione completa a ogni
+-- tasto premuto) con ricerche per prefisso ordinate per pertinenza (bm25).
+
+-- Dispositivi: tabella FTS con contenuto proprio, perché include i nomi di
+-- destinazione e cliente presi dalle tabelle collegate. rowid = devices.id;
+-- contiene solo i dispositivi non eliminati.
+CREATE VIRTUAL TABLE IF NOT EXISTS devices_fts USING fts5(
+    serial_number, ams_inventory, customer_inventory, description, model,
+    manufacturer, department, destination_name, customer_name,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- Clienti: tabella FTS a contenuto esterno sulla tabella customers.
+CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(
+    name, address,
+    content = 'customers', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- --- Trigger dei dispositivi ---
+-- Gli UPDATE limitati alle colonne indicizzate evitano di riscrivere l'indice
+-- quando cambiano solo i flag di sincronizzazione.
+CREATE TRIGGER IF NOT EXISTS devices_fts_ai AFTER INSERT ON devices
+WHEN NEW.is_deleted = 0
+BEGIN
+    INSERT INTO devices_fts (rowid, serial_number, ams_inventory, customer_inventory, description, model,
+                             manufacturer, department, destination_name, customer_name)
+    SELECT NEW.id, NEW.serial_number, NEW.ams_inventory, NEW.customer_inventory, NEW.description, NEW.model,
+           NEW.manufacturer, NEW.department, dest.name, c.name
+    FROM (SELECT 1) LEFT JOIN destinations dest ON dest.id = NEW.destination_id
+    LEFT JOIN customers c ON c.id = dest.customer_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS devices_fts_au AFTER UPDATE OF
+    serial_number, ams_inventory, customer_inventory, description, model,
+    manufacturer, department, destination_id, is_deleted ON devices
+BEGIN
+    DELETE FROM devices_fts WHERE rowid = OLD.id;
+    INSERT INTO devices_fts (rowid, serial_number, ams_inventory, customer_inventory, description, model,
+                             manufacturer, department, destination_name, customer_name)
+    SELECT NEW.id, NEW.serial_number, NEW.ams_inventory, NEW.customer_inventory, NEW.description, NEW.model,
+           NEW.manufacturer, NEW.department, dest.name, c.name
+    FROM (SELECT 1) LEFT JOIN destinations dest ON dest.id = NEW.destination_id
+    LEFT JOIN customers c ON c.id = dest.customer_id
+    WHERE NEW.is_deleted = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS devices_fts_ad AFTER DELETE ON devices
+BEGIN
+    DELETE FROM devices_fts WHERE rowid = OLD.id;
+END;
+
+-- Rinomina o spostamento di una destinazione: aggiorna i dispositivi collegati.
+CREATE TRIGGER IF NOT EXISTS destinations_fts_au AFTER UPDATE OF name, customer_id ON destinations
+BEGIN
+    UPDATE devices_fts
+    SET destination_name = NEW.name,
+        customer_name = (SELECT name FROM customers WHERE id = NEW.customer_id)
+    WHERE rowid IN (SELECT id FROM devices WHERE destination_id = NEW.id);
+END;
+
+-- --- Trigger dei clienti ---
+CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers
+BEGIN
+    INSERT INTO customers_fts (rowid, name, address) VALUES (NEW.id, NEW.name, NEW.address);
+END;
+
+CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers
+BEGIN
+    INSERT INTO customers_fts (customers_fts, rowid, name, address) VALUES ('delete', OLD.id, OLD.name, OLD.address);
+END;
+
+CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE OF name, address ON customers
+BEGIN
+    INSERT INTO customers_fts (customers_fts, rowid, name, address) VALUES ('delete', OLD.id, OLD.name, OLD.address);
+    INSERT INTO customers_fts (rowid, name, address) VALUES (NEW.id, NEW.name, NEW.address);
+    UPDATE devices_fts SET customer_name = NEW.name
+    WHERE NEW.name IS NOT OLD.name
+      AND rowid IN (SELECT d.id FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+                    WHERE dest.customer_id = NEW.id);
+END;
+
+-- --- Popolamento iniziale ---
+DELETE FROM devices_fts;
+INSERT INTO devices_fts (rowid, serial_number, ams_inventory, customer_inventory, description, model,
+                         manufacturer, department, destination_name, customer_name)
+SELECT d.id, d.serial_number, d.ams_inventory, d.customer_inventory, d.description, d.model,
+       d.manufacturer, d.department, dest.name, c.name
+FROM devices d
+LEFT JOIN destinations dest ON dest.id = d.destination_id
+LEFT JOIN customers c ON c.id = dest.customer_id
+WHERE d.is_deleted = 0;
+
+INSERT INTO customers_fts (customers_fts) VALUES ('rebuild');
+
+UPDATE schema_version SET version = 8;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,56 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Dati dell'ultima verifica valida di ogni dispositivo, denormalizzati su
+-- devices e mantenuti dai trigger sulle verifiche. Sono colonne solo locali
+-- (non vengono inviate al server): gli elenchi leggono l'ultima verifica
+-- direttamente dalla riga del dispositivo invece di calcolare un
+-- ROW_NUMBER() su tutta la tabella verifications.
+ALTER TABLE devices ADD COLUMN last_verification_id INTEGER;
+ALTER TABLE devices ADD COLUMN last_verification_date TEXT;
+ALTER TABLE devices ADD COLUMN last_outcome TEXT;
+
+-- "Ultima" = data più recente, a parità di data l'id più alto, escluse le
+-- verifiche eliminate. Il ricalcolo usa idx_verifications_device_date.
+CREATE TRIGGER IF NOT EXISTS verifications_last_ai AFTER INSERT ON verifications
+BEGIN
+    UPDATE devices
+    SET (last_verification_id, last_verification_date, last_outcome) = (
+        SELECT id, verification_date, overall_status FROM verifications
+        WHERE device_id = NEW.device_id AND is_deleted = 0
+        ORDER BY verification_date DESC, id DESC LIMIT 1)
+    WHERE id = NEW.device_id;
+END;
+
+-- Soft delete, cambio di data/esito o spostamento su un altro dispositivo
+CREATE TRIGGER IF NOT EXISTS verifications_last_au AFTER UPDATE OF
+    is_deleted, verification_date, overall_status, device_id ON verifications
+BEGIN
+    UPDATE devices
+    SET (last_verification_id, last_verification_date, last_outcome) = (
+        SELECT v.id, v.verification_date, v.overall_status FROM verifications v
+        WHERE v.device_id = devices.id AND v.is_deleted = 0
+        ORDER BY v.verification_date DESC, v.id DESC LIMIT 1)
+    WHERE id IN (OLD.device_id, NEW.device_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS verifications_last_ad AFTER DELETE ON verifications
+BEGIN
+    UPDATE devices
+    SET (last_verification_id, last_verification_date, last_outcome) = (
+        SELECT id, verification_date, overall_status FROM verifications
+        WHERE device_id = OLD.device_id AND is_deleted = 0
+        ORDER BY verification_date DESC, id DESC LIMIT 1)
+    WHERE id = OLD.device_id;
+END;
+
+-- Popolamento iniziale
+UPDATE devices
+SET (last_verification_id, last_verification_date, last_outcome) = (
+    SELECT v.id, v.verification_date, v.overall_status FROM verifications v
+    WHERE v.device_id = devices.id AND v.is_deleted = 0
+    ORDER BY v.verification_date DESC, v.id DESC LIMIT 1);
+
+UPDATE schema_version SET version = 9;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,53 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Contatori dei codici verifica (formato II-AAMMGG-NNNN) per iniziali e data.
+-- Tabella solo locale: il prossimo numero si ottiene con un UPSERT atomico
+-- nella stessa transazione dell'inserimento della verifica, invece di cercare
+-- il codice più alto con un LIKE su tutta la tabella verifications.
+CREATE TABLE IF NOT EXISTS verification_code_counters (
+    initials TEXT NOT NULL,
+    code_date TEXT NOT NULL,
+    last_number INTEGER NOT NULL,
+    PRIMARY KEY (initials, code_date)
+) WITHOUT ROWID;
+
+-- Ogni codice inserito (anche se arriva dal server con la sincronizzazione)
+-- porta il contatore almeno al suo numero, così i codici generati in seguito
+-- non possono collidere con quelli esistenti.
+CREATE TRIGGER IF NOT EXISTS verifications_code_counter_ai AFTER INSERT ON verifications
+WHEN NEW.verification_code GLOB '?*-[0-9][0-9][0-9][0-9][0-9][0-9]-[0-9]*'
+BEGIN
+    INSERT INTO verification_code_counters (initials, code_date, last_number)
+    VALUES (
+        substr(NEW.verification_code, 1, instr(NEW.verification_code, '-') - 1),
+        substr(NEW.verification_code, instr(NEW.verification_code, '-') + 1, 6),
+        CAST(substr(NEW.verification_code, instr(NEW.verification_code, '-') + 8) AS INTEGER)
+    )
+    ON CONFLICT (initials, code_date) DO UPDATE SET last_number = max(last_number, excluded.last_number);
+END;
+
+CREATE TRIGGER IF NOT EXISTS verifications_code_counter_au AFTER UPDATE OF verification_code ON verifications
+WHEN NEW.verification_code GLOB '?*-[0-9][0-9][0-9][0-9][0-9][0-9]-[0-9]*'
+BEGIN
+    INSERT INTO verification_code_counters (initials, code_date, last_number)
+    VALUES (
+        substr(NEW.verification_code, 1, instr(NEW.verification_code, '-') - 1),
+        substr(NEW.verification_code, instr(NEW.verification_code, '-') + 1, 6),
+        CAST(substr(NEW.verification_code, instr(NEW.verification_code, '-') + 8) AS INTEGER)
+    )
+    ON CONFLICT (initials, code_date) DO UPDATE SET last_number = max(last_number, excluded.last_number);
+END;
+
+-- Popolamento iniziale dai codici esistenti
+INSERT OR REPLACE INTO verification_code_counters (initials, code_date, last_number)
+SELECT substr(verification_code, 1, instr(verification_code, '-') - 1),
+       substr(verification_code, instr(verification_code, '-') + 1, 6),
+       MAX(CAST(substr(verification_code, instr(verification_code, '-') + 8) AS INTEGER))
+FROM verifications
+WHERE verification_code GLOB '?*-[0-9][0-9][0-9][0-9][0-9][0-9]-[0-9]*'
+GROUP BY 1, 2;
+
+UPDATE schema_version SET version = 10;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,98 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Misure elettriche in forma normalizzata: una riga tipizzata per ogni test
+-- (e parte applicata) di verifications.results_json, così le interrogazioni
+-- sulle misure ("resistenza di terra oltre X per il modello Y") non devono
+-- leggere e decodificare il JSON di ogni verifica in Python.
+-- Tabella derivata e solo locale: è mantenuta dai trigger a partire da
+-- results_json, quindi resta allineata sia ai salvataggi sia alla
+-- sincronizzazione. Le misure delle verifiche eliminate logicamente restano:
+-- le query filtrano su verifications.is_deleted.
+CREATE TABLE IF NOT EXISTS verification_measurements (
+    verification_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,      -- posizione del risultato in results_json
+    name TEXT NOT NULL,             -- etichetta completa come registrata
+    test_name TEXT NOT NULL,        -- test (con parametro), senza la parte applicata
+    applied_part TEXT,              -- nome della parte applicata, NULL per i test standard
+    part_type TEXT,                 -- B, BF o CF
+    value REAL,                     -- valore numerico, NULL se non interpretabile
+    value_text TEXT,                -- valore come registrato
+    unit TEXT,
+    limit_value REAL,
+    passed INTEGER,
+    PRIMARY KEY (verification_id, position)
+) WITHOUT ROWID;
+
+-- Misure di un test filtrate per valore. Le misure di un dispositivo si
+-- raggiungono da idx_verifications_device_date e dalla chiave primaria.
+CREATE INDEX IF NOT EXISTS idx_verification_measurements_test_value
+ON verification_measurements(test_name, value);
+
+-- Unica definizione della conversione da JSON a righe, usata da trigger,
+-- popolamento iniziale e ricostruzione (database.rebuild_verification_measurements).
+-- Le etichette delle parti applicate hanno la forma "test - parte - tipo".
+-- I valori accettano la virgola decimale e prefissi come "<" o "≤".
+DROP VIEW IF EXISTS verification_measurements_source;
+CREATE VIEW verification_measurements_source AS
+SELECT verification_id, position, name,
+       CASE WHEN part_type IS NULL THEN name
+            ELSE substr(name, 1, instr(name, ' - ') - 1) END AS test_name,
+       CASE WHEN part_type IS NULL THEN NULL
+            ELSE substr(name, instr(name, ' - ') + 3,
+                        length(name) - instr(name, ' - ') - 2 - length(part_type) - 3) END AS applied_part,
+       part_type,
+       CASE WHEN value_clean GLOB '[0-9]*' OR value_clean GLOB '[-.][0-9]*' OR value_clean GLOB '-.[0-9]*'
+            THEN CAST(value_clean AS REAL) END AS value,
+       value_text, unit,
+       CASE WHEN limit_clean GLOB '[0-9]*' OR limit_clean GLOB '[-.][0-9]*' OR limit_clean GLOB '-.[0-9]*'
+            THEN CAST(limit_clean AS REAL) END AS limit_value,
+       passed
+FROM (
+    SELECT verification_id, position, name, value_text, unit, passed,
+           CASE WHEN name LIKE '% - % - BF' THEN 'BF'
+                WHEN name LIKE '% - % - CF' THEN 'CF'
+                WHEN name LIKE '% - % - B' THEN 'B' END AS part_type,
+           ltrim(trim(replace(value_text, ',', '.')), '<>=≤≥~ ') AS value_clean,
+           ltrim(trim(replace(CAST(limit_raw AS TEXT), ',', '.')), '<>=≤≥~ ') AS limit_clean
+    FROM (
+        SELECT v.id AS verification_id,
+               CAST(r.key AS INTEGER) AS position,
+               COALESCE(json_extract(r.value, '$.name'), '') AS name,
+               CAST(json_extract(r.value, '$.value') AS TEXT) AS value_text,
+               json_extract(r.value, '$.unit') AS unit,
+               COALESCE(json_extract(r.value, '$.limit_value'), json_extract(r.value, '$.limit')) AS limit_raw,
+               json_extract(r.value, '$.passed') AS passed
+        FROM verifications v
+        JOIN json_each(CASE WHEN json_valid(v.results_json) AND json_type(v.results_json) = 'array'
+                            THEN v.results_json ELSE '[]' END) r
+        WHERE r.type = 'object'
+    )
+);
+
+CREATE TRIGGER IF NOT EXISTS verification_measurements_ai AFTER INSERT ON verifications
+BEGIN
+    INSERT INTO verification_measurements
+    SELECT * FROM verification_measurements_source WHERE verification_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS verification_measurements_au AFTER UPDATE OF results_json ON verifications
+WHEN NEW.results_json IS NOT OLD.results_json
+BEGIN
+    DELETE FROM verification_measurements WHERE verification_id = OLD.id;
+    INSERT INTO verification_measurements
+    SELECT * FROM verification_measurements_source WHERE verification_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS verification_measurements_ad AFTER DELETE ON verifications
+BEGIN
+    DELETE FROM verification_measurements WHERE verification_id = OLD.id;
+END;
+
+-- --- Popolamento iniziale ---
+DELETE FROM verification_measurements;
+INSERT INTO verification_measurements SELECT * FROM verification_measurements_source;
+
+UPDATE schema_version SET version = 11;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,28 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Registro locale della manutenzione del database (non viene sincronizzato):
+-- una riga per ogni passo eseguito (eliminazione dei record cancellati,
+-- statistiche per il query planner, recupero dello spazio), con la durata e
+-- le pagine del file prima e dopo.
+CREATE TABLE IF NOT EXISTS maintenance_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,           -- identifica i passi della stessa esecuzione
+    task TEXT NOT NULL,             -- purge, optimize, vacuum
+    started_at TEXT NOT NULL,
+    duration_ms INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,           -- ok, error
+    rows_affected INTEGER NOT NULL DEFAULT 0,
+    pages_before INTEGER,
+    pages_after INTEGER,
+    pages_freed INTEGER NOT NULL DEFAULT 0,
+    details_json TEXT,
+    message TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_maintenance_log_task_started
+ON maintenance_log(task, started_at);
+
+UPDATE schema_version SET version = 12;
+COMMIT;
+PRAGMA foreign_keys=ON;
@@ -0,0 +1,117 @@
+PRAGMA foreign_keys=OFF;
+BEGIN;
+
+-- Riepilogo del pannello di controllo, mantenuto dai trigger: la dashboard
+-- legge contatori e scadenze da queste tabelle invece di contare ogni volta
+-- clienti e dispositivi e di unire dispositivi, destinazioni e clienti.
+-- Tabelle derivate e solo locali, ricalcolabili con
+-- database.rebuild_dashboard_summary().
+
+-- Contatori: clienti e dispositivi non eliminati.
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Dispositivi attivi per data della prossima verifica. I raggruppamenti
+-- (scadute, in scadenza entro N giorni) dipendono dalla data odierna e si
+-- ottengono sommando un intervallo di date: le righe sono una per giorno,
+-- non una per dispositivo.
+CREATE TABLE IF NOT EXISTS dashboard_due_dates (
+    due_date TEXT PRIMARY KEY,
+    device_count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Definizioni usate per il popolamento iniziale e per la ricostruzione.
+DROP VIEW IF EXISTS dashboard_counters_source;
+CREATE VIEW dashboard_counters_source AS
+SELECT 'customers' AS name, COUNT(*) AS value FROM customers WHERE is_deleted = 0
+UNION ALL
+SELECT 'devices', COUNT(*) FROM devices WHERE is_deleted = 0;
+
+DROP VIEW IF EXISTS dashboard_due_dates_source;
+CREATE VIEW dashboard_due_dates_source AS
+SELECT next_verification_date AS due_date, COUNT(*) AS device_count
+FROM devices
+WHERE next_verification_date IS NOT NULL AND is_deleted = 0 AND status = 'active'
+GROUP BY next_verification_date;
+
+-- --- Contatori ---
+CREATE TRIGGER IF NOT EXISTS dashboard_customers_ai AFTER INSERT ON customers
+WHEN NEW.is_deleted = 0
+BEGIN
+    UPDATE dashboard_counters SET value = value + 1 WHERE name = 'customers';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_customers_au AFTER UPDATE OF is_deleted ON customers
+WHEN (OLD.is_deleted = 0) IS NOT (NEW.is_deleted = 0)
+BEGIN
+    UPDATE dashboard_counters SET value = value + (CASE WHEN NEW.is_deleted = 0 THEN 1 ELSE -1 END)
+    WHERE name = 'customers';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_customers_ad AFTER DELETE ON customers
+WHEN OLD.is_deleted = 0
+BEGIN
+    UPDATE dashboard_counters SET value = value - 1 WHERE name = 'customers';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_devices_ai AFTER INSERT ON devices
+WHEN NEW.is_deleted = 0
+BEGIN
+    UPDATE dashboard_counters SET value = value + 1 WHERE name = 'devices';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_devices_au AFTER UPDATE OF is_deleted ON devices
+WHEN (OLD.is_deleted = 0) IS NOT (NEW.is_deleted = 0)
+BEGIN
+    UPDATE dashboard_counters SET value = value + (CASE WHEN NEW.is_deleted = 0 THEN 1 ELSE -1 END)
+    WHERE name = 'devices';
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_devices_ad AFTER DELETE ON devices
+WHEN OLD.is_deleted = 0
+BEGIN
+    UPDATE dashboard_counters SET value = value - 1 WHERE name = 'devices';
+END;
+
+-- --- Scadenze ---
+-- Un dispositivo conta se attivo, non eliminato e con una data pianificata
+-- (stessa condizione di idx_devices_next_verification_date).
+CREATE TRIGGER IF NOT EXISTS dashboard_due_ai AFTER INSERT ON devices
+WHEN NEW.next_verification_date IS NOT NULL AND NEW.is_deleted = 0 AND NEW.status = 'active'
+BEGIN
+    INSERT INTO dashboard_due_dates (due_date, device_count) VALUES (NEW.next_verification_date, 1)
+    ON CONFLICT(due_date) DO UPDATE SET device_count = device_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_due_au_old AFTER UPDATE OF next_verification_date, is_deleted, status ON devices
+WHEN OLD.next_verification_date IS NOT NULL AND OLD.is_deleted = 0 AND OLD.status = 'active'
+BEGIN
+    UPDATE dashboard_due_dates SET device_count = device_count - 1 WHERE due_date = OLD.next_verification_date;
+    DELETE FROM dashboard_due_dates WHERE due_date = OLD.next_verification_date AND device_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_due_au_new AFTER UPDATE OF next_verification_date, is_deleted, status ON devices
+WHEN NEW.next_verification_date IS NOT NULL AND NEW.is_deleted = 0 AND NEW.status = 'active'
+BEGIN
+    INSERT INTO dashboard_due_dates (due_date, device_count) VALUES (NEW.next_verification_date, 1)
+    ON CONFLICT(due_date) DO UPDATE SET device_count = device_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS dashboard_due_ad AFTER DELETE ON devices
+WHEN OLD.next_verification_date IS NOT NULL AND OLD.is_deleted = 0 AND OLD.status = 'active'
+BEGIN
+    UPDATE dashboard_due_dates SET device_count = device_count - 1 WHERE due_date = OLD.next_verification_date;
+    DELETE FROM dashboard_due_dates WHERE due_date = OLD.next_verification_date AND device_count <= 0;
+END;
+
+-- --- Popolamento iniziale ---
+DELETE FROM dashboard_counters;
+INSERT INTO dashboard_counters (name, value) SELECT name, value FROM dashboard_counters_source;
+DELETE FROM dashboard_due_dates;
+INSERT INTO dashboard_due_dates (due_date, device_count) SELECT due_date, device_count FROM dashboard_due_dates_source;
+
+UPDATE schema_version SET version = 13;
+COMMIT;
+PRAGMA foreign_keys=ON;
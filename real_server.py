@@ -12,11 +12,19 @@ import logging
 import base64
 import os
 import json
+import re
+import gzip
+import shutil
+import sqlite3
+import hashlib
+import tempfile
 from dotenv import load_dotenv
 # Sicurezza
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError, InvalidHash
 from jose import JWTError, jwt
+# Migrazioni SQLite condivise con il client
+from sql_scripts import split_sql_statements
 load_dotenv()
 # --- CONFIGURAZIONE DI SICUREZZA ---
 SECRET_KEY = os.getenv("SECRET_KEY") # IN PRODUZIONE, QUESTA CHIAVE DOVREBBE ESSERE GESTITA IN MODO SICURO
@@ -684,6 +692,245 @@ def delete_signature(username: str, current_user: User = Depends(get_current_use
     finally:
         if conn: conn.close()
 
+# --- SNAPSHOT SQLITE PER IL BOOTSTRAP DEI CLIENT ---
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Margine sul cursore: copre le sincronizzazioni iniziate prima dello snapshot
+# ma confermate dopo; i record ripetuti vengono semplicemente riapplicati dal client.
+SNAPSHOT_CURSOR_MARGIN = timedelta(minutes=5)
+# Tabelle figlie e relativa chiave esterna verso il genitore nello snapshot
+SNAPSHOT_PARENT_KEYS = {
+    "destinations": ("customer_id", "customers"),
+    "profile_tests": ("profile_id", "profiles"),
+    "devices": ("destination_id", "destinations"),
+    "verifications": ("device_id", "devices"),
+}
+
+def _create_snapshot_schema(sqlite_conn) -> int:
+    """Crea lo schema del client applicando le stesse migrazioni SQL. Restituisce la versione finale."""
+    # Gli script gestiscono da soli BEGIN/COMMIT: niente transazioni implicite
+    sqlite_conn.isolation_level = None
+    version = 0
+    for m_file in sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith(".sql")):
+        try:
+            file_version = int(m_file.split("_")[0])
+        except (ValueError, IndexError):
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, m_file), "r", encoding="utf-8") as f:
+            script = f.read()
+        # Stessa compatibilità del client: niente 'ADD COLUMN IF NOT EXISTS'
+        # ed errori idempotenti (colonna/oggetto già esistente) ignorati
+        script = re.sub(r"(?i)(ADD\s+COLUMN)\s+IF\s+NOT\s+EXISTS", r"\1", script)
+        for statement in split_sql_statements(script):
+            try:
+                sqlite_conn.execute(statement)
+            except sqlite3.OperationalError as e:
+                if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                    continue
+                raise
+        version = max(version, file_version)
+    sqlite_conn.execute("UPDATE schema_version SET version = ?", (version,))
+    sqlite_conn.isolation_level = ""
+    return version
+
+def _sqlite_value(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+def _build_sqlite_snapshot(pg_cursor, sqlite_path: str) -> int:
+    """Copia tutti i record attivi da PostgreSQL in un nuovo database SQLite con lo schema del client."""
+    sqlite_conn = sqlite3.connect(sqlite_path)
+    try:
+        version = _create_snapshot_schema(sqlite_conn)
+        sqlite_conn.execute("PRAGMA foreign_keys = OFF")
+        for table in TABLES_TO_SYNC:
+            local_cols = [row[1] for row in sqlite_conn.execute(f"PRAGMA table_info({table})")]
+            if table == "signatures":
+                pg_cursor.execute("SELECT * FROM signatures")
+            else:
+                pg_cursor.execute(f"SELECT * FROM {table} WHERE is_deleted = FALSE")
+            rows = pg_cursor.fetchall()
+            if not rows:
+                continue
+            # Gli id del server diventano gli id locali: le chiavi esterne restano coerenti
+            cols = [c for c in local_cols if c in rows[0] and c != "is_synced"]
+            sql = f"INSERT INTO {table} ({', '.join(cols)}, is_synced) VALUES ({', '.join(['?'] * len(cols))}, 1)"
+            sqlite_conn.executemany(sql, (tuple(_sqlite_value(r[c]) for c in cols) for r in rows))
+            logging.info(f"Snapshot: {len(rows)} record copiati in '{table}'.")
+
+        # Rimuove i figli rimasti orfani di un genitore eliminato
+        for table, (fk_col, parent) in SNAPSHOT_PARENT_KEYS.items():
+            cur = sqlite_conn.execute(
+                f"DELETE FROM {table} WHERE {fk_col} IS NOT NULL AND {fk_col} NOT IN (SELECT id FROM {parent})"
+            )
+            if cur.rowcount:
+                logging.warning(f"Snapshot: rimossi {cur.rowcount} record orfani da '{table}'.")
+        sqlite_conn.commit()
+
+        if sqlite_conn.execute("PRAGMA integrity_check").fetchone()[0] != "ok":
+            raise RuntimeError("Lo snapshot generato non supera il controllo di integrità.")
+        sqlite_conn.execute("VACUUM")
+    finally:
+        sqlite_conn.close()
+    return version
+
+@app.get("/snapshot")
+def get_snapshot(current_user: User = Depends(get_current_user)):
+    """
+    Restituisce un database SQLite precompilato e compresso (gzip) con tutti i dati
+    attivi, pronto per essere installato da un client nuovo o da una sincronizzazione
+    completa. Gli header contengono l'hash SHA-256 del file e il cursore di sync.
+    """
+    from fastapi.responses import FileResponse
+    from starlette.background import BackgroundTask
+
+    logging.info("Richiesta di snapshot del database.")
+    sync_cursor = datetime.now(timezone.utc) - SNAPSHOT_CURSOR_MARGIN
+    work_dir = tempfile.mkdtemp(prefix="stm_snapshot_")
+    sqlite_path = os.path.join(work_dir, "snapshot.db")
+    gz_path = sqlite_path + ".gz"
+    conn = None
+    try:
+        conn = get_db_connection()
+        # Lettura coerente di tutte le tabelle nello stesso istante
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            schema_version = _build_sqlite_snapshot(cursor, sqlite_path)
+        conn.rollback()
+
+        digest = hashlib.sha256()
+        with open(sqlite_path, "rb") as src, gzip.open(gz_path, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        with open(gz_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+
+        return FileResponse(
+            gz_path,
+            media_type="application/gzip",
+            filename="snapshot.db.gz",
+            headers={
+                "X-Snapshot-SHA256": digest.hexdigest(),
+                "X-Sync-Timestamp": sync_cursor.isoformat(),
+                "X-Schema-Version": str(schema_version),
+            },
+            background=BackgroundTask(shutil.rmtree, work_dir, ignore_errors=True),
+        )
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logging.error(f"Errore durante la generazione dello snapshot: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn: conn.close()
+
+# --- RICONCILIAZIONE A HASH (ALBERO DI MERKLE SUGLI UUID) ---
+RECONCILE_TABLES = ["customers", "mti_instruments", "profiles", "profile_tests", "destinations", "devices", "verifications"]
+# Query dei record completi per tabella, con l'uuid del genitore come nella /sync
+RECONCILE_ROW_QUERIES = {
+    "destinations": "SELECT t.*, c.uuid AS customer_uuid FROM destinations t LEFT JOIN customers c ON t.customer_id = c.id",
+    "profile_tests": "SELECT t.*, p.uuid AS profile_uuid FROM profile_tests t LEFT JOIN profiles p ON t.profile_id = p.id",
+    "devices": "SELECT t.*, dest.uuid AS destination_uuid FROM devices t LEFT JOIN destinations dest ON t.destination_id = dest.id",
+    "verifications": "SELECT t.*, d.uuid AS device_uuid FROM verifications t LEFT JOIN devices d ON t.device_id = d.id",
+}
+HEX_PREFIX_RE = re.compile(r"^[0-9a-f]{1,32}$")
+
+class ReconcileRequest(BaseModel):
+    table: str
+    prefixes: List[str]
+
+def _normalize_reconcile_timestamp(value) -> str:
+    """Rappresentazione canonica di last_modified (UTC, microsecondi), identica a quella del client."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return str(value)
+
+def _reconcile_row_digest(row_uuid: str, last_modified) -> int:
+    key = f"{row_uuid.lower()}|{_normalize_reconcile_timestamp(last_modified)}".encode("utf-8")
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], "big")
+
+def _validate_reconcile_request(request: ReconcileRequest) -> list:
+    if request.table not in RECONCILE_TABLES:
+        raise HTTPException(status_code=400, detail=f"Tabella non riconciliabile: {request.table}")
+    prefixes = [p.lower() for p in request.prefixes]
+    if not prefixes or len(prefixes) > 4096 or not all(HEX_PREFIX_RE.match(p) for p in prefixes):
+        raise HTTPException(status_code=400, detail="Prefissi non validi.")
+    return prefixes
+
+@app.post("/reconcile/summary")
+def reconcile_summary(request: ReconcileRequest, current_user: User = Depends(get_current_user)):
+    """
+    Per ogni prefisso (esadecimale, sull'uuid senza trattini) restituisce il numero
+    di record attivi e lo XOR degli hash di (uuid, last_modified).
+    """
+    prefixes = _validate_reconcile_request(request)
+    length = len(prefixes[0])
+    if any(len(p) != length for p in prefixes):
+        raise HTTPException(status_code=400, detail="I prefissi di una richiesta devono avere la stessa lunghezza.")
+    buckets = {p: [0, 0] for p in prefixes}
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"SELECT uuid, last_modified FROM {request.table} "
+                f"WHERE is_deleted = FALSE AND uuid IS NOT NULL "
+                f"AND substr(lower(replace(uuid, '-', '')), 1, %s) = ANY(%s)",
+                (length, prefixes)
+            )
+            for row_uuid, last_modified in cursor:
+                bucket = buckets[row_uuid.replace("-", "").lower()[:length]]
+                bucket[0] += 1
+                bucket[1] ^= _reconcile_row_digest(row_uuid, last_modified)
+        return {"buckets": {p: {"count": c, "hash": f"{h:016x}"} for p, (c, h) in buckets.items()}}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Errore nel riepilogo di riconciliazione: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn: conn.close()
+
+@app.post("/reconcile/rows")
+def reconcile_rows(request: ReconcileRequest, current_user: User = Depends(get_current_user)):
+    """Restituisce i record completi (anche eliminati) i cui uuid iniziano con i prefissi richiesti."""
+    prefixes = _validate_reconcile_request(request)
+    base_query = RECONCILE_ROW_QUERIES.get(request.table, f"SELECT t.* FROM {request.table} t")
+    conn = None
+    try:
+        conn = get_db_connection()
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                f"{base_query} WHERE t.uuid IS NOT NULL AND "
+                f"lower(replace(t.uuid, '-', '')) LIKE ANY(%s)",
+                ([p + "%" for p in prefixes],)
+            )
+            rows = cursor.fetchall()
+        for row in rows:
+            for key, value in list(row.items()):
+                if isinstance(value, (datetime, date)):
+                    row[key] = value.isoformat()
+        return {"rows": rows}
+    except Exception as e:
+        logging.error(f"Errore nel recupero dei record da riconciliare: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if conn: conn.close()
+
 # --- ENDPOINT ROOT ---
 @app.get("/")
 def root():
@@ -0,0 +1,29 @@
+# sql_scripts.py
+"""
+Utilità per gli script SQL delle migrazioni, condivise da client
+(database.py), server (real_server.py, snapshot SQLite) e strumenti
+(tools/seed_database.py). Dipende solo da sqlite3.
+"""
+import sqlite3
+
+
+def split_sql_statements(script: str) -> list:
+    """
+    Divide uno script SQL in statement completi, senza il ';' finale.
+    Lo script viene spezzato sui ';' e i pezzi vengono riuniti finché
+    sqlite3.complete_statement non riconosce uno statement completo: i corpi
+    BEGIN ... END dei trigger, che contengono ';', restano interi.
+    Un eventuale resto incompleto in fondo allo script viene restituito così com'è.
+    """
+    statements, pending = [], ""
+    for piece in script.split(';'):
+        pending += piece + ';'
+        if sqlite3.complete_statement(pending):
+            statement = pending.strip().rstrip(';').strip()
+            if statement:
+                statements.append(statement)
+            pending = ""
+    remainder = pending.strip().rstrip(';').strip()
+    if remainder:
+        statements.append(remainder)
+    return statements
@@ -0,0 +1,160 @@
+# tools/benchmark_storage.py
+"""
+Confronta il profilo di archiviazione SQLite configurato in config.ini
+(sezione [database]) con le impostazioni predefinite di SQLite, su un
+database di prova generato da seed_database.py.
+
+Misura:
+  1. commit piccoli e frequenti (salvataggio di una verifica alla volta);
+  2. latenza delle scritture mentre un altro thread esegue una lettura lunga
+     (come un worker di esportazione);
+  3. letture ripetute dell'elenco dispositivi di una destinazione.
+
+Uso:
+    python tools/benchmark_storage.py [--commits N] [--customers N]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from app import config
+from tools import seed_database
+
+SQLITE_DEFAULTS = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size_mb': 2,
+    'mmap_size_mb': 0,
+    'busy_timeout_ms': 5000,
+}
+
+
+def _connect(path, settings):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    database.apply_storage_profile(conn, settings)
+    return conn
+
+
+def _save_verification(conn, rng, device_id):
+    row = seed_database._verification_row(rng, device_id, "2024-06-01", "2024-06-01T00:00:00+00:00")
+    seed_database.insert_verifications(conn, [row])
+    conn.execute("UPDATE devices SET next_verification_date = ?, is_synced = 0 WHERE id = ?",
+                 ("2025-06-01", device_id))
+    conn.commit()
+
+
+def bench_small_commits(path, settings, commits):
+    conn = _connect(path, settings)
+    rng = random.Random(1)
+    max_device = conn.execute("SELECT MAX(id) FROM devices").fetchone()[0]
+    start = time.perf_counter()
+    for _ in range(commits):
+        _save_verification(conn, rng, rng.randint(1, max_device))
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return {'commit/s': commits / elapsed}
+
+
+def bench_writes_during_export(path, settings, commits):
+    writer = _connect(path, settings)
+    reader = _connect(path, settings)
+    rng = random.Random(2)
+    max_device = writer.execute("SELECT MAX(id) FROM devices").fetchone()[0]
+    stop = threading.Event()
+
+    def export_loop():
+        # Simula un'esportazione che scorre lentamente un risultato grande
+        while not stop.is_set():
+            cursor = reader.execute(
+                "SELECT v.*, d.serial_number FROM verifications v JOIN devices d ON d.id = v.device_id")
+            for i, _ in enumerate(cursor):
+                if stop.is_set():
+                    break
+                if i % 500 == 0:
+                    time.sleep(0.001)
+            cursor.close()
+
+    thread = threading.Thread(target=export_loop, daemon=True)
+    thread.start()
+    latencies, failures = [], 0
+    for _ in range(commits):
+        start = time.perf_counter()
+        try:
+            _save_verification(writer, rng, rng.randint(1, max_device))
+            latencies.append((time.perf_counter() - start) * 1000)
+        except sqlite3.OperationalError:
+            writer.rollback()
+            failures += 1
+    stop.set()
+    thread.join()
+    writer.close()
+    reader.close()
+    if not latencies:
+        return {'errori': failures}
+    latencies.sort()
+    return {
+        'p50 ms': statistics.median(latencies),
+        'p95 ms': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        'max ms': latencies[-1],
+        'errori': failures,
+    }
+
+
+def bench_repeated_reads(path, settings, rounds=300):
+    conn = _connect(path, settings)
+    rng = random.Random(3)
+    max_destination = conn.execute("SELECT MAX(id) FROM destinations").fetchone()[0]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        conn.execute("SELECT * FROM devices WHERE destination_id = ? AND is_deleted = 0 ORDER BY description",
+                     (rng.randint(1, max_destination),)).fetchall()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return {'query/s': rounds / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del profilo di archiviazione SQLite.")
+    parser.add_argument("--commits", type=int, default=300)
+    parser.add_argument("--customers", type=int, default=50)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="stm_bench_")
+    try:
+        template = os.path.join(work_dir, "template.db")
+        counts = seed_database.create_seeded_database(template, customers=args.customers)
+        print("Database di prova:", ", ".join(f"{t}: {n}" for t, n in counts.items()))
+
+        profiles = (("Predefinito SQLite", SQLITE_DEFAULTS), ("Profilo config.ini", config.DATABASE_SETTINGS))
+        benchmarks = (("Commit singoli", bench_small_commits),
+                      ("Scritture durante esportazione", bench_writes_during_export),
+                      ("Letture ripetute", lambda path, settings, _: bench_repeated_reads(path, settings)))
+
+        for title, bench in benchmarks:
+            print(f"\n{title}")
+            for label, settings in profiles:
+                path = os.path.join(work_dir, "bench.db")
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                shutil.copyfile(template, path)
+                result = bench(path, settings, args.commits)
+                print(f"  {label:<20} " + "  ".join(f"{k}: {v:.1f}" if isinstance(v, float) else f"{k}: {v}"
+                                                   for k, v in result.items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
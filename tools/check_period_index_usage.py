@@ -0,0 +1,131 @@
+# tools/check_period_index_usage.py
+"""
+Verifica che le query per periodo (mese, giorno, intervallo di date) di
+database.py usino un indice su verification_date.
+
+Esegue le funzioni DAO su un database di prova, cattura gli statement SQL con
+il trace callback e controlla che l'EXPLAIN QUERY PLAN contenga una ricerca
+per intervallo, ad esempio:
+    SEARCH v USING INDEX idx_verifications_date (verification_date>? AND verification_date<?)
+Per confronto mostra anche il piano della vecchia forma con strftime(), che
+non può usare l'indice.
+
+Uso:
+    python tools/check_period_index_usage.py [--customers N]
+Termina con codice 1 se una query per periodo non usa l'indice.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from tools import seed_database
+
+_RANGE_MARKER = "verification_date>? AND verification_date<?"
+
+_LEGACY_MONTH_QUERY = """
+    SELECT v.id FROM verifications v
+    WHERE strftime('%Y', v.verification_date) = ? AND strftime('%m', v.verification_date) = ?
+"""
+
+
+def _period_calls(sample):
+    """Elenco (nome, funzione) delle DAO che filtrano le verifiche per periodo."""
+    d, c, day = sample['destination_id'], sample['customer_id'], sample['verification_date']
+    year, month = int(day[:4]), int(day[5:7])
+    return [
+        ("get_verifications_for_destination_by_month",
+         lambda: database.get_verifications_for_destination_by_month(d, year, month)),
+        ("get_verifications_for_customer_by_month",
+         lambda: database.get_verifications_for_customer_by_month(c, year, month)),
+        ("get_verifications_for_destination_by_date_range",
+         lambda: database.get_verifications_for_destination_by_date_range(d, f"{year}-01-01", f"{year}-12-31")),
+        ("get_full_verification_data_for_date", lambda: database.get_full_verification_data_for_date(day)),
+        ("get_devices_verification_status_by_period",
+         lambda: database.get_devices_verification_status_by_period(d, f"{year}-01-01", f"{year}-12-31")),
+        ("get_unverified_devices_for_destination_in_period",
+         lambda: database.get_unverified_devices_for_destination_in_period(d, f"{year}-01-01", f"{year}-12-31")),
+        ("advanced_search (periodo)",
+         lambda: database.advanced_search({"start_date": f"{year}-01-01", "end_date": f"{year}-03-31"})),
+    ]
+
+
+def _load_sample(conn):
+    row = conn.execute("""
+        SELECT dest.id AS destination_id, dest.customer_id, v.verification_date
+        FROM verifications v
+        JOIN devices d ON d.id = v.device_id
+        JOIN destinations dest ON dest.id = d.destination_id
+        WHERE v.is_deleted = 0
+        LIMIT 1
+    """).fetchone()
+    return dict(row)
+
+
+def _plan_details(conn, statement, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, params).fetchall()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controlla l'uso degli indici nelle query per periodo.")
+    parser.add_argument("--customers", type=int, default=20)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="stm_periods_")
+    failures = 0
+    try:
+        db_path = os.path.join(work_dir, "periods.db")
+        seed_database.create_seeded_database(db_path, customers=args.customers)
+        database.DB_PATH = db_path
+        database.close_all_connections()
+        database.migrate_database()
+
+        pooled = database._get_thread_connection(db_path)
+        conn = pooled.conn
+        conn.execute("ANALYZE")
+        conn.commit()
+        sample = _load_sample(conn)
+
+        print("Forma precedente (strftime sulla colonna):")
+        for detail in _plan_details(conn, _LEGACY_MONTH_QUERY, ("2020", "05")):
+            print(f"      - {detail}")
+        print()
+
+        captured = []
+
+        def trace(statement):
+            pooled._track_statement(statement)
+            captured.append(statement)
+
+        for name, call in _period_calls(sample):
+            captured.clear()
+            conn.set_trace_callback(trace)
+            try:
+                call()
+            finally:
+                conn.set_trace_callback(pooled._track_statement)
+
+            # Solo gli statement che filtrano per data: le altre query della DAO non interessano
+            statements = [s for s in captured
+                          if s.lstrip().upper().startswith("SELECT") and "verification_date >=" in s]
+            plans = [_plan_details(conn, s) for s in statements]
+            ok = bool(plans) and all(any(_RANGE_MARKER in detail for detail in plan) for plan in plans)
+            failures += not ok
+            print(f"[{'OK' if ok else 'NESSUN INDICE'}] {name}")
+            for plan in plans:
+                for detail in plan:
+                    print(f"      - {detail}")
+    finally:
+        database.close_all_connections()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{failures} query per periodo senza indice.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# tools/check_query_plans.py
+"""
+Esegue le funzioni DAO di database.py su un database di prova e, per ogni
+statement SQL effettivamente eseguito (catturato con il trace callback della
+connessione), mostra l'EXPLAIN QUERY PLAN.
+
+Segnala le scansioni complete non previste (e, con --verbose, gli ordinamenti
+in B-tree temporanei). Le funzioni che per loro natura leggono tutta
+una tabella (es. esportazioni complete) sono marcate come scansione attesa.
+
+Uso:
+    python tools/check_query_plans.py [--customers N] [--verbose]
+Termina con codice 1 se trova scansioni complete non previste.
+"""
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from tools import seed_database
+
+# "SCAN d" senza "USING ..." indica una lettura dell'intera tabella
+_FULL_SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def _dao_calls(sample):
+    """
+    Elenco (nome, funzione, scansione_attesa). 'sample' contiene id e valori
+    reali presi dal database di prova.
+    """
+    d, c, dev = sample['destination_id'], sample['customer_id'], sample['device_id']
+    serial, desc, day = sample['serial_number'], sample['description'], sample['verification_date']
+    return [
+        ("get_devices_for_destination", lambda: database.get_devices_for_destination(d), False),
+        ("get_devices_for_destination_manager", lambda: database.get_devices_for_destination_manager(d), False),
+        ("get_devices_for_customer", lambda: database.get_devices_for_customer(c), False),
+        ("get_all_devices_for_customer", lambda: database.get_all_devices_for_customer(c), False),
+        ("get_device_count_for_customer", lambda: database.get_device_count_for_customer(c), False),
+        ("get_device_count_for_destination", lambda: database.get_device_count_for_destination(d), False),
+        ("get_device_by_id", lambda: database.get_device_by_id(dev), False),
+        ("get_device_by_serial", lambda: database.get_device_by_serial(serial), False),
+        ("find_device_by_serial", lambda: database.find_device_by_serial(serial, include_deleted=True), False),
+        ("device_exists", lambda: database.device_exists(serial), False),
+        ("get_all_unique_device_descriptions", database.get_all_unique_device_descriptions, False),
+        ("get_devices_by_description", lambda: database.get_devices_by_description(desc), False),
+        ("get_devices_needing_verification", database.get_devices_needing_verification, False),
+        ("get_devices_with_last_verification_for_destination",
+         lambda: database.get_devices_with_last_verification_for_destination(d), False),
+        ("get_devices_with_verifications_for_destination_by_date_range",
+         lambda: database.get_devices_with_verifications_for_destination_by_date_range(d, "2020-01-01", "2020-12-31"), False),
+        ("get_devices_for_customer_inventory_export", lambda: database.get_devices_for_customer_inventory_export(c), False),
+        ("get_destinations_for_customer", lambda: database.get_destinations_for_customer(c), False),
+        ("get_destination_by_id", lambda: database.get_destination_by_id(d), False),
+        ("get_all_destinations_with_customer", database.get_all_destinations_with_customer, True),
+        ("get_all_customers", database.get_all_customers, False),
+        ("get_customer_by_id", lambda: database.get_customer_by_id(c), False),
+        ("verification_exists", lambda: database.verification_exists(dev, day, "CEI 62353 CLASSE I"), False),
+        ("get_verifications_for_device", lambda: database.get_verifications_for_device(dev), False),
+        ("get_devices_page_for_customer (pagina 2)",
+         lambda: database.get_devices_page_for_customer(
+             c, database.get_devices_page_for_customer(c, page_size=5)[1], page_size=5), False),
+        ("get_verifications_page_for_device (pagina 2)",
+         lambda: database.get_verifications_page_for_device(
+             dev, database.get_verifications_page_for_device(dev, page_size=1)[1], page_size=1), False),
+        ("get_verification_count_for_device", lambda: database.get_verification_count_for_device(dev), False),
+        ("search_measurements",
+         lambda: database.search_measurements("Resistenza conduttore di protezione", min_value=0.25, model="MOD-1"), False),
+        ("get_measurements_for_device", lambda: database.get_measurements_for_device(dev), False),
+        ("get_verifications_for_destination_by_date_range",
+         lambda: database.get_verifications_for_destination_by_date_range(d, "2020-01-01", "2020-12-31"), False),
+        ("get_verifications_for_destination_by_month",
+         lambda: database.get_verifications_for_destination_by_month(d, 2020, 5), False),
+        ("get_full_verification_data_for_date", lambda: database.get_full_verification_data_for_date(day), False),
+        ("get_devices_verification_status_by_period",
+         lambda: database.get_devices_verification_status_by_period(d, "2020-01-01", "2020-12-31"), False),
+        ("get_unverified_devices_for_destination_in_period",
+         lambda: database.get_unverified_devices_for_destination_in_period(d, "2020-01-01", "2020-12-31"), False),
+        ("get_devices_with_last_verification", database.get_devices_with_last_verification, True),
+        ("get_devices_for_manager_view", lambda: database.get_devices_for_manager_view(d, desc[:4]), False),
+        ("search_device_globally", lambda: database.search_device_globally(serial[:6]), False),
+        ("search_customers_globally", lambda: database.search_customers_globally("cliente"), False),
+        ("get_devices_for_destination (ricerca)", lambda: database.get_devices_for_destination(d, desc[:4]), False),
+        ("advanced_search", lambda: database.advanced_search({"serial_number": serial}), True),
+        # Scansione prevista solo su dashboard_counters (una riga per contatore)
+        ("get_stats", database.get_stats, True),
+        ("get_dashboard_summary", database.get_dashboard_summary, True),
+        ("has_unsynced_changes", database.has_unsynced_changes, False),
+    ]
+
+
+def _load_sample(conn):
+    row = conn.execute("""
+        SELECT d.id AS device_id, d.destination_id, dest.customer_id, d.serial_number, d.description,
+               (SELECT verification_date FROM verifications WHERE device_id = d.id LIMIT 1) AS verification_date
+        FROM devices d JOIN destinations dest ON dest.id = d.destination_id
+        WHERE EXISTS (SELECT 1 FROM verifications WHERE device_id = d.id)
+        LIMIT 1
+    """).fetchone()
+    return dict(row)
+
+
+def _analyze_plan(plan_rows, expect_scan):
+    """
+    Restituisce (problemi, note) per un piano di esecuzione: le scansioni
+    complete non previste sono problemi; gli ordinamenti temporanei sono solo
+    note, perché su risultati già filtrati da un indice sono economici.
+    """
+    problems, notes = [], []
+    for _id, _parent, _unused, detail in plan_rows:
+        if _FULL_SCAN_RE.match(detail) and not expect_scan:
+            problems.append(f"scansione completa: {detail}")
+        elif "USE TEMP B-TREE" in detail:
+            notes.append(f"ordinamento temporaneo: {detail}")
+    return problems, notes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN delle query DAO su un database di prova.")
+    parser.add_argument("--customers", type=int, default=30)
+    parser.add_argument("--verbose", action="store_true", help="Mostra il piano di tutte le query, non solo dei problemi.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="stm_plans_")
+    failures = 0
+    try:
+        db_path = os.path.join(work_dir, "plans.db")
+        seed_database.create_seeded_database(db_path, customers=args.customers)
+        # DatabaseConnection risolve DB_PATH a ogni apertura: le DAO useranno il database di prova
+        database.DB_PATH = db_path
+        database.close_all_connections()
+        database.migrate_database()
+
+        pooled = database._get_thread_connection(db_path)
+        conn = pooled.conn
+        conn.execute("ANALYZE")
+        conn.commit()
+        sample = _load_sample(conn)
+
+        captured = []
+
+        def trace(statement):
+            pooled._track_statement(statement)
+            captured.append(statement)
+
+        for name, call, expect_scan in _dao_calls(sample):
+            captured.clear()
+            conn.set_trace_callback(trace)
+            try:
+                call()
+            finally:
+                conn.set_trace_callback(pooled._track_statement)
+
+            # Le query interne dei moduli FTS5 (es. "SELECT k, v FROM 'main'.'devices_fts_config'") non interessano
+            statements = [s for s in captured
+                          if s.lstrip().upper().startswith(("SELECT", "WITH")) and "'main'." not in s]
+            report = []
+            for statement in statements:
+                plan = conn.execute("EXPLAIN QUERY PLAN " + statement).fetchall()
+                problems, notes = _analyze_plan(plan, expect_scan)
+                report.append((statement, plan, problems, notes))
+
+            has_problems = any(problems for _, _, problems, _ in report)
+            failures += has_problems
+            status = "DA RIVEDERE" if has_problems else ("OK (scansione attesa)" if expect_scan else "OK")
+            print(f"[{status}] {name}")
+            for statement, plan, problems, notes in report:
+                if problems or args.verbose:
+                    print("    " + " ".join(statement.split())[:160])
+                    for _id, _parent, _unused, detail in plan:
+                        print(f"      - {detail}")
+                    for problem in problems:
+                        print(f"      ! {problem}")
+                    for note in notes:
+                        print(f"      ~ {note}")
+    finally:
+        database.close_all_connections()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{failures} funzioni DAO con piani da rivedere.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
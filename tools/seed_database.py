@@ -0,0 +1,154 @@
+# tools/seed_database.py
+"""
+Crea un database locale di prova, con lo schema delle migrazioni e dati
+sintetici di dimensioni realistiche, per benchmark e controlli sulle query.
+
+Uso:
+    python tools/seed_database.py percorso.db [--customers N] [--devices-per-destination N]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sql_scripts import split_sql_statements
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+DESCRIPTIONS = ("ELETTROCARDIOGRAFO", "DEFIBRILLATORE", "POMPA INFUSIONALE", "MONITOR MULTIPARAMETRICO",
+                "ASPIRATORE CHIRURGICO", "LAMPADA SCIALITICA", "LETTO ELETTRICO", "ELETTROBISTURI")
+MANUFACTURERS = ("PHILIPS", "GE HEALTHCARE", "MINDRAY", "DRAEGER", "SCHILLER", "B. BRAUN")
+DEPARTMENTS = ("CARDIOLOGIA", "PRONTO SOCCORSO", "SALA OPERATORIA", "RIANIMAZIONE", "AMBULATORIO")
+PROFILES = ("CEI 62353 CLASSE I", "CEI 62353 CLASSE II", "CEI 62353 BATTERIA")
+
+
+def create_schema(conn):
+    """Applica in ordine tutte le migrazioni SQL, ignorando gli errori idempotenti."""
+    conn.isolation_level = None
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    if conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == 0:
+        conn.execute("INSERT INTO schema_version (version) VALUES (0)")
+    for name in sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql')):
+        with open(os.path.join(MIGRATIONS_DIR, name), 'r', encoding='utf-8') as f:
+            # Come in database._execute_sql_script_compat: SQLite non supporta 'ADD COLUMN IF NOT EXISTS'
+            script = re.sub(r'(?i)(ADD\s+COLUMN)\s+IF\s+NOT\s+EXISTS', r'\1', f.read())
+        for statement in split_sql_statements(script):
+            try:
+                conn.execute(statement)
+            except sqlite3.OperationalError as e:
+                if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                    continue
+                raise
+    conn.isolation_level = ""
+
+
+def seed(conn, customers=50, destinations_per_customer=4, devices_per_destination=60,
+         verifications_per_device=4, rng_seed=42):
+    """Popola il database con dati sintetici e restituisce il numero di righe inserite per tabella."""
+    rng = random.Random(rng_seed)
+    now = "2024-01-01T00:00:00+00:00"
+    counts = {'customers': 0, 'destinations': 0, 'devices': 0, 'verifications': 0}
+    start = date(2019, 1, 1)
+
+    for c in range(customers):
+        cur = conn.execute(
+            "INSERT INTO customers (uuid, name, address, last_modified, is_synced) VALUES (?, ?, ?, ?, 1)",
+            (str(uuid.uuid4()), f"CLIENTE {c:04d}", f"VIA ROMA {c}", now))
+        customer_id = cur.lastrowid
+        counts['customers'] += 1
+        for d in range(destinations_per_customer):
+            cur = conn.execute(
+                "INSERT INTO destinations (uuid, customer_id, name, address, last_modified, is_synced) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                (str(uuid.uuid4()), customer_id, f"SEDE {d:02d} CLIENTE {c:04d}", f"VIA MILANO {d}", now))
+            destination_id = cur.lastrowid
+            counts['destinations'] += 1
+
+            device_rows = []
+            for n in range(devices_per_destination):
+                device_rows.append((
+                    str(uuid.uuid4()), destination_id, f"SN{c:04d}{d:02d}{n:04d}", rng.choice(DESCRIPTIONS),
+                    rng.choice(MANUFACTURERS), f"MOD-{rng.randint(1, 40)}", rng.choice(DEPARTMENTS), "[]",
+                    f"INV{n:05d}", f"AMS{c:04d}{n:04d}", 12,
+                    (start + timedelta(days=rng.randint(0, 2500))).isoformat(), now))
+            conn.executemany(
+                "INSERT INTO devices (uuid, destination_id, serial_number, description, manufacturer, model, "
+                "department, applied_parts_json, customer_inventory, ams_inventory, verification_interval, "
+                "next_verification_date, last_modified, is_synced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)",
+                device_rows)
+            counts['devices'] += len(device_rows)
+
+        device_ids = [row[0] for row in conn.execute(
+            "SELECT d.id FROM devices d JOIN destinations de ON d.destination_id = de.id WHERE de.customer_id = ?",
+            (customer_id,))]
+        verification_rows = []
+        for device_id in device_ids:
+            for _ in range(rng.randint(0, verifications_per_device * 2)):
+                day = start + timedelta(days=rng.randint(0, 2000))
+                verification_rows.append(_verification_row(rng, device_id, day.isoformat(), now))
+        insert_verifications(conn, verification_rows)
+        counts['verifications'] += len(verification_rows)
+
+    conn.commit()
+    return counts
+
+
+def _verification_row(rng, device_id, verification_date, timestamp):
+    # Stessa struttura dei risultati registrati da TestRunnerWidget.record_result
+    earth = rng.uniform(0.01, 0.35)
+    leakage = rng.uniform(1, 400)
+    patient = rng.uniform(1, 60)
+    results = [{"name": "Resistenza conduttore di protezione", "value": f"{earth:.3f}",
+                "limit_value": 0.3, "unit": "Ohm", "passed": earth <= 0.3},
+               {"name": "Corrente di dispersione apparecchio", "value": f"{leakage:.1f}",
+                "limit_value": 500.0, "unit": "uA", "passed": True},
+               {"name": "Corrente di dispersione paziente - Elettrodo 1 - BF", "value": f"{patient:.1f}",
+                "limit_value": 50.0, "unit": "uA", "passed": patient <= 50}]
+    return (str(uuid.uuid4()), device_id, verification_date, rng.choice(PROFILES), json.dumps(results),
+            rng.choice(("PASSATO", "PASSATO", "PASSATO", "FALLITO")), "{}", "TECNICO", timestamp)
+
+
+def insert_verifications(conn, rows):
+    """Inserisce righe prodotte da _verification_row (usata anche dai benchmark)."""
+    conn.executemany(
+        "INSERT INTO verifications (uuid, device_id, verification_date, profile_name, results_json, "
+        "overall_status, visual_inspection_json, technician_name, last_modified, is_synced) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)", rows)
+
+
+def create_seeded_database(path, **kwargs):
+    """Crea (sovrascrivendo) un database di prova in 'path'."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    try:
+        create_schema(conn)
+        return seed(conn, **kwargs)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crea un database di prova con dati sintetici.")
+    parser.add_argument("path")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--destinations-per-customer", type=int, default=4)
+    parser.add_argument("--devices-per-destination", type=int, default=60)
+    parser.add_argument("--verifications-per-device", type=int, default=4)
+    args = parser.parse_args()
+    counts = create_seeded_database(
+        args.path, customers=args.customers, destinations_per_customer=args.destinations_per_customer,
+        devices_per_destination=args.devices_per_destination, verifications_per_device=args.verifications_per_device)
+    print(", ".join(f"{table}: {count}" for table, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()